@@ -0,0 +1,56 @@
+"""
+Measures BookCardStore lookups per second, on a store with randomly generated cards.
+
+Run it from the project's root:
+    python -m benchmarks.book_card_benchmark [number of cards]
+"""
+import os
+import random
+import secrets
+import sys
+import tempfile
+import time
+
+from models.query_models import ValidTopics
+from services.search.book_card_store import BookCardRecord, BookCardStore, BookCardWriter
+
+
+def build_store(path: str, amount: int) -> list[str]:
+    md5s = sorted(secrets.token_hex(16).upper() for _ in range(amount))
+    writer = BookCardWriter(path)
+    for md5 in md5s:
+        writer.add(BookCardRecord(md5=md5, topic=random.choice(list(ValidTopics)), title="The title of a book",
+                                  author="Some Author", extension="epub", language="English",
+                                  filesize=random.randint(1, 10 ** 8), coverurl=f"1234/{md5.lower()}.jpg"))
+    writer.save(0)
+    return md5s
+
+
+def measure(name: str, lookups: int, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40}{lookups / elapsed:>12,.0f} lookups/s")
+
+
+def main(amount: int):
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "book_cards.bin")
+        start = time.perf_counter()
+        md5s = build_store(path, amount)
+        print(f"Built {amount:,} cards in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(path) / 1024 / 1024:.1f} MiB).")
+
+        store = BookCardStore.load(path)
+        queries = random.choices(md5s, k=100000)
+        misses = [secrets.token_hex(16) for _ in range(100000)]
+        batches = [random.choices(md5s, k=100) for _ in range(1000)]
+
+        measure("get_record (hits)", len(queries), lambda: [store.get_record(md5) for md5 in queries])
+        measure("get_record (misses)", len(misses), lambda: [store.get_record(md5) for md5 in misses])
+        measure("get (as SearchEntry)", len(queries), lambda: [store.get(md5) for md5 in queries])
+        measure("get_many (batches of 100)", 100 * len(batches), lambda: [store.get_many(b) for b in batches])
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
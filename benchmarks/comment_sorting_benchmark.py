@@ -0,0 +1,75 @@
+"""
+Measures CommentSortingService, the Python fallback for when MongoDB can't sort a book's comments,
+on a large generated comment thread. The previous strptime based date key is measured for comparison.
+
+Run it from the project's root:
+    python -m benchmarks.comment_sorting_benchmark [number of comments]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from models.body_models import date_format
+from models.query_models import CommentsQuery, CommentSort, SortMode
+from services.social.comments_service import CommentSortingService
+
+
+def build_thread(amount: int, replies_per_comment: int = 5) -> list[dict]:
+    start = datetime(2022, 1, 1)
+
+    def entry(**extra) -> dict:
+        upvotes = [f"user{i}" for i in range(random.randint(0, 20))]
+        return {
+            "created_at": (start + timedelta(seconds=random.randint(0, 10 ** 8))).strftime(date_format),
+            "upvotes": upvotes,
+            "upvote_count": len(upvotes),
+            **extra,
+        }
+
+    return [entry(rating=random.choice([None, 1, 2, 3, 4, 5]),
+                  attached_responses=[entry() for _ in range(replies_per_comment)])
+            for _ in range(amount)]
+
+
+def strptime_key(item: dict):
+    # How dates used to be parsed: the fallback date was parsed again for every item.
+    temp_date = datetime.strptime("2000-01-01T00:00:00Z", date_format)
+    created_at = item["created_at"]
+    return temp_date if created_at is None else datetime.strptime(created_at, date_format)
+
+
+def measure(name: str, comments: list[dict], function):
+    runs = []
+    for _ in range(3):
+        thread = [dict(comment, attached_responses=list(comment["attached_responses"])) for comment in comments]
+        start = time.perf_counter()
+        function(thread)
+        runs.append(time.perf_counter() - start)
+    print(f"{name:<40}{min(runs) * 1000:>10.1f} ms")
+
+
+def main(amount: int):
+    comments = build_thread(amount)
+    sorting_service = CommentSortingService()
+    print(f"{amount:,} comments, {amount * 5:,} replies.")
+
+    def legacy_date_sort(thread: list[dict]):
+        thread.sort(key=strptime_key, reverse=True)
+        for comment in thread:
+            comment["attached_responses"].sort(key=strptime_key, reverse=True)
+
+    def fallback_sort(query: CommentsQuery):
+        def sort(thread: list[dict]):
+            sorting_service.sort_comments(thread, query)
+            sorting_service.sort_replies(thread, query)
+        return sort
+
+    measure("strptime date keys (previous)", comments, legacy_date_sort)
+    for sort in CommentSort:
+        query = CommentsQuery(sort=sort, mode=SortMode.desc)
+        measure(f"fallback, by {sort.value}", comments, fallback_sort(query))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
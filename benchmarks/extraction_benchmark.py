@@ -0,0 +1,70 @@
+"""
+Compares the previous scraping approach (requests_html + BeautifulSoup's html.parser) with the lxml based
+extractors in services/search/extraction_functions.py, using the saved libgen pages in tests/tests_search/fixtures.
+
+Run it from the project's root:
+    python -m benchmarks.extraction_benchmark
+"""
+import os
+import timeit
+
+from bs4 import BeautifulSoup
+from grab_fork_from_libgen.search_config import get_mirror_sources
+from requests_html import HTML
+
+from services.search.extraction_functions import extract_cover_page, extract_download_links, \
+    extract_librocks_cover
+
+fixtures_folder = os.path.join(os.path.dirname(__file__), "..", "tests", "tests_search", "fixtures")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixtures_folder, name), encoding="utf-8") as fo:
+        return fo.read()
+
+
+def legacy_cover_page(page: str):
+    # What TempCoverService.get_cover used to do: one parse to check the text, another to find the image.
+    html_text = HTML(html=page).find("html")[0].full_text
+    if html_text.find("No record with such MD5 hash has been found") != -1:
+        return None
+    img_select = BeautifulSoup(page, "html.parser").select_one("img")
+    return img_select["src"] if img_select is not None else None
+
+
+def legacy_download_links(page: str):
+    links = BeautifulSoup(page, "html.parser").find_all("a", string=get_mirror_sources())
+    return {link.string: link["href"] for link in links}
+
+
+def legacy_librocks_cover(page: str):
+    return BeautifulSoup(page, "html.parser").select("img:last-of-type")[1]["src"]
+
+
+def bench(label: str, func, page: str, number: int):
+    seconds = min(timeit.repeat(lambda: func(page), number=number, repeat=3))
+    per_call = seconds / number * 1000
+    print(f"{label:<45} {per_call:8.3f} ms/page")
+    return per_call
+
+
+def main(number: int = 200):
+    cases = [
+        ("libgen fiction page (cover)", "libgen_fiction_page.html", legacy_cover_page, extract_cover_page),
+        ("libgen sci-tech page (cover)", "libgen_scitech_page.html", legacy_cover_page, extract_cover_page),
+        ("libgen no record page (cover)", "libgen_no_record_page.html", legacy_cover_page, extract_cover_page),
+        ("library.lol page (download links)", "librarylol_page.html", legacy_download_links,
+         extract_download_links),
+        ("libgen.rocks page (cover)", "librocks_page.html", legacy_librocks_cover, extract_librocks_cover),
+    ]
+
+    for label, fixture, legacy, current in cases:
+        page = read_fixture(fixture)
+        print(label)
+        legacy_time = bench("  legacy (requests_html / BeautifulSoup)", legacy, page, number)
+        current_time = bench("  lxml extractor", current, page, number)
+        print(f"  speedup: {legacy_time / current_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
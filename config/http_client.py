@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable
+
+import httpx
+from grab_fork_from_libgen.search_config import get_request_headers
+
+from keys import http2_enabled, insecure_tls_hosts
+
+logger = logging.getLogger("biblioterra")
+
+
+class _HostSlotStream(httpx.AsyncByteStream):
+    """
+    A streamed response's body, which holds it's host slot until it's closed.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class HostLimitedAsyncClient(httpx.AsyncClient):
+    """
+    An AsyncClient that also limits how many requests can be made to a single host at the same time,
+    so a slow mirror can't take all the pool's connections.
+    Streamed responses keep their slot until they are closed, since their body is still being downloaded.
+    """
+
+    def __init__(self, *args, max_requests_per_host: int = 10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_requests_per_host = max_requests_per_host
+        self._host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_requests_per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def send(self, request: httpx.Request, *args, stream: bool = False, **kwargs) -> httpx.Response:
+        semaphore = self._host_semaphore(request.url.host)
+        await semaphore.acquire()
+        try:
+            response = await super().send(request, *args, stream=stream, **kwargs)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        if not stream:
+            # The body has already been read.
+            semaphore.release()
+            return response
+
+        response.stream = _HostSlotStream(response.stream, semaphore.release)
+        return response
+
+
+_http_client: HostLimitedAsyncClient | None = None
+
+
+def _is_http2_available():
+    try:
+        import h2
+        return True
+    except ImportError:
+        logger.warning("HTTP2_ENABLED is set, but the 'h2' package is not installed. Using HTTP/1.1.")
+        return False
+
+
+def _create_http_client() -> HostLimitedAsyncClient:
+    http2 = http2_enabled and _is_http2_available()
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+    # Only the configured hosts skip certificate checks, even when redirected to.
+    insecure_mounts = {f"all://{host}": httpx.AsyncHTTPTransport(verify=False, http2=http2, limits=limits)
+                       for host in insecure_tls_hosts}
+    return HostLimitedAsyncClient(
+        http2=http2,
+        headers=get_request_headers(),
+        follow_redirects=True,
+        timeout=httpx.Timeout(30, connect=10),
+        limits=limits,
+        mounts=insecure_mounts,
+    )
+
+
+def get_http_client() -> HostLimitedAsyncClient:
+    """
+    Returns the application wide http client. Reusing it keeps connections (and TLS sessions) alive
+    between requests to libgen, it's mirrors and gravatar.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _create_http_client()
+
+    return _http_client
+
+
+async def close_http_clients():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
@@ -28,3 +28,35 @@ def mongodb_comments_connect():
     database = client["biblioterra"]
     collection = database["comments"]
     return collection
+
+
+def mongodb_comment_entries_connect():
+    # One document per comment or reply.
+    client = AsyncIOMotorClient(mongodb_provider)
+    database = client["biblioterra"]
+    collection = database["comment_entries"]
+    return collection
+
+
+def mongodb_comment_stats_connect():
+    # One document per md5, keyed by it.
+    client = AsyncIOMotorClient(mongodb_provider)
+    database = client["biblioterra"]
+    collection = database["comment_stats"]
+    return collection
+
+
+def mongodb_library_connect():
+    # One document per book in a user's library, keyed by (username, md5).
+    client = AsyncIOMotorClient(mongodb_provider)
+    database = client["biblioterra"]
+    collection = database["library"]
+    return collection
+
+
+def mongodb_library_versions_connect():
+    # One document per user, with it's library's version and latest changes.
+    client = AsyncIOMotorClient(mongodb_provider)
+    database = client["biblioterra"]
+    collection = database["library_versions"]
+    return collection
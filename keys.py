@@ -14,6 +14,23 @@ mongodb_provider = environ.get("MONGODB_URL")
 jwt_secret = environ.get("JWT_SECRET")
 jwt_algorithm = environ.get("JWT_ALGORITHM")
 
+# Requires the "h2" package.
+http2_enabled = environ.get("HTTP2_ENABLED", "false").lower() == "true"
+# Comma separated hosts whose TLS certificates aren't verified, for mirrors with broken certificates.
+# Every other host is always verified.
+insecure_tls_hosts = [host.strip() for host in environ.get("INSECURE_TLS_HOSTS", "").split(",") if host.strip()]
+
+# Built by scripts/build_md5_filter.py. If it doesn't exist, md5s aren't checked before lookups.
+md5_filter_path = environ.get("MD5_FILTER_PATH", "data/md5_filter.bin")
+# Built by scripts/build_book_cards.py.
+book_cards_path = environ.get("BOOK_CARDS_PATH", "data/book_cards.bin")
+
+# Seconds between cache warmings of the most popular searches and books. Disabled if 0.
+cache_warmer_interval = int(environ.get("CACHE_WARMER_INTERVAL", "0"))
+
+# Bearer token required by /v1/metrics. The route is disabled if it isn't set.
+metrics_token = environ.get("METRICS_TOKEN")
+
 email_url = environ.get("EMAIL")
 email_pass = environ.get("EMAIL_PASS")
 
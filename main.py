@@ -1,8 +1,8 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from routers import upvotes_routes, library_routes, search_routes, user_routes, comments_routes, metadata_routes, \
-    profile_routes, download_routes
-from keys import preview_url
+    profile_routes, download_routes, metrics_routes, comment_stats_routes
+from keys import preview_url, cache_warmer_interval
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
@@ -10,6 +10,18 @@ from slowapi.errors import RateLimitExceeded
 import logging
 from logging.config import dictConfig
 from config.logger_config import LoggerConfig
+import asyncio
+from pymongo.errors import PyMongoError
+from config.http_client import close_http_clients
+from services.metrics.metrics_functions import flush_counters_periodically, flush_counters
+from services.search.md5_filter import md5_filter_holder, md5_filter_refresh_interval
+from services.search.book_card_store import book_cards_holder, book_cards_refresh_interval
+from services.cache.popularity_functions import flush_popularity_periodically, flush_popularity
+from services.cache.cache_warmer import warm_caches_periodically
+from services.social.comments_service import create_comment_indexes
+from services.social.comment_events import comment_event_hub
+from services.library.library_functions import create_library_indexes
+from services.library.progress_functions import flush_progress_periodically, flush_progress
 
 limiter = Limiter(key_func=get_remote_address, default_limits=["3/2 seconds"])
 
@@ -52,6 +64,10 @@ tags_metadata = [
                        "will make the docs bug out. Should be used in a frontend that wants to download a file, "
                        "but doesn't want to save it."
     },
+    {
+        "name": "metrics",
+        "description": "Internal counters, e.g. how often the caches are hit. Requires the METRICS_TOKEN."
+    },
     {
         "name": "user",
         "description": "Defines routes for authenticating the user. The tokens are then used by library endpoints."
@@ -91,7 +107,45 @@ app.include_router(library_routes.router)
 app.include_router(download_routes.router)
 app.include_router(profile_routes.router)
 app.include_router(comments_routes.router)
+app.include_router(comment_stats_routes.router)
 app.include_router(upvotes_routes.router)
+app.include_router(metrics_routes.router)
+
+
+async def create_indexes():
+    try:
+        await create_comment_indexes()
+        await create_library_indexes()
+    except PyMongoError as e:
+        logger.error(e)
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    background_jobs = [
+        # Ran in the background, so an unavailable MongoDB doesn't hold the startup.
+        create_indexes(),
+        flush_counters_periodically(),
+        flush_popularity_periodically(),
+        md5_filter_holder.refresh_periodically(md5_filter_refresh_interval),
+        book_cards_holder.refresh_periodically(book_cards_refresh_interval),
+        comment_event_hub.listen(),
+        flush_progress_periodically(),
+    ]
+    if cache_warmer_interval > 0:
+        background_jobs.append(warm_caches_periodically(cache_warmer_interval))
+
+    app.state.background_tasks = [asyncio.create_task(job) for job in background_jobs]
+
+
+@app.on_event("shutdown")
+async def close_shared_clients():
+    for task in app.state.background_tasks:
+        task.cancel()
+    await flush_counters()
+    await flush_popularity()
+    await flush_progress()
+    await close_http_clients()
 
 
 @app.get("/")
@@ -11,6 +11,14 @@ match_anywhere_md5_reg = "[0-9a-fA-F]{32}$"
 date_format = "%Y-%m-%dT%H:%M:%SZ"
 
 
+def normalize_md5(md5: str) -> str:
+    """
+    md5s are case-insensitive. Cache keys and popularity counters always use them uppercase,
+    so a book is cached once, whatever case clients send.
+    """
+    return md5.strip().upper()
+
+
 class CommentOrReply(str, Enum):
     comment = "comment"
     reply = "reply"
@@ -34,6 +42,15 @@ class SearchEntry(BaseModel):
     relevance: int | None = Field(None)  # Relevance of a entry based on the search.
 
 
+class CoverRequest(BaseModel):
+    topic: ValidTopics
+    md5: str = Field(..., regex=md5_reg)
+
+    class Config:
+        # Makes it hashable.
+        frozen = True
+
+
 class LibraryEntry(BaseModel):
     # Defines how a valid book entry in library should look like.
     authors: str = Field(..., alias="author(s)")
@@ -52,6 +69,38 @@ class LibraryEntry(BaseModel):
         allow_population_by_field_name = True
 
 
+class ProgressUpdateRequest(BaseModel):
+    # epubcifi of the user's position in the book.
+    progress: str = Field(..., max_length=1000)
+
+
+class LibraryAction(str, Enum):
+    add = "add"
+    move = "move"
+    remove = "remove"
+
+
+class LibraryOperation(BaseModel):
+    # One change in a /library/bulk request. "add" needs the book, "move" only needs it's md5 and the category.
+    action: LibraryAction
+    md5: str = Field(..., regex=md5_reg)
+    category: ValidCategories | None
+    book: LibraryEntry | None
+
+    @root_validator(skip_on_failure=True)
+    def check_action_fields(cls, values: dict):
+        action = values.get("action")
+        book: LibraryEntry | None = values.get("book")
+        if action == LibraryAction.add:
+            if book is None or book.md5 != values.get("md5"):
+                raise ValueError("Adding needs the book, with the same md5.")
+            if values.get("category") is None:
+                values["category"] = book.category
+        if action in (LibraryAction.add, LibraryAction.move) and values.get("category") is None:
+            raise ValueError("Adding or moving needs a category.")
+        return values
+
+
 class Metadata(BaseModel):
     md5: str = Field(..., alias="MD5")
     title: str = Field(..., alias="Title")
@@ -11,6 +11,18 @@ class CommentSort(str, Enum):
     rating = "rating"
 
 
+class CoverSize(str, Enum):
+    small = "small"
+    medium = "medium"
+    large = "large"
+    original = "original"
+
+
+class CoverFormat(str, Enum):
+    webp = "webp"
+    jpeg = "jpeg"
+
+
 class ValidCriteria(str, Enum):
     any = "Any"
     title = "Title"
@@ -77,6 +89,15 @@ class ValidRes(str, Enum):
 class CommentsQuery(BaseModel):
     sort: CommentSort | None = Query(None)
     mode: SortMode | None = Query(None)
+    # Returned as "next_cursor" by the previous page.
+    cursor: str | None = Query(None)
+    limit: int = Query(20, ge=1, le=100)
+
+
+class LibraryPageQuery(BaseModel):
+    # Returned as "next_cursor" by the previous page.
+    cursor: str | None = Query(None)
+    limit: int = Query(50, ge=1, le=200)
 
 
 class LegacyFictionSearchQuery(BaseModel):
@@ -11,6 +11,14 @@ class UserProfile(BaseModel):
     private_profile: bool = Field(default=False)
 
 
+class CoverResult(BaseModel):
+    topic: str
+    md5: str
+    cover_url: str | None
+    # Where the cover was found: "database", "cache" or "scraping". None if no cover was found.
+    source: str | None
+
+
 class SearchPaginationInfo(BaseModel):
     current_page: int
     has_next_page: bool
@@ -59,11 +67,35 @@ class BookGetResponse(BaseModel):
     result: LibraryEntry
 
 
+class LibrarySyncResponse(BaseModel):
+    version: int
+    full: bool
+    # Only when "full" is true.
+    library: UserLibraryResponse | None
+    changed: list | None
+    removed: list[str] | None
+
+
+class LibraryPageResponse(BaseModel):
+    results: list[LibraryEntry]
+    next_cursor: str | None
+
+
 class DownloadLinksResponse(BaseModel):
-    # If get is None it means something has gone wrong with the request.
-    get: str = Field(..., alias="GET")
+    # GET needs a key that's only available by scraping library.lol, so it's None when the links were built locally.
+    get: str | None = Field(None, alias="GET")
     Cloudflare: str | None
     ipfsio: str | None = Field(None, alias="IPFS.io")
     c4rex: str | None = Field(None, alias="c4rex.co")
     Crust: str | None
     Pinata: str | None
+
+
+class CommentStats(BaseModel):
+    md5: str
+    comment_count: int = 0
+    reply_count: int = 0
+    rating_count: int = 0
+    average_rating: float | None = None
+    # Date of the last comment, reply or edit, in the same format as the comments' dates.
+    last_activity: str | None = None
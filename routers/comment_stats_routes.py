@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Body
+
+from models.body_models import md5_reg
+from models.response_models import CommentStats
+from services.social.comment_stats_functions import get_comment_stats
+
+router = APIRouter(
+    prefix="/v1"
+)
+
+
+@router.post("/stats/comments", tags=["comments"], response_model=list[CommentStats])
+async def get_books_comment_stats(md5s: list[str] = Body(..., max_items=100, regex=md5_reg)):
+    """
+    Returns the comment count, reply count and average rating of up to 100 books at once, in the given order. <br>
+    Books without comments have zeroed stats.
+    """
+    return await get_comment_stats(md5s)
@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, Response, HTTPException
+from fastapi import APIRouter, Depends, Response, HTTPException, Path, Request
+from fastapi.responses import StreamingResponse
 
 from models.body_models import Comment, Reply, CommentUpdateRequest, \
-    ReplyUpdateRequest
+    ReplyUpdateRequest, md5_reg
 from models.query_models import CommentsQuery
 from routers.user_routes import oauth2_scheme
 from services.security.hashing_functions import jwt_decode
+from services.social.comment_events import comment_event_hub
 from services.social.comments_service import CommentsService
+from services.search.md5_filter import reject_unknown_md5
 
-router = APIRouter(prefix="/v1")
+# Every route here is keyed by a md5.
+router = APIRouter(prefix="/v1", dependencies=[Depends(reject_unknown_md5)])
 
 
 def validate_username(payload: dict, username: str):
@@ -18,8 +22,28 @@ def validate_username(payload: dict, username: str):
 
 @router.get("/comments/{md5}", tags=["comments"])
 async def get_comments(query: CommentsQuery = Depends(), handler: CommentsService = Depends()):
-    comments = await handler.get_sorted_comments(query)
-    return {"results": comments}
+    """
+    Returns a page of the book's comments, each with it's replies. <br>
+    To get the next page, send the "next_cursor" value as the "cursor" query parameter.
+    "next_cursor" is null on the last page.
+    """
+    comments, next_cursor = await handler.get_comments_page(query)
+    return {"results": comments, "next_cursor": next_cursor}
+
+
+@router.get("/comments/{md5}/events", tags=["comments"])
+async def get_comment_events(request: Request, md5: str = Path(..., regex=md5_reg)):
+    """
+    Server-Sent Events stream of the book's comment changes, instead of polling the comments. <br>
+    Events: comment_added, comment_updated, comment_removed, reply_added, reply_updated, reply_removed,
+    upvote_added and upvote_removed. Their data is a JSON object with the entry's "id" and "parent_id".
+    Added entries come whole, in "entry". <br>
+    A "resync" event means some events were missed, and the comments should be fetched again.
+    """
+    comment_event_hub.raise_if_full()
+    return StreamingResponse(comment_event_hub.stream(md5, request.is_disconnected),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.post("/comments/{md5}", tags=["comments"])
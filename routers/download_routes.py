@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Request, Query, BackgroundTasks
-from fastapi.responses import FileResponse
-from services.search.download_functions import make_temp_download, remove_temp_download
-from models.body_models import md5_reg
+from fastapi import APIRouter, Request, Query, BackgroundTasks, Depends
+from services.search.download_functions import make_temp_download, remove_expired_downloads
+from services.search.range_functions import make_range_response
+from services.search.md5_filter import reject_unknown_md5
+from models.body_models import md5_reg, normalize_md5
 from models.query_models import ValidTopics
 
 router = APIRouter(prefix="/v1")
 
 
-@router.get("/temp-download/{topic}/{md5}", tags=["temp"])
+@router.get("/temp-download/{topic}/{md5}", tags=["temp"], dependencies=[Depends(reject_unknown_md5)])
 async def temp_download_book(bg: BackgroundTasks, request: Request, topic: ValidTopics,
                              md5: str = Query(..., regex=md5_reg)):
+    """
+    Downloads a book from the fastest mirror and sends it to the user. <br>
+    Supports Range and If-Range headers, so interrupted downloads can be resumed.
+    Downloaded files are kept for an hour, and the book's md5 is used as it's ETag.
+    """
 
     downloaded_file = await make_temp_download(md5, topic)
-    bg.add_task(remove_temp_download, downloaded_file)
-    return FileResponse(downloaded_file, media_type="application/epub+zip")
+    bg.add_task(remove_expired_downloads)
+    return make_range_response(request, downloaded_file, etag=f'"{normalize_md5(md5)}"',
+                               media_type="application/epub+zip")
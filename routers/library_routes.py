@@ -1,26 +1,71 @@
-from fastapi import APIRouter, Depends, Body
+from fastapi import APIRouter, Depends, Body, Path, Request, Response
 from fastapi.params import Query
 
-from models.body_models import LibraryEntry, ValidCategories, md5_reg
-from models.response_models import UserLibraryResponse, BookGetResponse
+from models.body_models import LibraryEntry, ValidCategories, LibraryOperation, ProgressUpdateRequest, md5_reg
+from models.query_models import LibraryPageQuery
+from models.response_models import UserLibraryResponse, BookGetResponse, LibraryPageResponse, LibrarySyncResponse
 from services.security.hashing_functions import jwt_decode
-from services.library.library_functions import add_books, remove_books, get_all_books, get_book
+from services.library.library_functions import add_books, remove_books, get_all_books, get_book, \
+    get_category_page, apply_operations, get_library_etag, sync_library
+from services.library.progress_functions import save_progress
+from services.search.range_functions import is_not_modified
 from routers.user_routes import oauth2_scheme
 
 router = APIRouter(prefix="/v1")
 
 
 @router.get("/library/get", tags=["library"], response_model=UserLibraryResponse)
-async def library_get(token: str = Depends(oauth2_scheme)):
+async def library_get(request: Request, response: Response, token: str = Depends(oauth2_scheme)):
     """
-    Returns the populated library of a valid user. Needs to be logged in.
+    Returns the populated library of a valid user. Needs to be logged in. <br>
+    Send the "ETag" header's value as "If-None-Match" to get a 304, without the library, if it hasn't changed.
     """
     payload = jwt_decode(token)
     sub = payload.get("sub")
+    # Read before the library, so a change made in between can't be hidden behind an older ETag.
+    etag = await get_library_etag(sub)
+    if etag is not None:
+        if is_not_modified(request.headers.get("If-None-Match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+
     library = await get_all_books(sub)
     return library
 
 
+@router.get("/library/sync", tags=["library"], response_model=LibrarySyncResponse, response_model_exclude_none=True)
+async def library_sync(since: int = Query(0, ge=0), token: str = Depends(oauth2_scheme)):
+    """
+    Returns what changed in the user's library after the "since" version, which is the "version" returned by the
+    previous sync. Returns a 304 if nothing changed. <br>
+    "changed" has the books that were added, moved or updated, and "removed" the md5s of the removed ones.
+    Books with recently updated reading progress are sent in "changed" on every sync, until it's saved.
+    If "full" is true, the changes aren't available that far back, and "library" has the whole library instead.
+    The first sync (since=0) is always full.
+    """
+    payload = jwt_decode(token)
+    sub = payload.get("sub")
+    changes = await sync_library(sub, since)
+    if changes is None:
+        return Response(status_code=304)
+    return changes
+
+
+@router.get("/library/category/{category}", tags=["library"], response_model=LibraryPageResponse)
+async def library_category_get(category: ValidCategories, query: LibraryPageQuery = Depends(),
+                               token: str = Depends(oauth2_scheme)):
+    """
+    Returns a page of a category's books, from the most recently added or updated. <br>
+    To get the next page, send the "next_cursor" value as the "cursor" query parameter.
+    "next_cursor" is null on the last page.
+    """
+    payload = jwt_decode(token)
+    sub = payload.get("sub")
+    books, next_cursor = await get_category_page(sub, category, query.cursor, query.limit)
+    return {"results": books, "next_cursor": next_cursor}
+
+
 @router.get("/library/get/{md5}", tags=["library"], response_model=BookGetResponse)
 async def library_book_get(token: str = Depends(oauth2_scheme), md5: str = Query(..., regex=md5_reg)):
     """Use this endpoint to retrieve a single book from a user's library."""
@@ -66,3 +111,29 @@ async def library_remove(token: str = Depends(oauth2_scheme), md5_list: list[str
     sub = payload.get("sub")
     await remove_books(sub, md5_list)
     return 200
+
+
+@router.post("/library/bulk", tags=["library"])
+async def library_bulk(operations: list[LibraryOperation], token: str = Depends(oauth2_scheme)):
+    """
+    Use this endpoint to add, move and remove many books at once, e.g. when importing a library. <br>
+    Each operation has an "action" ("add", "move" or "remove") and a "md5". "add" also needs the "book", and
+    "add" and "move" need a "category". <br>
+    Operations are applied in order, up to 500 per request. If one fails, the ones after it aren't applied.
+    """
+    payload = jwt_decode(token)
+    sub = payload.get("sub")
+    return await apply_operations(sub, operations)
+
+
+@router.put("/library/progress/{md5}", tags=["library"], status_code=202)
+async def library_progress_update(update_request: ProgressUpdateRequest, token: str = Depends(oauth2_scheme),
+                                  md5: str = Path(..., regex=md5_reg)):
+    """
+    Use this endpoint to save the user's reading progress (epubcifi) in a book of their library. <br>
+    Meant to be called often, e.g. on every page turn: updates are buffered and saved to the library a few seconds
+    later, but they are returned by the library endpoints right away.
+    """
+    payload = jwt_decode(token)
+    sub = payload.get("sub")
+    await save_progress(sub, md5, update_request.progress)
@@ -1,21 +1,29 @@
-from fastapi import APIRouter, Response, Request, Depends
+from fastapi import APIRouter, Response, Request, Depends, Body, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
 from starlette.background import BackgroundTasks
 
-from models.body_models import Metadata
+from models.body_models import Metadata, CoverRequest
 from models.path_models import ValidIndexesTopic
 from models.response_models import LegacyMetadataResponse
 from models.query_models import ValidTopics
 from services.temp_cover.cover_service import TempCoverService
+from services.temp_cover.cover_image_service import CoverImageService
+from services.temp_cover.batch_cover_service import BatchCoverService
 from services.metadata.metadata_service import MetadataService
 from services.search.metadata_functions import get_cover, get_metadata, get_dlinks
+from services.search.mirror_scoreboard import MirrorScoreboard
 from services.search.search_index_functions import get_search_index
+from services.search.md5_filter import reject_unknown_md5
+from services.search.range_functions import is_not_modified
+from services.search.book_card_store import book_cards_holder
+from services.cache.popularity_functions import record_book_access
 
 router = APIRouter(
     prefix="/v1"
 )
 
 
-@router.get("/cover/{md5}", tags=["metadata"])
+@router.get("/cover/{md5}", tags=["metadata"], dependencies=[Depends(reject_unknown_md5)])
 async def get_cover_by_md5(md5: str, response: Response):
     """
     Gets a temp_cover link using the file's md5.  <br>
@@ -30,19 +38,56 @@ async def get_cover_by_md5(md5: str, response: Response):
     return results
 
 
-@router.get("/cover/{topic}/{md5}", tags=["metadata"])
-async def new_get_cover(bg_tasks: BackgroundTasks, handler: TempCoverService = Depends(), ):
-    cached_cover = await handler.retrieve_from_cache()
-    if cached_cover:
-        return cached_cover
+@router.get("/cover/{topic}/{md5}", tags=["metadata"], dependencies=[Depends(reject_unknown_md5)])
+async def new_get_cover(response: Response, bg_tasks: BackgroundTasks, handler: TempCoverService = Depends()):
+    """
+    Returns the book's cover url. <br>
+    The "Cover-Source" header tells where it was found: local, cache, book_cards, database or scraping.
+    """
+    record_book_access(handler.md5, handler.topic)
+    cover_url, source = await handler.resolve_cover()
+    if source not in ("local", "cache"):
+        bg_tasks.add_task(handler.save_on_cache, cover_url)
+
+    response.headers["Cover-Source"] = source
+    return cover_url
+
+
+@router.post("/cover/batch", tags=["metadata"])
+async def get_covers_batch(cover_requests: list[CoverRequest] = Body(...), stream: bool = False):
+    """
+    Resolves the covers of up to 100 books in a single request. <br>
+    Send a list of {"topic", "md5"} objects. Covers that can't be found have a null cover_url. <br>
+    If "stream" is true, results are sent as newline delimited JSON as soon as each one is resolved.
+    """
+    handler = BatchCoverService(cover_requests)
+    if stream:
+        return StreamingResponse(handler.stream_covers(), media_type="application/x-ndjson")
+
+    results = await handler.get_all_covers()
+    return {"results": results}
 
-    result = await handler.get_cover()
-    if result:
-        bg_tasks.add_task(handler.save_on_cache, result)
-        return result
 
+@router.get("/cover/{topic}/{md5}/image", tags=["metadata"], dependencies=[Depends(reject_unknown_md5)])
+async def get_cover_image(request: Request, handler: CoverImageService = Depends()):
+    """
+    Returns the book's cover image, proxied and resized by Biblioterra. <br>
+    Use the "size" (small, medium, large or original) and "format" (webp or jpeg) query parameters
+    to choose a thumbnail. <br>
+    Images never change for a given ETag, so they can be cached by clients for a year.
+    """
+    cover_hash = await handler.get_cover_hash()
+    etag = handler.etag(cover_hash)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if is_not_modified(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
 
-@router.get("/metadata/{topic}/{md5}", tags=["metadata"], response_model=LegacyMetadataResponse)
+    cover_image = await handler.get_cover_image(cover_hash)
+    return FileResponse(cover_image, media_type=handler.media_type, headers=headers)
+
+
+@router.get("/metadata/{topic}/{md5}", tags=["metadata"], dependencies=[Depends(reject_unknown_md5)],
+            response_model=LegacyMetadataResponse)
 async def get_metadata_by_md5_and_topic(topic: ValidTopics, md5: str, request: Request, response: Response):
     """
     Given a valid topic and a md5, searches for a file's metadata. <br>
@@ -57,23 +102,50 @@ async def get_metadata_by_md5_and_topic(topic: ValidTopics, md5: str, request: R
     return metadata_results
 
 
-@router.get("/neometadata/{topic}/{md5}", tags=["metadata"], response_model=dict)
+@router.get("/neometadata/{topic}/{md5}", tags=["metadata"], dependencies=[Depends(reject_unknown_md5)],
+            response_model=dict)
 async def new_metadata(handler: MetadataService = Depends()):
     """
     Given a valid topic and a md5, searches for a file's metadata. <br>
     """
+    record_book_access(handler.md5, handler.topic)
     result = await handler.retrieve_metadata()
     return result.dict()
 
 
-@router.get("/downloads/{topic}/{md5}", tags=["metadata"], response_model=dict)
+@router.get("/downloads/{topic}/{md5}", tags=["metadata"], dependencies=[Depends(reject_unknown_md5)],
+            response_model=dict)
 async def get_download_links(topic: ValidTopics, md5: str, request: Request, response: Response):
+    """
+    Returns the download links for the given md5 and topic. <br>
+    Links are ordered from the fastest to the slowest mirror, based on recent downloads.
+    The "Mirror-Ranking" header lists the mirrors' names in this same order. <br>
+    "GET" is null when the IPFS links were built from our database. Temp downloads still fall back to it.
+    """
+    record_book_access(md5, topic)
     dlinks_handler = await get_dlinks(md5, topic)
-    download_links = dlinks_handler[0]
+    download_links = await MirrorScoreboard().rank_links(dlinks_handler[0])
     response.headers["Cached"] = dlinks_handler[1]
+    response.headers["Mirror-Ranking"] = ",".join(name for name, link in download_links.items() if link)
     return download_links
 
 
+@router.post("/cards", tags=["metadata"])
+async def get_book_cards(md5s: list[str] = Body(..., max_items=100)):
+    """
+    Returns the search card (title, authors, extension, size, cover...) of up to 100 books at once. <br>
+    Cards are read from a local store, without any database or Libgen request.
+    md5s that aren't found are listed in "missing".
+    """
+    book_cards = book_cards_holder.current
+    if book_cards is None:
+        raise HTTPException(503, "Book cards are not available right now.")
+
+    cards = book_cards.get_many(md5s)
+    missing = [md5 for md5 in md5s if md5 not in cards]
+    return {"results": list(cards.values()), "missing": missing}
+
+
 @router.get("/indexes/{topic}", tags=["metadata"])
 async def get_search_indexes(topic: ValidIndexesTopic):
     """
@@ -0,0 +1,33 @@
+import secrets
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from keys import metrics_token
+from services.metrics.metrics_functions import get_counters
+
+router = APIRouter(
+    prefix="/v1"
+)
+
+metrics_scheme = HTTPBearer(auto_error=False)
+
+
+async def verify_metrics_token(credentials: HTTPAuthorizationCredentials | None = Depends(metrics_scheme)):
+    """
+    Dependency for internal routes. They are only served to requests with the METRICS_TOKEN bearer token.
+    """
+    if metrics_token is None:
+        raise HTTPException(404, "Not Found")
+    if credentials is None or not secrets.compare_digest(credentials.credentials, metrics_token):
+        raise HTTPException(401, "Invalid metrics token.", headers={"WWW-Authenticate": "Bearer"})
+
+
+@router.get("/metrics", tags=["metrics"], response_model=dict, dependencies=[Depends(verify_metrics_token)])
+async def get_metrics():
+    """
+    Returns Biblioterra's internal counters, like negative cache hits and misses, summed across all workers. <br>
+    Send the METRICS_TOKEN as a bearer token. Returns a 404 if METRICS_TOKEN isn't set.
+    """
+    counters = await get_counters()
+    return {"counters": counters}
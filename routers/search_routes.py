@@ -6,6 +6,7 @@ from services.search.search_index_functions import save_search_index
 from models.query_models import LegacyFictionSearchQuery, LegacyScitechSearchQuery, ValidTopics, SearchQuery
 from models.response_models import SearchResponse
 from services.search.search_service import SearchService
+from services.cache.popularity_functions import record_search
 
 router = APIRouter(
 )
@@ -48,6 +49,7 @@ async def scitech_search(response: Response, bg_tasks: BackgroundTasks,
 # Should be migrated to v2
 @router.get("/v2/neosearch/{topic}", tags=["search"], response_model=SearchResponse)
 async def new_search(response: Response, bg_tasks: BackgroundTasks, handler: SearchService = Depends()):
+    record_search(handler.query, handler.topic)
     possible_cache = await handler.retrieve_from_cache()
     if possible_cache:
         return possible_cache
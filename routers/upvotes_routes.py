@@ -4,8 +4,10 @@ from models.body_models import CommentUpvoteRequest, ReplyUpvoteRequest
 from routers.user_routes import oauth2_scheme
 from services.security.hashing_functions import jwt_decode
 from services.social.upvotes_service import UpvotesService
+from services.search.md5_filter import reject_unknown_md5
 
-router = APIRouter(prefix="/v1")
+# Every route here is keyed by a md5.
+router = APIRouter(prefix="/v1", dependencies=[Depends(reject_unknown_md5)])
 
 
 @router.post("/upvotes/{md5}", tags=["upvotes"])
@@ -0,0 +1,111 @@
+"""
+Builds the book cards store used by services/search/book_card_store.py from the libgen database.
+By default, only books modified since the last build are read, and merged into the existing store.
+Workers pick up the new file on their next refresh, there's no need to restart them.
+
+Run it from the project's root:
+    python -m scripts.build_book_cards [--output data/book_cards.bin] [--full]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import AsyncIterator
+
+from aiomysql import SSDictCursor
+
+from config.mysql_connection import mysql_connect
+from keys import book_cards_path
+from models.query_models import ValidTopics
+from services.search.book_card_store import BookCardRecord, BookCardStore, BookCardWriter, merge_records
+
+tables = ((ValidTopics.fiction, "fiction"), (ValidTopics.scitech, "updated"))
+
+
+def _as_record(topic: ValidTopics, row: dict) -> BookCardRecord:
+    return BookCardRecord(
+        md5=row["MD5"].upper(),
+        topic=topic,
+        title=row["Title"],
+        author=row["Author"],
+        extension=row["Extension"],
+        language=row["Language"] or None,
+        filesize=int(row["Filesize"] or 0),
+        coverurl=row["Coverurl"] or None,
+    )
+
+
+def _as_timestamp(time_last_modified) -> int:
+    if isinstance(time_last_modified, datetime):
+        return int(time_last_modified.timestamp())
+    return 0
+
+
+async def stream_table(topic: ValidTopics, table: str, modified_since: int | None,
+                       state: dict) -> AsyncIterator[BookCardRecord]:
+    sql = f"""SELECT MD5, Title, Author, Extension, Language, Filesize, Coverurl, TimeLastModified FROM {table}
+    WHERE MD5 != '' AND Title != '' AND Author != ''"""
+    args = []
+    if modified_since is not None:
+        sql += " AND TimeLastModified > FROM_UNIXTIME(%s)"
+        args.append(modified_since)
+    sql += " ORDER BY MD5"
+
+    connection = await mysql_connect()
+    try:
+        # Server side cursor, so rows are streamed instead of loaded at once.
+        async with connection.cursor(SSDictCursor) as cursor:
+            await cursor.execute(sql, args=args)
+            while rows := await cursor.fetchmany(10000):
+                for row in rows:
+                    state["last_modified"] = max(state["last_modified"], _as_timestamp(row["TimeLastModified"]))
+                    yield _as_record(topic, row)
+    finally:
+        connection.close()
+
+
+async def merge_tables(modified_since: int | None, state: dict) -> AsyncIterator[BookCardRecord]:
+    """
+    Merges both tables' md5 ordered streams into one.
+    """
+    streams = [stream_table(topic, table, modified_since, state) for topic, table in tables]
+    heads = [await anext(stream, None) for stream in streams]
+    while any(head is not None for head in heads):
+        index = min((i for i, head in enumerate(heads) if head is not None), key=lambda i: heads[i].md5)
+        yield heads[index]
+        heads[index] = await anext(streams[index], None)
+
+
+def load_previous_store(output: str) -> BookCardStore | None:
+    try:
+        return BookCardStore.load(output)
+    except (OSError, ValueError):
+        return None
+
+
+async def build(output: str, full: bool):
+    start = time.perf_counter()
+    previous_store = None if full else load_previous_store(output)
+    state = {"last_modified": previous_store.last_modified if previous_store else 0}
+    writer = BookCardWriter(output)
+
+    if previous_store is None:
+        async for record in merge_tables(None, state):
+            writer.add(record)
+    else:
+        # Changes are few, so they can be kept in memory and merged with the previous store.
+        changed = [record async for record in merge_tables(previous_store.last_modified, state)]
+        for record in merge_records(previous_store.iter_records(), changed):
+            writer.add(record)
+        print(f"Merged {len(changed)} modified books.")
+
+    writer.save(state["last_modified"])
+    print(f"Saved {len(writer)} book cards to {output} in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the book cards store from the libgen database.")
+    parser.add_argument("--output", default=book_cards_path)
+    parser.add_argument("--full", action="store_true", help="Rebuilds the store from scratch.")
+    args = parser.parse_args()
+    asyncio.run(build(args.output, args.full))
@@ -0,0 +1,62 @@
+"""
+Builds the md5 filter used by services/search/md5_filter.py from the libgen database.
+Workers pick up the new file on their next refresh, there's no need to restart them.
+
+Run it from the project's root:
+    python -m scripts.build_md5_filter [--output data/md5_filter.bin] [--false-positive-rate 0.001]
+"""
+import argparse
+import asyncio
+import time
+
+from aiomysql import SSCursor
+
+from config.mysql_connection import mysql_connect
+from keys import md5_filter_path
+from services.search.md5_filter import MD5Filter
+
+tables = ("fiction", "updated")
+# New books may be added before the next build, this leaves room for them without raising the false positive rate.
+growth_margin = 1.1
+
+
+async def count_md5s(connection) -> int:
+    total = 0
+    async with connection.cursor() as cursor:
+        for table in tables:
+            await cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE MD5 != ''")
+            total += (await cursor.fetchone())[0]
+    return total
+
+
+async def add_md5s(connection, md5_filter: MD5Filter, batch_size: int = 10000):
+    for table in tables:
+        # Server side cursor, so the tables' md5s are streamed instead of loaded at once.
+        async with connection.cursor(SSCursor) as cursor:
+            await cursor.execute(f"SELECT MD5 FROM {table} WHERE MD5 != ''")
+            while rows := await cursor.fetchmany(batch_size):
+                for row in rows:
+                    md5_filter.add(row[0])
+
+
+async def build(output: str, false_positive_rate: float):
+    start = time.perf_counter()
+    connection = await mysql_connect()
+    try:
+        expected_items = round(await count_md5s(connection) * growth_margin)
+        md5_filter = MD5Filter.empty(expected_items, false_positive_rate)
+        await add_md5s(connection, md5_filter)
+    finally:
+        connection.close()
+
+    md5_filter.save(output)
+    print(f"Saved {md5_filter.num_items} md5s to {output} ({len(md5_filter.bits) / 1024 / 1024:.1f} MiB, "
+          f"{md5_filter.num_hashes} hashes) in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the md5 filter from the libgen database.")
+    parser.add_argument("--output", default=md5_filter_path)
+    parser.add_argument("--false-positive-rate", type=float, default=0.001)
+    args = parser.parse_args()
+    asyncio.run(build(args.output, args.false_positive_rate))
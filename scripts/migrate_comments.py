@@ -0,0 +1,113 @@
+"""
+Copies comments from the old layout (one "comments" document per md5, with every comment and reply embedded)
+to the "comment_entries" collection, where each comment and reply is it's own document.
+It can be run more than once, entries that were already copied are just replaced.
+
+Run it from the project's root:
+    python -m scripts.migrate_comments
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReplaceOne
+
+from config.mongodb_connection import mongodb_comments_connect, mongodb_comment_entries_connect
+from models.body_models import date_format
+from services.social.comment_stats_functions import rebuild_comment_stats
+from services.social.comments_service import create_comment_indexes, entry_fingerprint
+
+# Entries without a valid date appear last when sorted by date, as they did before.
+fallback_date = datetime(2000, 1, 1)
+
+
+def parse_date(date: str | None) -> datetime:
+    try:
+        return datetime.strptime(date, date_format)
+    except (ValueError, TypeError):
+        return fallback_date
+
+
+def as_object_id(entry_id, md5: str, position: list[int], created_at: str | None) -> ObjectId:
+    """
+    Entries without a valid id get one derived from where they are in the old layout, so running the
+    migration again replaces them instead of copying them a second time.
+    """
+    # ObjectId(None) would be a new, random, id.
+    if entry_id is not None:
+        try:
+            return ObjectId(entry_id)
+        except (InvalidId, TypeError):
+            pass
+
+    entry_key = json.dumps([md5, position, created_at])
+    return ObjectId(hashlib.sha256(entry_key.encode()).digest()[:12])
+
+
+def entry_as_document(md5: str, entry: dict, parent_id: str | None, position: list[int]) -> dict:
+    created_at = parse_date(entry.get("created_at"))
+    upvotes = entry.get("upvotes") or []
+    document = {
+        "_id": as_object_id(entry.get("id"), md5, position, entry.get("created_at")),
+        "md5": md5,
+        "parent_id": parent_id,
+        "username": entry.get("username"),
+        "content": entry.get("content"),
+        "upvotes": upvotes,
+        "upvote_count": len(upvotes),
+        "created_at": created_at,
+        "modified_at": parse_date(entry.get("modified_at")) if entry.get("modified_at") else created_at,
+    }
+    if parent_id is None:
+        document["rating"] = entry.get("rating")
+    document["fingerprint"] = entry_fingerprint(document["username"], document["content"], document.get("rating"),
+                                                parent_id)
+
+    return document
+
+
+def book_as_documents(book: dict) -> list[dict]:
+    documents = []
+    fingerprints = set()
+    for comment_index, comment in enumerate(book.get("comments") or []):
+        comment_document = entry_as_document(book["md5"], comment, None, [comment_index])
+        documents.append(comment_document)
+        for reply_index, reply in enumerate(comment.get("attached_responses") or []):
+            documents.append(entry_as_document(book["md5"], reply, str(comment_document["_id"]),
+                                               [comment_index, reply_index]))
+
+    for document in documents:
+        # Duplicates posted before the fingerprints existed are kept, but only the first one is fingerprinted,
+        # so the unique index can be built.
+        if document["fingerprint"] in fingerprints:
+            del document["fingerprint"]
+        else:
+            fingerprints.add(document["fingerprint"])
+
+    return documents
+
+
+async def migrate():
+    old_collection = mongodb_comments_connect()
+    new_collection = mongodb_comment_entries_connect()
+    await create_comment_indexes()
+
+    books = 0
+    entries = 0
+    async for book in old_collection.find({"md5": {"$exists": True}}):
+        documents = book_as_documents(book)
+        if documents:
+            await new_collection.bulk_write([ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+                                             for document in documents], ordered=False)
+        books += 1
+        entries += len(documents)
+
+    print(f"Migrated {entries} comments and replies from {books} books.")
+    await rebuild_comment_stats()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
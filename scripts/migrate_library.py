@@ -0,0 +1,68 @@
+"""
+Copies every user's library from the old layout ("reading", "to-read" and "backlog" arrays inside the user document)
+to the "library" collection, where each book is it's own document.
+Books that were already copied are left untouched, so it can be run more than once. The arrays are kept,
+in case the migration has to be undone.
+Copied books are logged as library changes, so clients get them on their next sync.
+
+Run it from the project's root:
+    python -m scripts.migrate_library
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from config.mongodb_connection import mongodb_connect, mongodb_library_connect
+from models.body_models import ValidCategories
+from services.library.library_functions import create_library_indexes
+from services.library.library_sync_functions import record_library_changes
+
+
+def user_as_documents(user: dict, migrated_at: datetime) -> list[dict]:
+    # BSON dates only keep milliseconds, so books are a millisecond apart.
+    migrated_at = migrated_at.replace(microsecond=migrated_at.microsecond // 1000 * 1000)
+    documents = []
+    md5s = set()
+    for category in ValidCategories:
+        for book in user.get(category.value) or []:
+            # A book in more than one category is only kept in the first.
+            if not isinstance(book, dict) or not book.get("md5") or book["md5"] in md5s:
+                continue
+            md5s.add(book["md5"])
+            # Keeps each category's order, which is the order books are listed in.
+            updated_at = migrated_at + timedelta(milliseconds=len(documents))
+            documents.append({**book, "category": category.value, "username": user["username"],
+                              "created_at": updated_at, "updated_at": updated_at})
+
+    return documents
+
+
+async def migrate():
+    users_collection = mongodb_connect()
+    library_collection = mongodb_library_connect()
+    await create_library_indexes()
+
+    users = 0
+    books = 0
+    migrated_at = datetime.utcnow()
+    categories_filter = [{category.value: {"$exists": True, "$ne": []}} for category in ValidCategories]
+    projection = {"username": 1, **{category.value: 1 for category in ValidCategories}}
+    async for user in users_collection.find({"$or": categories_filter}, projection):
+        documents = user_as_documents(user, migrated_at)
+        if documents:
+            result = await library_collection.bulk_write(
+                [UpdateOne({"username": document["username"], "md5": document["md5"]},
+                           {"$setOnInsert": document}, upsert=True) for document in documents],
+                ordered=True)
+            # Also bumps the library's version, so it's ETag changes.
+            await record_library_changes(user["username"],
+                                         [(documents[index]["md5"], False) for index in sorted(result.upserted_ids)])
+        users += 1
+        books += len(documents)
+
+    print(f"Migrated {books} books from {users} users' libraries.")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
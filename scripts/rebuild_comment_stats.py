@@ -0,0 +1,22 @@
+"""
+Recomputes the comment_stats collection from the comments themselves.
+Stats are kept up to date by every write, this is only needed after the comments migration,
+or if a stats update failed.
+
+Run it from the project's root:
+    python -m scripts.rebuild_comment_stats
+"""
+import asyncio
+import time
+
+from services.social.comment_stats_functions import rebuild_comment_stats
+
+
+async def rebuild():
+    start = time.perf_counter()
+    books = await rebuild_comment_stats()
+    print(f"Rebuilt the comment stats of {books} books in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild())
@@ -0,0 +1,60 @@
+"""
+Fills the search, cover, metadata and download links caches, e.g. after a deploy or a Redis flush.
+
+Run it from the project's root:
+    python -m scripts.warm_caches [--source counters|search-index|file] [--file books.txt] [--limit 100]
+                                  [--concurrency 4] [--rate 2]
+
+"counters" uses the most requested searches and books, "search-index" the books saved in the search indexes,
+and "file" a text file with one "<topic> <md5>" book per line.
+"""
+import argparse
+import asyncio
+
+from models.path_models import ValidIndexesTopic
+from models.query_models import ValidTopics
+from services.cache.cache_warmer import CacheWarmer
+from services.cache.popularity_functions import get_popular_books, get_popular_searches
+from services.search.search_index_functions import get_search_index
+
+
+def read_books_file(path: str) -> list[tuple[str, ValidTopics]]:
+    books = []
+    with open(path, encoding="utf-8") as fo:
+        for line in fo:
+            if not line.strip():
+                continue
+            topic, md5 = line.split()
+            books.append((md5, ValidTopics(topic)))
+    return books
+
+
+async def load_source(source: str, limit: int, path: str | None):
+    if source == "counters":
+        return await get_popular_searches(limit), await get_popular_books(limit)
+
+    if source == "search-index":
+        indexes = await get_search_index(ValidIndexesTopic.any) or []
+        return [], [(index.get("md5"), ValidTopics(index.get("topic"))) for index in indexes[:limit]]
+
+    return [], read_books_file(path)[:limit]
+
+
+async def main(args: argparse.Namespace):
+    searches, books = await load_source(args.source, args.limit, args.file)
+    print(f"Warming {len(searches)} searches and {len(books)} books.")
+    report = await CacheWarmer(args.concurrency, args.rate).warm(searches, books)
+    print(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fills Biblioterra's caches.")
+    parser.add_argument("--source", choices=("counters", "search-index", "file"), default="counters")
+    parser.add_argument("--file", help='Text file with one "<topic> <md5>" per line. Used with --source file.')
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2, help="Maximum lookups per second that may reach Libgen.")
+    parsed_args = parser.parse_args()
+    if parsed_args.source == "file" and not parsed_args.file:
+        parser.error("--file is required with --source file.")
+    asyncio.run(main(parsed_args))
@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from aioredis import RedisError
+from pydantic import BaseModel
+
+from config.redis_connection import RedisConnection
+from models.body_models import normalize_md5
+from models.query_models import SearchQuery, ValidTopics
+from models.response_models import SearchResponse
+from services.cache.popularity_functions import get_popular_books, get_popular_searches
+from services.search.metadata_functions import get_metadata, get_dlinks
+from services.search.search_service import SearchService
+from services.temp_cover.cover_service import TempCoverService
+
+cache_warmer_lock_key = "cache-warmer-lock"
+
+
+class WarmingReport(BaseModel):
+    duration: float = 0
+    # Each search, and each book's cover, metadata and download links, is a key.
+    keys: int = 0
+    already_cached: int = 0
+    warmed: int = 0
+    failed: int = 0
+
+    @property
+    def coverage(self) -> float:
+        if self.keys == 0:
+            return 1
+        return (self.already_cached + self.warmed) / self.keys
+
+    def __str__(self):
+        return f"Warmed {self.warmed} of {self.keys} keys ({self.already_cached} were already cached, " \
+               f"{self.failed} failed) in {self.duration:.1f}s. Coverage: {self.coverage:.1%}."
+
+
+class RateLimiter:
+    """
+    Spaces calls evenly, so at most "rate" of them start each second.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_call = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_call > now:
+                await asyncio.sleep(self._next_call - now)
+            self._next_call = max(now, self._next_call) + self.interval
+
+
+class CacheWarmer:
+    """
+    Fills the search, cover, metadata and download links caches for the given searches and books.
+    Keys that are already cached are skipped. Lookups run with bounded concurrency, and the ones that may reach
+    Libgen are rate limited.
+    """
+
+    def __init__(self, max_concurrent: int = 4, requests_per_second: float = 2):
+        self.logger = logging.getLogger("biblioterra")
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.report = WarmingReport()
+
+    @staticmethod
+    def _book_cache_keys(md5: str, topic: ValidTopics) -> dict[str, str]:
+        # The same keys used by TempCoverService, get_metadata and get_dlinks.
+        md5 = normalize_md5(md5)
+        return {
+            "cover": f"{md5}-{topic}-temp_cover",
+            "metadata": f"metadata:{md5}",
+            "dlinks": f"dlinks-{md5}",
+        }
+
+    async def _find_cached(self, keys: list[str]) -> set[str]:
+        exists = []
+        try:
+            async with RedisConnection() as redis:
+                pipeline = redis.pipeline(transaction=False)
+                for key in keys:
+                    pipeline.exists(key)
+                exists = await pipeline.execute()
+        except RedisError as e:
+            self.logger.warning(e)
+
+        return {key for key, key_exists in zip(keys, exists or []) if key_exists}
+
+    async def _warm_key(self, warm: Callable[[], Awaitable], rate_limited: bool):
+        async with self.semaphore:
+            if rate_limited:
+                await self.rate_limiter.wait()
+            try:
+                await warm()
+                self.report.warmed += 1
+            except Exception as e:
+                # Warming is best effort, a failed key is just counted.
+                self.logger.info(e)
+                self.report.failed += 1
+
+    async def _warm_search(self, query: SearchQuery, topic: ValidTopics):
+        search_service = SearchService(query, topic)
+        if await search_service.retrieve_from_cache():
+            self.report.already_cached += 1
+            return
+
+        async def warm():
+            results = await search_service.make_search()
+            pagination = await search_service.get_pagination_info()
+            await search_service.save_on_cache(SearchResponse(pagination=pagination, results=results))
+
+        # Searches only query our own database, so they aren't rate limited.
+        await self._warm_key(warm, rate_limited=False)
+
+    async def _warm_cover(self, md5: str, topic: ValidTopics):
+        cover_service = TempCoverService(md5, topic)
+        cover_url, source = await cover_service.resolve_cover()
+        await cover_service.save_on_cache(cover_url)
+
+    async def _warm_book(self, md5: str, topic: ValidTopics):
+        cache_keys = self._book_cache_keys(md5, topic)
+        cached_keys = await self._find_cached(list(cache_keys.values()))
+        warmers = {
+            "cover": lambda: self._warm_cover(md5, topic),
+            "metadata": lambda: get_metadata(topic, md5),
+            "dlinks": lambda: get_dlinks(md5, topic),
+        }
+
+        pending = []
+        for name, cache_key in cache_keys.items():
+            if cache_key in cached_keys:
+                self.report.already_cached += 1
+            else:
+                pending.append(self._warm_key(warmers[name], rate_limited=True))
+        await asyncio.gather(*pending)
+
+    async def warm(self, searches: list[tuple[SearchQuery, ValidTopics]],
+                   books: list[tuple[str, ValidTopics]]) -> WarmingReport:
+        start = time.perf_counter()
+        self.report = WarmingReport(keys=len(searches) + len(books) * 3)
+
+        await asyncio.gather(
+            *(self._warm_search(query, topic) for query, topic in searches),
+            *(self._warm_book(md5, topic) for md5, topic in books),
+        )
+
+        self.report.duration = time.perf_counter() - start
+        return self.report
+
+
+async def warm_popular(limit: int = 100, max_concurrent: int = 4, requests_per_second: float = 2) -> WarmingReport:
+    """
+    Warms the most requested searches and books, as recorded by popularity_functions.
+    """
+    searches = await get_popular_searches(limit)
+    books = await get_popular_books(limit)
+    return await CacheWarmer(max_concurrent, requests_per_second).warm(searches, books)
+
+
+async def _acquire_warming_lock(interval: int) -> bool:
+    acquired = False
+    try:
+        async with RedisConnection() as redis:
+            acquired = await redis.set(cache_warmer_lock_key, "1", ex=interval, nx=True)
+    except RedisError:
+        return False
+    return bool(acquired)
+
+
+async def warm_caches_periodically(interval: int):
+    logger = logging.getLogger("biblioterra")
+    while True:
+        # Only one worker warms the caches in each interval.
+        if await _acquire_warming_lock(interval):
+            try:
+                report = await warm_popular()
+                logger.info(str(report))
+            except Exception as e:
+                logger.error(e)
+        await asyncio.sleep(interval)
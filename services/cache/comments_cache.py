@@ -0,0 +1,92 @@
+import json
+import logging
+
+from aioredis import RedisError
+
+from config.redis_connection import RedisConnection
+from models.query_models import CommentsQuery
+from services.cache.local_cache import LocalCache
+from services.metrics.metrics_functions import increment_counter
+
+
+class CommentsCache:
+    """
+    Caches a md5's comment pages, in Redis and in a small in-process cache.
+    Each md5 has a version number, which is part of every page's key. Every write to the md5's comments or upvotes
+    bumps it, so all workers stop using the old pages at once, without having to find and delete them.
+    If Redis is unavailable, the version can't be known, and pages are neither read nor saved.
+    """
+
+    ttl = 300
+    # The version outlives every page saved with it. Otherwise, a reset version could match stale pages.
+    version_ttl = 86400
+
+    # Shared by all instances of the same worker.
+    _local_pages: LocalCache[str] = LocalCache(ttl)
+
+    def __init__(self, md5: str):
+        self.logger = logging.getLogger("biblioterra")
+        self.md5 = md5
+        self.version_key = f"{md5}-comments-version"
+
+    def _page_key(self, version: int, query: CommentsQuery) -> str:
+        sort = query.sort.value if query.sort is not None else None
+        mode = query.mode.value if query.mode is not None else None
+        return f"{self.md5}-{version}-{sort}-{mode}-{query.cursor}-{query.limit}-comments"
+
+    async def get_page(self, query: CommentsQuery) -> tuple[int | None, dict | None]:
+        """
+        Returns the md5's current version, and the page cached for it, if any.
+        """
+        version = None
+        cached_page = None
+        try:
+            async with RedisConnection() as redis:
+                version = int(await redis.get(self.version_key) or 0)
+                page_key = self._page_key(version, query)
+                cached_page = self._local_pages.get(page_key)
+                if cached_page is None:
+                    cached_page = await redis.get(page_key)
+                    if cached_page:
+                        self._local_pages.set(page_key, cached_page)
+        except RedisError as e:
+            self.logger.warning(e)
+
+        if not cached_page:
+            increment_counter("comments_cache.misses")
+            return version, None
+
+        increment_counter("comments_cache.hits")
+        return version, json.loads(cached_page)
+
+    async def save_page(self, version: int | None, query: CommentsQuery, page: dict):
+        if version is None:
+            return
+
+        page_key = self._page_key(version, query)
+        serialized_page = json.dumps(page)
+        self._local_pages.set(page_key, serialized_page)
+        try:
+            async with RedisConnection() as redis:
+                await redis.set(page_key, serialized_page, ex=self.ttl)
+        except RedisError as e:
+            self.logger.warning(e)
+
+    async def invalidate(self):
+        """
+        Must be called after every write to the md5's comments, replies or upvotes.
+        """
+        bumped = False
+        try:
+            async with RedisConnection() as redis:
+                pipeline = redis.pipeline(transaction=True)
+                pipeline.incr(self.version_key)
+                pipeline.expire(self.version_key, self.version_ttl)
+                await pipeline.execute()
+                bumped = True
+        except RedisError as e:
+            self.logger.warning(e)
+
+        if not bumped:
+            # This worker's pages can't be trusted until the version is bumped again.
+            self._local_pages.clear()
@@ -0,0 +1,35 @@
+import time
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class LocalCache(Generic[T]):
+    """
+    A small in-process cache with expiring entries. Each worker has it's own, so it's only used in front of Redis.
+    When it's full, it's simply cleared.
+    """
+
+    def __init__(self, ttl: int, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict[str, tuple[float, T]] = {}
+
+    def get(self, key: str) -> T | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: str, value: T, ttl: int | None = None):
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,75 @@
+import logging
+
+from aioredis import RedisError
+from fastapi import HTTPException
+
+from config.redis_connection import RedisConnection
+from services.cache.local_cache import LocalCache
+from services.metrics.metrics_functions import increment_counter
+
+
+class NegativeCache:
+    """
+    Remembers lookups that found nothing (unknown md5s, searches without results), so repeated requests for them
+    are answered without doing the upstream work again.
+    Entries are kept for a short time, in Redis (shared between workers) and in a small in-process cache,
+    under keys that can't collide with the positive cache ones.
+    """
+
+    ttl = 600
+
+    # Shared by all instances of the same worker.
+    _local_entries: LocalCache[tuple[int, str]] = LocalCache(ttl)
+
+    def __init__(self, namespace: str):
+        self.logger = logging.getLogger("biblioterra")
+        self.namespace = namespace
+
+    def _cache_key(self, key: str):
+        return f"{key}-{self.namespace}-negative"
+
+    async def get(self, key: str) -> HTTPException | None:
+        """
+        Returns the exception saved for this key, if any.
+        """
+        cache_key = self._cache_key(key)
+        entry = self._local_entries.get(cache_key)
+
+        if entry is None:
+            cached_entry = None
+            ttl = None
+            try:
+                async with RedisConnection() as redis:
+                    cached_entry = await redis.get(cache_key)
+                    ttl = await redis.ttl(cache_key) if cached_entry else None
+            except RedisError as e:
+                self.logger.warning(e)
+
+            if cached_entry:
+                cached_entry = cached_entry.decode() if isinstance(cached_entry, bytes) else cached_entry
+                status_code, detail = cached_entry.split(":", 1)
+                entry = int(status_code), detail
+                if ttl and ttl > 0:
+                    self._local_entries.set(cache_key, entry, ttl)
+
+        if entry is None:
+            increment_counter(f"negative_cache.{self.namespace}.misses")
+            return None
+
+        increment_counter(f"negative_cache.{self.namespace}.hits")
+        return HTTPException(*entry)
+
+    async def raise_if_cached(self, key: str):
+        exception = await self.get(key)
+        if exception is not None:
+            raise exception
+
+    async def save(self, key: str, exception: HTTPException):
+        cache_key = self._cache_key(key)
+        self._local_entries.set(cache_key, (exception.status_code, exception.detail), self.ttl)
+        increment_counter(f"negative_cache.{self.namespace}.saves")
+        try:
+            async with RedisConnection() as redis:
+                await redis.set(cache_key, f"{exception.status_code}:{exception.detail}", ex=self.ttl)
+        except RedisError as e:
+            self.logger.warning(e)
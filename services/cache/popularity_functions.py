@@ -0,0 +1,84 @@
+import asyncio
+import json
+import logging
+from collections import Counter
+
+from aioredis import RedisError
+
+from config.redis_connection import RedisConnection
+from models.body_models import normalize_md5
+from models.query_models import SearchQuery, ValidTopics
+
+# Counts how often books and searches are requested, so the cache warmer knows what to warm.
+# Like metrics, accesses are counted in memory and periodically added to Redis sorted sets.
+
+logger = logging.getLogger("biblioterra")
+
+popular_books_key = "popular-books"
+popular_searches_key = "popular-searches"
+# Only the most popular entries are kept.
+max_popular_entries = 10000
+popularity_flush_interval = 60
+
+_pending_books: Counter = Counter()
+_pending_searches: Counter = Counter()
+
+
+def record_book_access(md5: str, topic: ValidTopics):
+    _pending_books[f"{ValidTopics(topic).value}:{normalize_md5(md5)}"] += 1
+
+
+def record_search(query: SearchQuery, topic: ValidTopics):
+    _pending_searches[json.dumps({"topic": ValidTopics(topic).value, "query": query.dict()}, sort_keys=True)] += 1
+
+
+async def flush_popularity():
+    pending = ((popular_books_key, dict(_pending_books)), (popular_searches_key, dict(_pending_searches)))
+    _pending_books.clear()
+    _pending_searches.clear()
+    if not any(counters for _, counters in pending):
+        return
+
+    try:
+        async with RedisConnection() as redis:
+            pipeline = redis.pipeline(transaction=False)
+            for key, counters in pending:
+                for member, amount in counters.items():
+                    pipeline.zincrby(key, amount, member)
+                pipeline.zremrangebyrank(key, 0, -max_popular_entries - 1)
+            await pipeline.execute()
+    except RedisError as e:
+        logger.warning(e)
+
+
+async def flush_popularity_periodically():
+    while True:
+        await asyncio.sleep(popularity_flush_interval)
+        await flush_popularity()
+
+
+async def _get_most_popular(key: str, limit: int) -> list[str]:
+    members = []
+    try:
+        async with RedisConnection() as redis:
+            members = await redis.zrevrange(key, 0, limit - 1)
+    except RedisError as e:
+        logger.warning(e)
+
+    return [member.decode() if isinstance(member, bytes) else member for member in members or []]
+
+
+async def get_popular_books(limit: int) -> list[tuple[str, ValidTopics]]:
+    books = []
+    for member in await _get_most_popular(popular_books_key, limit):
+        topic, md5 = member.split(":", 1)
+        books.append((md5, ValidTopics(topic)))
+    return books
+
+
+async def get_popular_searches(limit: int) -> list[tuple[SearchQuery, ValidTopics]]:
+    searches = []
+    for member in await _get_most_popular(popular_searches_key, limit):
+        search = json.loads(member)
+        searches.append((SearchQuery(**search["query"]), ValidTopics(search["topic"])))
+    return searches
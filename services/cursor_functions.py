@@ -0,0 +1,74 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+# Cursors for keyset pagination, used by the comments and the library.
+# A cursor holds the sort field, the last entry's value for it and the last entry's _id, so the next page
+# starts right after it, in the (sort_field, _id) order.
+
+
+def encode_cursor(document: dict, sort_field: str) -> str:
+    value = document.get(sort_field)
+    if isinstance(value, datetime):
+        # Tagged, so it's decoded back into a datetime whatever the field is.
+        value = {"$date": value.isoformat()}
+    cursor = json.dumps([sort_field, value, str(document["_id"])])
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort_field: str) -> tuple[datetime | int | None, ObjectId]:
+    try:
+        cursor_field, value, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["$date"])
+        entry_id = ObjectId(entry_id)
+    except (binascii.Error, ValueError, TypeError, KeyError, InvalidId):
+        raise HTTPException(400, "Invalid cursor.")
+
+    if cursor_field != sort_field:
+        raise HTTPException(400, "The cursor doesn't match the requested sorting.")
+    return value, entry_id
+
+
+def cursor_filter(sort_field: str, value, entry_id: ObjectId, descending: bool) -> dict:
+    """
+    Returns the filter for entries after the cursor's one, in the (sort_field, _id) order.
+    Null values (e.g. comments without rating) sort before every other value, like MongoDB does.
+    """
+    operator = "$lt" if descending else "$gt"
+    after_entry = {"_id": {operator: entry_id}}
+    if value is None:
+        if descending:
+            return {sort_field: None, **after_entry}
+        return {"$or": [{sort_field: None, **after_entry}, {sort_field: {"$ne": None}}]}
+
+    clauses = [{sort_field: {operator: value}}, {sort_field: value, **after_entry}]
+    if descending:
+        clauses.append({sort_field: None})
+    return {"$or": clauses}
+
+
+def _sort_key(value, entry_id: ObjectId) -> tuple:
+    # Null values sort before every other value, like MongoDB does.
+    return value is not None, value if value is not None else 0, entry_id
+
+
+def sort_documents(documents: list[dict], sort_field: str, descending: bool):
+    """
+    Sorts documents in place, in the (sort_field, _id) order. For when the database can't sort them.
+    """
+    documents.sort(key=lambda document: _sort_key(document.get(sort_field), document["_id"]), reverse=descending)
+
+
+def is_after_cursor(document: dict, sort_field: str, value, entry_id: ObjectId, descending: bool) -> bool:
+    """
+    Python equivalent of cursor_filter, for documents sorted by sort_documents.
+    """
+    document_key = _sort_key(document.get(sort_field), document["_id"])
+    cursor_key = _sort_key(value, entry_id)
+    return document_key < cursor_key if descending else document_key > cursor_key
@@ -1,111 +1,248 @@
+from datetime import datetime
+
 from fastapi import HTTPException
 from pydantic import ValidationError
+from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import PyMongoError, BulkWriteError
 import logging
 
-from models.body_models import LibraryEntry, ValidCategories
-from config.mongodb_connection import mongodb_connect
+from models.body_models import LibraryEntry, ValidCategories, LibraryOperation, LibraryAction
+from config.mongodb_connection import mongodb_library_connect
+from services.library.progress_functions import get_pending_progress, apply_pending_progress, \
+    discard_pending_progress, pending_progress_tag
+from services.library.library_sync_functions import record_library_changes, get_library_changes, \
+    get_library_version
+from services.cursor_functions import encode_cursor, decode_cursor, cursor_filter
 
 # These services should only receive valid usernames, authentication is done inside the endpoints.
+# Each book in a user's library is it's own document, in the "library" collection:
+# the LibraryEntry fields, plus "username", "created_at" and "updated_at".
+# A book can only be once in a library, (username, md5) is unique.
 
 logger = logging.getLogger("biblioterra")
 
+library_indexes = [
+    [("username", 1), ("category", 1), ("updated_at", -1), ("_id", -1)],
+]
+
+# Most books a single request can change. Keeps one request (e.g. an import) from holding the collection for long.
+library_batch_limit = 500
+
+# Only the LibraryEntry fields are returned.
+entry_projection = {"_id": 0, "username": 0, "created_at": 0, "updated_at": 0}
+
+
+async def create_library_indexes():
+    # create_index does nothing if the index already exists.
+    connection = mongodb_library_connect()
+    await connection.create_index([("username", 1), ("md5", 1)], unique=True)
+    for index_keys in library_indexes:
+        await connection.create_index(index_keys)
+
+
+def entry_as_document(username: str, book: LibraryEntry, updated_at: datetime) -> dict:
+    return {**book.dict(), "username": username, "updated_at": updated_at}
+
+
+def document_as_entry(username: str, document: dict) -> LibraryEntry:
+    try:
+        return LibraryEntry(**document)
+    except (ValidationError, TypeError):
+        logger.warning(f"Invalid entry {document} in library of user '{username}'")
+        raise HTTPException(500, "Invalid entry in user's library.")
+
 
 async def get_all_books(username: str):
-    # This services retrieves all books in a user's library.
-    connection = mongodb_connect()
+    # This services retrieves all books in a user's library, with a single query.
+    connection = mongodb_library_connect()
+    user_library = {category.value: [] for category in ValidCategories}
     try:
-        user_info: dict = await connection.find_one({"username": username})
-    except:
-        # Too broad.
+        # Oldest first, books that are moved or updated go to the end of their category.
+        books_cursor = connection.find({"username": username}, entry_projection).sort([("updated_at", 1), ("_id", 1)])
+        async for document in books_cursor:
+            category_books = user_library.get(document.get("category"))
+            if category_books is not None:
+                category_books.append(document)
+    except PyMongoError:
         raise HTTPException(500, "Couldn't retrieve the user's library.")
-    user_library = {
-        "reading": user_info.get("reading"),
-        "to-read": user_info.get("to-read"),
-        "backlog": user_info.get("backlog")
-    }
+
+    pending_progress = await get_pending_progress(username)
+    for category_books in user_library.values():
+        apply_pending_progress(category_books, pending_progress)
     return user_library
 
 
-async def get_book(username: str, md5: str):
-    connection = mongodb_connect()
+async def get_library_etag(username: str) -> str | None:
+    """
+    The library's ETag, which changes with it's version and it's pending progress.
+    None if the version couldn't be read.
+    """
+    try:
+        version = await get_library_version(username)
+    except PyMongoError as e:
+        logger.error(e)
+        return None
+
+    pending_progress = await get_pending_progress(username)
+    if not pending_progress:
+        return f'"{version}"'
+    return f'"{version}-{pending_progress_tag(pending_progress)}"'
+
+
+async def sync_library(username: str, since: int) -> dict | None:
+    """
+    Returns the books changed and the md5s removed after the "since" version, or the whole library if
+    the change log doesn't go back that far ("full" is true). Returns None if nothing changed.
+    Books with pending progress are sent as changed until it's flushed, which bumps the version.
+    """
+    pending_progress = await get_pending_progress(username)
+    try:
+        summary = await get_library_changes(username, since)
+        if summary is None:
+            # Read before the library, so changes made in between are sent again on the next sync, not lost.
+            version = await get_library_version(username)
+            return {"version": version, "full": True, "library": await get_all_books(username)}
+
+        version, changed_md5s, removed_md5s = summary
+        pending_md5s = [md5 for md5 in pending_progress if md5 not in changed_md5s and md5 not in removed_md5s]
+        if version == since and not pending_md5s:
+            return None
+
+        changed = []
+        if changed_md5s or pending_md5s:
+            changed = await mongodb_library_connect().find(
+                {"username": username, "md5": {"$in": changed_md5s + pending_md5s}}, entry_projection).to_list(None)
+    except PyMongoError as e:
+        logger.error(e)
+        raise HTTPException(500, "Couldn't sync the user's library.")
+
+    # Books changed and then removed by a later request that wasn't logged yet.
+    found_md5s = {book["md5"] for book in changed}
+    removed_md5s += [md5 for md5 in changed_md5s if md5 not in found_md5s]
+    apply_pending_progress(changed, pending_progress)
+    return {"version": version, "full": False, "changed": changed, "removed": removed_md5s}
+
+
+async def get_category_page(username: str, category: ValidCategories, cursor: str | None,
+                            limit: int) -> tuple[list[LibraryEntry], str | None]:
+    """
+    Returns a page of a category's books, from the most recently updated, and the cursor for the next page
+    (None if it's the last one).
+    """
+    connection = mongodb_library_connect()
+    filters = {"username": username, "category": category.value}
+    if cursor is not None:
+        updated_at, entry_id = decode_cursor(cursor, "updated_at")
+        filters.update(cursor_filter("updated_at", updated_at, entry_id, descending=True))
+
+    try:
+        # Served by the (username, category, updated_at, _id) index.
+        documents = await connection.find(filters).sort([("updated_at", -1), ("_id", -1)]) \
+            .limit(limit + 1).to_list(None)
+    except PyMongoError:
+        raise HTTPException(500, "Couldn't retrieve the user's library.")
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1], "updated_at")
+
+    apply_pending_progress(documents, await get_pending_progress(username))
+    return [document_as_entry(username, document) for document in documents], next_cursor
+
+
+async def get_book(username: str, md5: str) -> LibraryEntry:
+    connection = mongodb_library_connect()
     try:
-        # Motor optimizes requests by batch requesting all of this.
-        book_on_reading: dict = await connection.find_one(
-            {"username": username, "reading.md5": md5}, {"reading.$"})
-        book_on_toread: dict = await connection.find_one(
-            {"username": username, "to-read.md5": md5}, {"to-read.$"})
-        book_on_backlog: dict = await connection.find_one(
-            {"username": username, "backlog.md5": md5}, {"backlog.$"})
-
-        categories = [book_on_reading, book_on_toread, book_on_backlog]
-        valid_entry = None
-        for category in categories:
-            if category:
-                valid_entry = category.values()
-
-        if valid_entry is None:
-            raise HTTPException(400, "No book found with the given MD5.")
-
-        # If there's a valid entry, build a list with it's values.
-        # This list includes an "_id" and "{category-name} keys, but we are only retrieving their values."
-        entry_list = list(valid_entry)
-        # The "{category-name}" value is an array of only one element, because we are projecting on our queries.
-        # So we use [1] to access it's values, and [0] to retrieve the first and only document.
-        result: dict = entry_list[1][0]
-        # We will be performing validation before returning to the user.
-        try:
-            valid_result = LibraryEntry(**result)
-            return valid_result
-        except (ValidationError, TypeError):
-            logger.warning(f"Invalid entry {result} in library of user '{username}'")
-            raise HTTPException(500, "Invalid entry in user's library.")
-
-    except BaseException as e:
-        print(e)
+        document = await connection.find_one({"username": username, "md5": md5}, entry_projection)
+    except PyMongoError as e:
+        logger.error(e)
         raise HTTPException(400, "Could not find this specific book. This may be an internal error.")
 
+    if document is None:
+        raise HTTPException(400, "No book found with the given MD5.")
+
+    apply_pending_progress([document], await get_pending_progress(username))
+    # We will be performing validation before returning to the user.
+    return document_as_entry(username, document)
+
+
+def operation_as_request(username: str, operation: LibraryOperation, now: datetime) -> UpdateOne | DeleteOne:
+    entry_filter = {"username": username, "md5": operation.md5}
+    if operation.action == LibraryAction.remove:
+        return DeleteOne(entry_filter)
+
+    if operation.action == LibraryAction.move:
+        # Books that aren't in the library are left alone.
+        return UpdateOne(entry_filter, {"$set": {"category": operation.category.value, "updated_at": now}})
+
+    # Every book in a user's library is unique, an existing entry is replaced by the new one.
+    book = operation.book.copy(update={"category": operation.category})
+    return UpdateOne(entry_filter,
+                     {"$set": entry_as_document(username, book, now), "$setOnInsert": {"created_at": now}},
+                     upsert=True)
+
+
+async def apply_operations(username: str, operations: list[LibraryOperation]) -> dict:
+    """
+    Adds, moves and removes books with a single ordered bulk_write: operations are applied in the given order,
+    and an error stops the ones after it.
+    Returns how many books were added, updated (added again or moved) and removed.
+    """
+    if len(operations) == 0:
+        raise HTTPException(400, "No changes being made.")
+    if len(operations) > library_batch_limit:
+        raise HTTPException(400, f"At most {library_batch_limit} books can be changed at once.")
+
+    # Otherwise, older buffered progress would overwrite the progress of books that are added again.
+    # Moves keep the book's progress, so they keep it's buffered progress too.
+    await discard_pending_progress(username, [operation.md5 for operation in operations
+                                              if operation.action != LibraryAction.move])
+
+    connection = mongodb_library_connect()
+    now = datetime.utcnow()
+    requests = [operation_as_request(username, operation, now) for operation in operations]
+    try:
+        result = await connection.bulk_write(requests, ordered=True)
+    except BulkWriteError as e:
+        logger.error(e.details)
+        # Being ordered, every operation before the failed one was applied.
+        applied = e.details["writeErrors"][0]["index"] if e.details.get("writeErrors") else 0
+        await record_library_changes(username, [(operation.md5, operation.action == LibraryAction.remove)
+                                                for operation in operations[:applied]])
+        raise HTTPException(500, f"An error occurred while changing entries, the first {applied} changes were applied.")
+    except PyMongoError as e:
+        logger.error(e)
+        raise HTTPException(500, "An error occurred while changing entries, aborting operation.")
+
+    await record_library_changes(username, [(operation.md5, operation.action == LibraryAction.remove)
+                                            for operation in operations])
+    return {"added": result.upserted_count, "updated": result.modified_count, "removed": result.deleted_count}
+
 
 async def remove_books(username: str, remove_list: list[str]):
-    connection = mongodb_connect()
-    for md5 in remove_list:
-        try:
+    if len(remove_list) > library_batch_limit:
+        raise HTTPException(400, f"At most {library_batch_limit} books can be changed at once.")
 
-            await connection.update_one(
-                {"username": username},
-                {"$pull": {"reading": {"md5": md5}, "to-read": {"md5": md5}, "backlog": {"md5": md5}}}
-            )
+    await discard_pending_progress(username, remove_list)
+    connection = mongodb_library_connect()
+    try:
+        await connection.delete_many({"username": username, "md5": {"$in": remove_list}})
+    except PyMongoError as e:
+        logger.error(e)
+        raise HTTPException(500, "An error occurred while removing entries, aborting operation.")
 
-        except BaseException as e:
-            print(e)
-            # Too broad.
-            raise HTTPException(500, "An error occurred while removing entries, aborting operation.")
+    await record_library_changes(username, [(md5, True) for md5 in remove_list])
 
 
 async def add_books(username: str, add_list: list[LibraryEntry], category: ValidCategories):
     """
-    Adds a book to a category, if it already exists, remove it before adding it again.
+    Adds a book to a category, if it already exists, it's moved and updated.
     Can also be used for updating.
     """
-
-    connection = mongodb_connect()
     if len(add_list) == 0:
         raise HTTPException(400, "No book being added.")
-    # Adds every md5 in add_list to a md5_list
-    md5_list = []
-    book_list = []
-    for book in add_list:
-        if book.category is None:
-            book.category = category
-        book_list.append(book.dict())
-        md5_list.append(book.md5)
-
-    # Removes said books using their md5 before proceeding.
-    # This is done so every book in a user's library is unique.
-    await remove_books(username, md5_list)
 
-    try:
-        # Adds each book in add_list to the user's specified category.
-        await connection.update_one({"username": username}, {"$addToSet": {category: {"$each": book_list}}})
-    except:
-        # Too broad.
-        raise HTTPException(500, "An error occurred while adding new entries, aborting operation.")
+    # Books are always added to the requested category.
+    await apply_operations(username, [LibraryOperation(action=LibraryAction.add, md5=book.md5, category=category,
+                                                       book=book) for book in add_list])
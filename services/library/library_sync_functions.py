@@ -0,0 +1,76 @@
+import logging
+
+from pymongo.errors import PyMongoError
+
+from config.mongodb_connection import mongodb_library_versions_connect
+
+# Each user's library has a version, bumped by every request that changes it, and a log of the latest changes:
+# which md5s were changed (added, moved, updated) or removed, and in which version.
+# Both live in a single "library_versions" document per user ({"_id": username, "version", "changes"}),
+# so bumping the version and logging the changes is one atomic update, and a sync is one read.
+# Clients that are too far behind for the log to cover them get the whole library instead.
+
+logger = logging.getLogger("biblioterra")
+
+# Changes kept per user, older ones are dropped.
+library_changes_limit = 2000
+
+
+async def record_library_changes(username: str, changes: list[tuple[str, bool]]):
+    """
+    Must be called after every change to a user's library, with each changed md5 and whether it was removed,
+    in the order they were applied.
+    """
+    if not changes:
+        return
+
+    changes = [{"md5": md5, "removed": removed, "version": "$version"} for md5, removed in changes]
+    try:
+        await mongodb_library_versions_connect().update_one({"_id": username}, [
+            {"$set": {"version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}}},
+            {"$set": {"changes": {"$slice": [
+                {"$concatArrays": [{"$ifNull": ["$changes", []]}, changes]}, -library_changes_limit]}}},
+        ], upsert=True)
+    except PyMongoError as e:
+        # The library itself was already changed, clients will get it on their next full load.
+        logger.error(e)
+
+
+async def get_library_version(username: str) -> int:
+    document = await mongodb_library_versions_connect().find_one({"_id": username}, {"version": 1})
+    return document.get("version", 0) if document else 0
+
+
+def summarize_changes(document: dict | None, since: int) -> tuple[int, list[str], list[str]] | None:
+    """
+    Returns the current version, and the md5s changed and removed after "since".
+    Returns None if the log doesn't cover every change after "since", so the whole library is needed.
+    """
+    version = document.get("version", 0) if document else 0
+    changes = document.get("changes", []) if document else []
+    # Clients that never synced have none of the library, even books added before it had a version.
+    if since == 0 or since > version:
+        return None
+    # Versions before the oldest logged one weren't logged, or were dropped (the oldest one may have been
+    # partially dropped too).
+    oldest_version = changes[0]["version"] if changes else version + 1
+    if len(changes) >= library_changes_limit:
+        oldest_version += 1
+    if since < oldest_version - 1:
+        return None
+
+    # Only the latest change to each md5 matters.
+    latest_changes: dict[str, bool] = {}
+    for change in changes:
+        if change["version"] > since:
+            latest_changes.pop(change["md5"], None)
+            latest_changes[change["md5"]] = change["removed"]
+
+    changed = [md5 for md5, removed in latest_changes.items() if not removed]
+    removed = [md5 for md5, removed in latest_changes.items() if removed]
+    return version, changed, removed
+
+
+async def get_library_changes(username: str, since: int) -> tuple[int, list[str], list[str]] | None:
+    document = await mongodb_library_versions_connect().find_one({"_id": username})
+    return summarize_changes(document, since)
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import json
+import logging
+
+from aioredis import RedisError
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from config.mongodb_connection import mongodb_library_connect
+from config.redis_connection import RedisConnection
+from services.library.library_sync_functions import record_library_changes
+
+# Reading progress (epubcifi) changes on every page turn, so it's buffered instead of written to MongoDB each time.
+# Each user has a Redis hash of md5 -> latest progress, which coalesces the updates, and users with pending progress
+# are kept in a set. The buffer is flushed to the library periodically and on shutdown.
+# Reads of the library apply the pending progress on top of the stored one, so users always see their last update.
+# Buffered updates don't bump the library's version, so the ETag and syncs also account for the pending progress.
+
+logger = logging.getLogger("biblioterra")
+
+progress_users_key = "library-progress-users"
+progress_flush_interval = 30
+
+# Removes the flushed md5s whose progress is still the flushed one, and the user from the pending users once
+# nothing is left. Atomic, so progress saved while flushing is kept for the next flush.
+# KEYS: the user's progress hash, the pending users set. ARGV: the username, then md5, progress pairs.
+_remove_flushed_script = """
+for i = 2, #ARGV, 2 do
+    if redis.call("HGET", KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call("HDEL", KEYS[1], ARGV[i])
+    end
+end
+if redis.call("HLEN", KEYS[1]) == 0 then
+    redis.call("SREM", KEYS[2], ARGV[1])
+end
+"""
+
+
+def _progress_key(username: str) -> str:
+    return f"library-progress:{username}"
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def write_progress(username: str, progress: dict[str, str]):
+    """
+    Writes the progress of each md5 to the user's library. Books that aren't in the library are ignored.
+    """
+    requests = [UpdateOne({"username": username, "md5": md5}, {"$set": {"progress": book_progress}})
+                for md5, book_progress in progress.items()]
+    await mongodb_library_connect().bulk_write(requests, ordered=False)
+    await record_library_changes(username, [(md5, False) for md5 in progress])
+
+
+async def save_progress(username: str, md5: str, progress: str):
+    buffered = False
+    try:
+        async with RedisConnection() as redis:
+            pipeline = redis.pipeline(transaction=True)
+            pipeline.hset(_progress_key(username), md5, progress)
+            pipeline.sadd(progress_users_key, username)
+            await pipeline.execute()
+            buffered = True
+    except RedisError as e:
+        logger.warning(e)
+
+    if not buffered:
+        # Without Redis, the progress is written right away.
+        await write_progress(username, {md5: progress})
+
+
+async def get_pending_progress(username: str) -> dict[str, str]:
+    pending = {}
+    try:
+        async with RedisConnection() as redis:
+            pending = await redis.hgetall(_progress_key(username))
+    except RedisError as e:
+        logger.warning(e)
+
+    return {_decode(md5): _decode(progress) for md5, progress in (pending or {}).items()}
+
+
+async def discard_pending_progress(username: str, md5s: list[str]):
+    """
+    Used before books are added or removed, so older buffered progress doesn't overwrite theirs.
+    """
+    if not md5s:
+        return
+    try:
+        async with RedisConnection() as redis:
+            await redis.hdel(_progress_key(username), *md5s)
+    except RedisError as e:
+        logger.warning(e)
+
+
+def pending_progress_tag(pending: dict[str, str]) -> str:
+    """
+    Identifies the pending progress, so the library's ETag changes with it.
+    """
+    return hashlib.sha256(json.dumps(sorted(pending.items())).encode()).hexdigest()[:16]
+
+
+def apply_pending_progress(books: list[dict], pending: dict[str, str]):
+    for book in books:
+        if book.get("md5") in pending:
+            book["progress"] = pending[book["md5"]]
+
+
+async def _flush_user_progress(redis, username: str) -> bool:
+    # The progress stays in Redis until it's written, so reads keep seeing it and nothing is lost if the write fails
+    # or is cancelled. Only the fields that didn't change in the meantime are removed afterwards.
+    pending = await redis.hgetall(_progress_key(username))
+    progress = {_decode(md5): _decode(book_progress) for md5, book_progress in (pending or {}).items()}
+    if progress:
+        try:
+            await write_progress(username, progress)
+        except PyMongoError as e:
+            logger.error(e)
+            return False
+
+    flushed = [value for md5, book_progress in progress.items() for value in (md5, book_progress)]
+    await redis.eval(_remove_flushed_script, 2, _progress_key(username), progress_users_key, username, *flushed)
+    return True
+
+
+async def flush_progress(batch_size: int = 100):
+    try:
+        async with RedisConnection() as redis:
+            async for username in redis.sscan_iter(progress_users_key, count=batch_size):
+                if not await _flush_user_progress(redis, _decode(username)):
+                    # MongoDB is failing, the remaining users are left for the next flush.
+                    return
+    except RedisError as e:
+        logger.warning(e)
+
+
+async def flush_progress_periodically():
+    while True:
+        await asyncio.sleep(progress_flush_interval)
+        await flush_progress()
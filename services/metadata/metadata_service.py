@@ -2,20 +2,23 @@ from fastapi import Path, Query, HTTPException
 from pydantic import ValidationError
 
 from config.mysql_connection import MySQLConnect
-from models.body_models import md5_reg, date_format, Metadata
+from models.body_models import md5_reg, date_format, Metadata, normalize_md5
 from models.query_models import ValidTopics
 from datetime import datetime
 
+from services.cache.negative_cache import NegativeCache
 from services.search.search_service import SearchService
 
 
 class MetadataService:
 
     def __init__(self, md5: str = Path(), topic: ValidTopics = Path()):
-        self.md5 = md5
+        self.md5 = normalize_md5(md5)
         self.topic = topic
         self.metadata_sql = self._sql_query_builder()
-        self.placeholder_values = (md5,)
+        self.placeholder_values = (self.md5,)
+        self.negative_cache = NegativeCache("metadata")
+        self.negative_cache_key = f"{self.md5}-{topic}"
 
         # We will be using some static methods from the search service here.
         # Be sure to not instantiate it. We only need the static methods.
@@ -85,10 +88,14 @@ class MetadataService:
         pass
 
     async def retrieve_metadata(self):
+        await self.negative_cache.raise_if_cached(self.negative_cache_key)
+
         metadata = await self._find_on_database()
         # If metadata is None or an empty dict, bool(metadata) returns false.
         if not bool(metadata):
-            raise HTTPException(400, "Couldn't find any file with the given MD5")
+            not_found = HTTPException(400, "Couldn't find any file with the given MD5")
+            await self.negative_cache.save(self.negative_cache_key, not_found)
+            raise not_found
 
         try:
             metadata_as_model = self._metadata_as_model(metadata)
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from collections import Counter
+
+from aioredis import RedisError
+
+from config.redis_connection import RedisConnection
+
+# Counters are kept in memory and periodically added to a Redis hash, so incrementing one costs nothing
+# on the request's path, and all workers' counters are summed in the same place.
+
+logger = logging.getLogger("biblioterra")
+
+metrics_redis_key = "biblioterra-metrics"
+metrics_flush_interval = 30
+
+_pending_counters: Counter = Counter()
+
+
+def increment_counter(name: str, amount: int = 1):
+    _pending_counters[name] += amount
+
+
+async def flush_counters():
+    if not _pending_counters:
+        return
+
+    counters = dict(_pending_counters)
+    _pending_counters.clear()
+    try:
+        async with RedisConnection() as redis:
+            pipeline = redis.pipeline(transaction=False)
+            for name, amount in counters.items():
+                pipeline.hincrby(metrics_redis_key, name, amount)
+            await pipeline.execute()
+    except RedisError as e:
+        logger.warning(e)
+        # Keeps them for the next flush.
+        _pending_counters.update(counters)
+
+
+async def flush_counters_periodically():
+    while True:
+        await asyncio.sleep(metrics_flush_interval)
+        await flush_counters()
+
+
+async def get_counters() -> dict[str, int]:
+    """
+    Returns all counters, including the ones this worker hasn't flushed yet.
+    """
+    counters = Counter()
+    try:
+        async with RedisConnection() as redis:
+            saved_counters = await redis.hgetall(metrics_redis_key)
+            for name, amount in (saved_counters or {}).items():
+                name = name.decode() if isinstance(name, bytes) else name
+                counters[name] += int(amount)
+    except RedisError as e:
+        logger.warning(e)
+
+    counters.update(_pending_counters)
+    return dict(sorted(counters.items()))
@@ -0,0 +1,248 @@
+import bisect
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Iterable, Iterator, NamedTuple
+
+from keys import book_cards_path
+from models.body_models import SearchEntry
+from models.query_models import ValidTopics
+from services.search.mapped_file_holder import MappedFileHolder
+from services.search.search_service import SearchService
+
+# A read only md5 -> book card store, with the few fields search results, library shelves and comment pages need.
+# It's built offline by scripts/build_book_cards.py and memory mapped, so all workers share it through the page cache.
+#
+# File layout (little endian):
+#   magic (8 bytes) | number of cards (uint64) | last modified, as unix time (uint64)
+#   keys: the md5s' 16 raw bytes, sorted
+#   offsets: (number of cards + 1) uint64s, where each card starts and ends inside the records section
+#   records: topic (uint8) | filesize (uint64) | title, author, extension, language and coverurl,
+#            each as a uint16 length followed by utf-8 bytes
+
+_magic = b"BTCARDS1"
+_header = struct.Struct("<8sQQ")
+_key_size = 16
+_offset_size = 8
+_record_head = struct.Struct("<BQ")
+_string_length = struct.Struct("<H")
+
+_topics = (ValidTopics.fiction, ValidTopics.scitech)
+
+book_cards_refresh_interval = 300
+
+
+class BookCardRecord(NamedTuple):
+    md5: str
+    topic: ValidTopics
+    title: str
+    author: str
+    extension: str
+    language: str | None
+    filesize: int
+    coverurl: str | None
+
+
+def pack_record(record: BookCardRecord) -> bytes:
+    parts = [_record_head.pack(_topics.index(record.topic), record.filesize or 0)]
+    for value in (record.title, record.author, record.extension, record.language, record.coverurl):
+        encoded = (value or "").encode()[:65535]
+        parts.append(_string_length.pack(len(encoded)))
+        parts.append(encoded)
+
+    return b"".join(parts)
+
+
+def unpack_record(md5: str, data: bytes) -> BookCardRecord:
+    topic_index, filesize = _record_head.unpack_from(data, 0)
+    position = _record_head.size
+    values = []
+    for _ in range(5):
+        (length,) = _string_length.unpack_from(data, position)
+        position += _string_length.size
+        values.append(data[position:position + length].decode(errors="ignore") or None)
+        position += length
+
+    title, author, extension, language, coverurl = values
+    return BookCardRecord(md5, _topics[topic_index], title or "", author or "", extension or "", language,
+                          filesize, coverurl)
+
+
+def merge_records(records: Iterable[BookCardRecord], changed: Iterable[BookCardRecord]) -> Iterator[BookCardRecord]:
+    """
+    Merges two md5 sorted record streams. Changed records replace the ones with the same md5.
+    """
+    records = iter(records)
+    changed = iter(changed)
+    record = next(records, None)
+    changed_record = next(changed, None)
+
+    while record is not None or changed_record is not None:
+        if changed_record is None or (record is not None and record.md5.upper() < changed_record.md5.upper()):
+            yield record
+            record = next(records, None)
+            continue
+
+        if record is not None and record.md5.upper() == changed_record.md5.upper():
+            record = next(records, None)
+        yield changed_record
+        changed_record = next(changed, None)
+
+
+class BookCardWriter:
+    """
+    Writes a new store from records added in md5 order. Records with an already added md5 are skipped.
+    The store only replaces the file at "path" when it's saved.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(path) or "."
+        os.makedirs(folder, exist_ok=True)
+        self.keys = bytearray()
+        self.offsets = array("Q", [0])
+        self.records_file = tempfile.TemporaryFile(dir=folder)
+        self.last_key: bytes | None = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, record: BookCardRecord):
+        try:
+            key = bytes.fromhex(record.md5)
+        except ValueError:
+            return
+        if len(key) != _key_size:
+            return
+
+        if self.last_key is not None and key <= self.last_key:
+            if key == self.last_key:
+                return
+            raise ValueError("Book cards must be added in md5 order.")
+
+        packed_record = pack_record(record)
+        self.records_file.write(packed_record)
+        self.keys += key
+        self.offsets.append(self.offsets[-1] + len(packed_record))
+        self.last_key = key
+
+    def save(self, last_modified: int):
+        if sys.byteorder != "little":
+            self.offsets.byteswap()
+
+        temp_path = f"{self.path}.{os.getpid()}.part"
+        with open(temp_path, "wb") as fo:
+            fo.write(_header.pack(_magic, len(self), last_modified))
+            fo.write(self.keys)
+            fo.write(self.offsets.tobytes())
+            self.records_file.seek(0)
+            shutil.copyfileobj(self.records_file, fo)
+
+        self.records_file.close()
+        os.replace(temp_path, self.path)
+
+
+class _SortedKeys:
+    # Lets bisect search the keys section without copying it.
+    def __init__(self, data: mmap.mmap, count: int):
+        self.data = data
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        start = _header.size + index * _key_size
+        return self.data[start:start + _key_size]
+
+
+class BookCardStore:
+    def __init__(self, data: mmap.mmap, count: int, last_modified: int):
+        self.data = data
+        self.count = count
+        self.last_modified = last_modified
+        self.keys = _SortedKeys(data, count)
+        self.offsets_start = _header.size + count * _key_size
+        self.records_start = self.offsets_start + (count + 1) * _offset_size
+
+    @classmethod
+    def load(cls, path: str) -> "BookCardStore":
+        with open(path, "rb") as fo:
+            data = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, count, last_modified = _header.unpack_from(data, 0)
+            store = cls(data, count, last_modified)
+            if magic != _magic or store.records_start + store._offset(count) != len(data):
+                raise ValueError
+        except (ValueError, struct.error, IndexError):
+            data.close()
+            raise ValueError(f"{path} is not a valid book cards file.")
+
+        return store
+
+    def __len__(self):
+        return self.count
+
+    def _offset(self, index: int) -> int:
+        (offset,) = struct.unpack_from("<Q", self.data, self.offsets_start + index * _offset_size)
+        return offset
+
+    def _record_at(self, index: int) -> BookCardRecord:
+        start = self.records_start + self._offset(index)
+        end = self.records_start + self._offset(index + 1)
+        return unpack_record(self.keys[index].hex().upper(), self.data[start:end])
+
+    def _find(self, md5: str) -> int | None:
+        try:
+            key = bytes.fromhex(md5)
+        except (ValueError, TypeError):
+            return None
+
+        index = bisect.bisect_left(self.keys, key)
+        if index < self.count and self.keys[index] == key:
+            return index
+        return None
+
+    def get_record(self, md5: str) -> BookCardRecord | None:
+        index = self._find(md5)
+        return self._record_at(index) if index is not None else None
+
+    def iter_records(self) -> Iterator[BookCardRecord]:
+        for index in range(self.count):
+            yield self._record_at(index)
+
+    @staticmethod
+    def as_search_entry(record: BookCardRecord) -> SearchEntry:
+        return SearchEntry(
+            authors=record.author,
+            title=record.title,
+            md5=record.md5,
+            topic=record.topic,
+            language=record.language,
+            extension=record.extension,
+            size=SearchService.bytes_to_size(record.filesize),
+            cover_url=SearchService.resolve_cover_url(record.topic, record.coverurl),
+        )
+
+    def get(self, md5: str) -> SearchEntry | None:
+        record = self.get_record(md5)
+        return self.as_search_entry(record) if record is not None else None
+
+    def get_many(self, md5s: Iterable[str]) -> dict[str, SearchEntry]:
+        """
+        Returns the cards that exist, keyed by the given md5s.
+        """
+        cards = {}
+        for md5 in md5s:
+            card = self.get(md5)
+            if card is not None:
+                cards[md5] = card
+        return cards
+
+
+book_cards_holder: MappedFileHolder[BookCardStore] = MappedFileHolder(book_cards_path, BookCardStore.load)
@@ -1,26 +1,70 @@
+import httpx
 from fastapi import HTTPException
-from grab_fork_from_libgen.search_config import get_request_headers
-from requests import exceptions
-from requests_html import AsyncHTMLSession
+from grab_fork_from_libgen.exceptions import MetadataError
+
+from config.http_client import get_http_client
+from models.body_models import normalize_md5
+from services.search.libgen_functions import scrape_download_links
 from services.search.metadata_functions import get_dlinks
+from services.search.mirror_scoreboard import MirrorScoreboard
+from services.search.download_scheduler import download_scheduler
 import os
+import time
+import uuid
+from typing import Callable
 
 import aiofiles
 from aiofiles import os as aioos
 
 temp_download_folder = "temp"
+# Downloaded files are kept for a while, so clients can resume interrupted downloads using Range requests.
+temp_download_ttl = 3600
+# Cached files this close to expiring are not served, so they are not removed while a download starts.
+temp_download_grace = 300
 
 
 async def remove_temp_download(filename: str):
     await aioos.remove(filename)
 
 
+def _get_file_age(filename: str) -> float | None:
+    try:
+        return time.time() - os.path.getmtime(filename)
+    except OSError:
+        return None
+
+
+async def remove_expired_downloads():
+    if not os.path.exists(temp_download_folder):
+        return
+
+    for entry in os.scandir(temp_download_folder):
+        file_age = _get_file_age(entry.path)
+        if file_age is not None and file_age > temp_download_ttl:
+            try:
+                await remove_temp_download(entry.path)
+            except FileNotFoundError:
+                # Another worker may have already removed it.
+                pass
+
+
+def _get_cached_download(md5: str) -> str | None:
+    filename = os.path.join(temp_download_folder, f"{md5}.epub")
+    file_age = _get_file_age(filename)
+    if file_age is not None and file_age < temp_download_ttl - temp_download_grace:
+        return filename
+    return None
+
+
 async def _create_temp_file(content: bytes, md5: str):
     filename = os.path.join(temp_download_folder, f"{md5}.epub")
-    async with aiofiles.open(filename, "wb+") as fo:
+    # Written to an unique partial file and then renamed, so other workers never see (or serve) a half written file.
+    partial_filename = f"{filename}.{uuid.uuid4().hex}.part"
+    async with aiofiles.open(partial_filename, "wb+") as fo:
         await fo.write(content)
         await fo.close()
 
+    os.replace(partial_filename, filename)
     return filename
 
 def _create_temp_dir():
@@ -28,34 +72,66 @@ def _create_temp_dir():
         os.mkdir(temp_download_folder)
 
 
-async def _download_handler(d_link: str):
-    session = AsyncHTMLSession()
-    req = await session.get(d_link, timeout=60, headers=get_request_headers())
-    return req.content
+async def _download_handler(d_link: str, scoreboard: MirrorScoreboard, track_bytes: Callable[[int], None]):
+    http_client = get_http_client()
+    started_at = time.monotonic()
+    chunks = []
+    try:
+        async with http_client.stream("GET", d_link, timeout=60) as req:
+            # Headers have been received at this point.
+            latency = time.monotonic() - started_at
+            req.raise_for_status()
+            async for chunk in req.aiter_bytes():
+                # Counted as it arrives, so a download too big for the memory cap is stopped midway.
+                track_bytes(len(chunk))
+                chunks.append(chunk)
+    except httpx.HTTPError:
+        await scoreboard.record_failure(d_link)
+        raise
 
+    content = b"".join(chunks)
+    total_time = time.monotonic() - started_at
+    await scoreboard.record_success(d_link, latency, total_time, len(content))
+    return content
 
-async def make_temp_download(md5: str, topic: str):
-    # We make use of a possible d_links cache by using the same function we use in /metadata.
-    # TODO: Refactor and put this somewhere else.
-    _create_temp_dir()
-    d_links_handler = await get_dlinks(md5, topic)
-    d_links = d_links_handler[0]
-    downloaded_file = None
+
+async def _try_links(links: list[str], md5: str, scoreboard: MirrorScoreboard) -> tuple[str | None, Exception | None]:
     last_err = None
-    for index, link in enumerate(d_links.values()):
-        print(link)
+    for link in links:
         try:
-            tried_download = await _download_handler(link)
-            temp_file = await _create_temp_file(tried_download, md5)
+            with download_scheduler.track_bytes() as track_bytes:
+                tried_download = await _download_handler(link, scoreboard, track_bytes)
+                temp_file = await _create_temp_file(tried_download, md5)
             if temp_file is not None:
-                downloaded_file = temp_file
-                break
-            else:
-                continue
+                return temp_file, None
 
-        except (exceptions.Timeout, exceptions.ConnectionError, exceptions.HTTPError) as err:
+        except httpx.HTTPError as err:
             last_err = err
-            continue
+
+    return None, last_err
+
+
+async def _scrape_get_link(md5: str, topic: str) -> str | None:
+    try:
+        scraped_links = await scrape_download_links(md5, topic)
+    except MetadataError:
+        return None
+    return scraped_links.get("GET")
+
+
+async def _download_from_mirrors(md5: str, topic: str):
+    # We make use of a possible d_links cache by using the same function we use in /metadata.
+    d_links_handler = await get_dlinks(md5, topic)
+    scoreboard = MirrorScoreboard()
+    # Mirrors are tried from the fastest to the slowest, based on previous downloads.
+    d_links = await scoreboard.rank_links(d_links_handler[0])
+    downloaded_file, last_err = await _try_links([link for link in d_links.values() if link], md5, scoreboard)
+
+    if downloaded_file is None and not d_links.get("GET"):
+        # Locally built links only include IPFS mirrors. GET needs a key that only library.lol has.
+        get_link = await _scrape_get_link(md5, topic)
+        if get_link:
+            downloaded_file, last_err = await _try_links([get_link], md5, scoreboard)
 
     if downloaded_file is None:
         if last_err is not None:
@@ -63,3 +139,14 @@ async def make_temp_download(md5: str, topic: str):
         raise HTTPException(500, "Couldn't download this book in any of the mirrors.")
 
     return downloaded_file
+
+
+async def make_temp_download(md5: str, topic: str):
+    _create_temp_dir()
+    md5 = normalize_md5(md5)
+    cached_download = _get_cached_download(md5)
+    if cached_download is not None:
+        return cached_download
+
+    # Concurrent requests for the same book share a single mirror download.
+    return await download_scheduler.schedule(md5, lambda: _download_from_mirrors(md5, topic))
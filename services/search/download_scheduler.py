@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator
+
+from fastapi import HTTPException
+
+from models.body_models import normalize_md5
+
+logger = logging.getLogger("biblioterra")
+
+
+class DownloadScheduler:
+    """
+    Coordinates mirror downloads inside a worker.
+    Concurrent requests for the same md5 share a single download, only max_concurrent downloads run at the same time,
+    and requests are shed with a 503 when the queue is full or too many bytes are being held in memory.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queued: int = 12, max_bytes_in_flight: int = 256 * 1024 * 1024,
+                 retry_after: int = 30):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.retry_after = retry_after
+        self.bytes_in_flight = 0
+        self._in_progress: dict[str, asyncio.Task] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily, so it's bound to the running event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    def _shed(self, reason: str):
+        logger.warning(f"Shedding download request: {reason}")
+        raise HTTPException(503, f"Server is busy downloading other books ({reason}). Please try again later.",
+                            headers={"Retry-After": str(self.retry_after)})
+
+    async def _run(self, download: Callable[[], Awaitable[str]]) -> str:
+        async with self._get_semaphore():
+            return await download()
+
+    def _forget(self, md5: str, task: asyncio.Task):
+        if self._in_progress.get(md5) is task:
+            self._in_progress.pop(md5)
+
+    @property
+    def pending(self) -> int:
+        # Downloads either running or waiting for a free slot.
+        return len(self._in_progress)
+
+    async def schedule(self, md5: str, download: Callable[[], Awaitable[str]]) -> str:
+        """
+        Runs download() for this md5, or joins an identical download that's already running.
+        Returns download()'s result, and raises it's exceptions to every waiter.
+        """
+        md5 = normalize_md5(md5)
+        task = self._in_progress.get(md5)
+        if task is None:
+            if self.pending >= self.max_concurrent + self.max_queued:
+                self._shed("download queue is full")
+            if self.bytes_in_flight >= self.max_bytes_in_flight:
+                self._shed("too many bytes in flight")
+
+            task = asyncio.create_task(self._run(download))
+            self._in_progress[md5] = task
+            task.add_done_callback(lambda done_task: self._forget(md5, done_task))
+
+        # Shielded, so a client disconnecting doesn't cancel the download for everyone else waiting on it.
+        return await asyncio.shield(task)
+
+    @contextmanager
+    def track_bytes(self) -> Iterator[Callable[[int], None]]:
+        """
+        Use this while a download is held in memory. Call the yielded function with each chunk's size as it arrives:
+        the download is shed once this worker would hold more than max_bytes_in_flight.
+        """
+        held = 0
+
+        def track(size: int):
+            nonlocal held
+            if self.bytes_in_flight + size > self.max_bytes_in_flight:
+                self._shed("too many bytes in flight")
+            self.bytes_in_flight += size
+            held += size
+
+        try:
+            yield track
+        finally:
+            self.bytes_in_flight -= held
+
+download_scheduler = DownloadScheduler()
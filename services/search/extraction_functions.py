@@ -0,0 +1,81 @@
+import asyncio
+from typing import Callable, TypeVar
+
+from grab_fork_from_libgen.search_config import get_mirror_sources
+from lxml import html as lxml_html
+from lxml.etree import ParserError
+from pydantic import BaseModel
+
+# Targeted extractors for the few fields we scrape from libgen pages.
+# Each page is parsed only once with lxml (much faster than requests_html or BeautifulSoup's html.parser),
+# and pages that don't need parsing at all are detected with a plain substring search.
+
+md5_not_found_message = "No record with such MD5 hash has been found"
+
+T = TypeVar("T")
+
+
+class CoverPageData(BaseModel):
+    md5_not_found: bool
+    cover_src: str | None
+
+
+def _parse(page: str | bytes):
+    try:
+        return lxml_html.fromstring(page)
+    except (ParserError, ValueError):
+        return None
+
+
+def extract_cover_page(page: str) -> CoverPageData:
+    """
+    Extracts the first <img> src of a libgen book page, and whether the md5 exists.
+    """
+    if md5_not_found_message in page:
+        return CoverPageData(md5_not_found=True, cover_src=None)
+
+    tree = _parse(page)
+    if tree is None:
+        return CoverPageData(md5_not_found=False, cover_src=None)
+
+    img_sources = tree.xpath("(//img)[1]/@src")
+    cover_src = str(img_sources[0]) if img_sources else None
+    return CoverPageData(md5_not_found=False, cover_src=cover_src)
+
+
+def extract_download_links(page: str) -> dict:
+    """
+    Extracts the mirror links of a library.lol page, e.g. {"GET": "...", "Cloudflare": "..."}.
+    """
+    tree = _parse(page)
+    if tree is None:
+        return {}
+
+    mirror_sources = set(get_mirror_sources())
+    download_links = {}
+    for link in tree.iter("a"):
+        # Only links with nothing but the mirror's name as their text, like BeautifulSoup's "string=" matching.
+        if len(link) == 0 and link.text in mirror_sources and link.get("href"):
+            download_links[link.text] = link.get("href")
+
+    return download_links
+
+
+def extract_librocks_cover(page: str) -> str | None:
+    """
+    Extracts the cover's src of a libgen.rocks page.
+    It's the second image that is the last image among it's siblings, same as the "img:last-of-type" CSS selector.
+    """
+    tree = _parse(page)
+    if tree is None:
+        return None
+
+    img_sources = tree.xpath("//img[not(following-sibling::img)]/@src")
+    if len(img_sources) < 2:
+        return None
+    return str(img_sources[1])
+
+
+async def run_extraction(extractor: Callable[[str], T], page: str) -> T:
+    # Parsing is CPU bound, running it in a thread keeps the event loop free for other requests.
+    return await asyncio.to_thread(extractor, page)
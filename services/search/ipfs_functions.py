@@ -0,0 +1,62 @@
+import logging
+from urllib.parse import quote
+
+from pymysql.err import Error
+
+from config.mysql_connection import MySQLConnect
+from models.query_models import ValidTopics
+
+# Libgen's IPFS mirrors only depend on the file's CID (from the "hashes" and "fiction_hashes" tables) and filename,
+# so they can be built locally instead of scraping library.lol for them.
+
+logger = logging.getLogger("biblioterra")
+
+ipfs_gateways = {
+    "Cloudflare": "https://cloudflare-ipfs.com/ipfs/",
+    "IPFS.io": "https://ipfs.io/ipfs/",
+    "Pinata": "https://gateway.pinata.cloud/ipfs/",
+    "Crust": "https://crustwebsites.net/ipfs/",
+}
+
+
+def make_filename(author: str | None, title: str | None, extension: str | None) -> str:
+    # Same format used by library.lol, e.g. "Austen, Jane - Pride and Prejudice.epub".
+    name = " - ".join(part.strip() for part in (author, title) if part and part.strip()) or "book"
+    if extension:
+        name += f".{extension.strip().lower()}"
+    return name.replace("/", "_")
+
+
+def make_ipfs_links(ipfs_cid: str, filename: str) -> dict[str, str]:
+    quoted_filename = quote(filename, safe="")
+    return {name: f"{gateway}{ipfs_cid}?filename={quoted_filename}" for name, gateway in ipfs_gateways.items()}
+
+
+def _sql_query_builder(topic: ValidTopics) -> str:
+    if topic == ValidTopics.fiction:
+        table, hashes_table = "fiction", "fiction_hashes"
+    else:
+        table, hashes_table = "updated", "hashes"
+
+    return f"""SELECT M.Author, M.Title, M.Extension, H.ipfs_cid FROM {table} as M
+    INNER JOIN {hashes_table} as H ON H.md5 = M.MD5
+    WHERE M.MD5 = %s LIMIT 1"""
+
+
+async def get_local_download_links(md5: str, topic: ValidTopics) -> dict[str, str]:
+    """
+    Returns the IPFS mirrors' links for this md5, or an empty dict if it has no known CID.
+    """
+    try:
+        async with MySQLConnect() as cursor:
+            await cursor.execute(_sql_query_builder(topic), args=(md5,))
+            result = await cursor.fetchone()
+    except Error as e:
+        logger.error(e)
+        return {}
+
+    if not result or not result.get("ipfs_cid"):
+        return {}
+
+    filename = make_filename(result.get("Author"), result.get("Title"), result.get("Extension"))
+    return make_ipfs_links(result.get("ipfs_cid"), filename)
@@ -0,0 +1,54 @@
+import httpx
+from grab_fork_from_libgen.exceptions import MetadataError
+
+from config.http_client import get_http_client
+from services.search.extraction_functions import run_extraction, extract_download_links, extract_librocks_cover
+
+# These are ports of grab_fork_from_libgen's AIOMetadata methods that use our shared http client,
+# since AIOMetadata creates a new session for every call.
+# They raise MetadataError, just like the originals.
+
+liblol_base = "http://library.lol"
+librocks_base = "http://libgen.rocks/ads.php?md5="
+
+
+class PageNotFoundError(MetadataError):
+    """
+    Libgen answered, but there's no page for the given md5.
+    Unlike other MetadataErrors, retrying won't help.
+    """
+
+
+async def _get_page(url: str, timeout: int) -> str:
+    http_client = get_http_client()
+    try:
+        page = await http_client.get(url, timeout=timeout)
+        page.raise_for_status()
+    except httpx.HTTPStatusError as err:
+        if err.response.status_code == 404:
+            raise PageNotFoundError("No page found for this md5: ", err)
+        raise MetadataError("Error while connecting to Libgen: ", err)
+    except httpx.HTTPError as err:
+        raise MetadataError("Error while connecting to Libgen: ", err)
+
+    return page.text
+
+
+async def scrape_download_links(md5: str, topic: str, timeout: int = 30) -> dict:
+    if topic == "sci-tech":
+        topic_url = "/main/"
+    elif topic == "fiction":
+        topic_url = "/fiction/"
+    else:
+        raise MetadataError('Topic is not valid. Valid topics are "fiction" and "sci-tech".')
+
+    page = await _get_page(liblol_base + topic_url + md5, timeout)
+    return await run_extraction(extract_download_links, page)
+
+
+async def scrape_librocks_cover(md5: str, timeout: int = 20) -> str:
+    page = await _get_page(librocks_base + md5, timeout)
+    cover_src = await run_extraction(extract_librocks_cover, page)
+    if cover_src is None:
+        raise MetadataError("Could not find cover for this specific md5.")
+    return f"https://libgen.rocks{cover_src}"
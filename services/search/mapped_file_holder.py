@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger("biblioterra")
+
+
+class MappedFileHolder(Generic[T]):
+    """
+    Keeps the current version of an offline built file loaded, and reloads it when the file changes.
+    Builders replace these files atomically, so a loaded (memory mapped) version stays valid until it's swapped.
+    """
+
+    def __init__(self, path: str, loader: Callable[[str], T]):
+        self.path = path
+        self.loader = loader
+        self.current: T | None = None
+        self.mtime: float | None = None
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+
+        if mtime == self.mtime:
+            return
+
+        try:
+            self.current = self.loader(self.path)
+            self.mtime = mtime
+            logger.info(f"Loaded {self.path}.")
+        except (OSError, ValueError) as e:
+            logger.error(e)
+
+    async def refresh_periodically(self, interval: int):
+        while True:
+            self.refresh()
+            await asyncio.sleep(interval)
@@ -0,0 +1,139 @@
+import math
+import mmap
+import os
+import struct
+from typing import Iterable
+
+from fastapi import HTTPException
+
+from keys import md5_filter_path
+from services.metrics.metrics_functions import increment_counter
+from services.search.mapped_file_holder import MappedFileHolder
+
+# A Bloom filter of every md5 in the "fiction" and "updated" tables.
+# It's built offline by scripts/build_md5_filter.py and memory mapped, so all workers share the same pages.
+# md5s are already uniformly distributed, so their own bytes are used as the filter's hashes.
+#
+# File layout (little endian):
+#   magic (8 bytes) | number of bits (uint64) | number of hashes (uint32) | number of items (uint64) | bits
+
+_magic = b"BTMD5BF1"
+_header = struct.Struct("<8sQIQ")
+_md5_halves = struct.Struct("<QQ")
+
+md5_filter_refresh_interval = 300
+
+
+class MD5Filter:
+    def __init__(self, bits, num_bits: int, num_hashes: int, num_items: int):
+        self.bits = bits
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.num_items = num_items
+
+    @staticmethod
+    def optimal_size(expected_items: int, false_positive_rate: float) -> tuple[int, int]:
+        """
+        Returns the number of bits and hashes for the expected items and false positive rate.
+        """
+        expected_items = max(expected_items, 1)
+        num_bits = math.ceil(-expected_items * math.log(false_positive_rate) / (math.log(2) ** 2))
+        # Rounds up to a whole byte.
+        num_bits = (num_bits + 7) // 8 * 8
+        num_hashes = max(1, round(num_bits / expected_items * math.log(2)))
+        return num_bits, num_hashes
+
+    def _positions(self, md5: bytes):
+        # Double hashing, using both halves of the md5 as the two base hashes.
+        first, second = _md5_halves.unpack(md5)
+        second |= 1
+        for i in range(self.num_hashes):
+            yield (first + i * second) % self.num_bits
+
+    @staticmethod
+    def md5_as_bytes(md5: str) -> bytes | None:
+        try:
+            md5_bytes = bytes.fromhex(md5)
+        except (ValueError, TypeError):
+            return None
+        return md5_bytes if len(md5_bytes) == 16 else None
+
+    def add(self, md5: str):
+        md5_bytes = self.md5_as_bytes(md5)
+        if md5_bytes is None:
+            return
+        for position in self._positions(md5_bytes):
+            self.bits[_header.size + position // 8] |= 1 << (position % 8)
+        self.num_items += 1
+
+    def __contains__(self, md5: str) -> bool:
+        md5_bytes = self.md5_as_bytes(md5)
+        if md5_bytes is None:
+            return False
+        bits = self.bits
+        for position in self._positions(md5_bytes):
+            if not bits[_header.size + position // 8] & (1 << (position % 8)):
+                return False
+        return True
+
+    @classmethod
+    def empty(cls, expected_items: int, false_positive_rate: float = 0.001) -> "MD5Filter":
+        num_bits, num_hashes = cls.optimal_size(expected_items, false_positive_rate)
+        return cls(bytearray(_header.size + num_bits // 8), num_bits, num_hashes, 0)
+
+    @classmethod
+    def build(cls, md5s: Iterable[str], expected_items: int, false_positive_rate: float = 0.001) -> "MD5Filter":
+        md5_filter = cls.empty(expected_items, false_positive_rate)
+        for md5 in md5s:
+            md5_filter.add(md5)
+        return md5_filter
+
+    def save(self, path: str):
+        # Written to a temporary file first, so workers never map a half written filter.
+        temp_path = f"{path}.{os.getpid()}.part"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _header.pack_into(self.bits, 0, _magic, self.num_bits, self.num_hashes, self.num_items)
+        with open(temp_path, "wb") as fo:
+            fo.write(self.bits)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MD5Filter":
+        with open(path, "rb") as fo:
+            bits = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, num_bits, num_hashes, num_items = _header.unpack_from(bits, 0)
+        if magic != _magic or len(bits) != _header.size + num_bits // 8:
+            bits.close()
+            raise ValueError(f"{path} is not a valid md5 filter.")
+        return cls(bits, num_bits, num_hashes, num_items)
+
+
+class MD5FilterHolder(MappedFileHolder[MD5Filter]):
+    """
+    If there's no filter, every md5 is assumed to exist.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path, MD5Filter.load)
+
+    @property
+    def md5_filter(self) -> MD5Filter | None:
+        return self.current
+
+    def might_exist(self, md5: str) -> bool:
+        if self.current is None:
+            return True
+        return md5 in self.current
+
+
+md5_filter_holder = MD5FilterHolder(md5_filter_path)
+
+
+async def reject_unknown_md5(md5: str):
+    """
+    Dependency for md5 keyed routes. Rejects md5s that are definitely not in Libgen before doing any I/O.
+    """
+    if not md5_filter_holder.might_exist(md5):
+        increment_counter("md5_filter.rejected")
+        raise HTTPException(400, "No file with the given MD5 exists in Libgen.")
@@ -2,7 +2,11 @@ import json
 
 from grab_fork_from_libgen import AIOMetadata
 from grab_fork_from_libgen.exceptions import MetadataError
+from models.body_models import normalize_md5
 from models.response_models import LegacyMetadataResponse, DownloadLinksResponse
+from services.cache.negative_cache import NegativeCache
+from services.search.ipfs_functions import get_local_download_links
+from services.search.libgen_functions import scrape_librocks_cover, scrape_download_links, PageNotFoundError
 from pydantic import ValidationError
 from keys import redis_provider
 from fastapi import HTTPException
@@ -10,6 +14,7 @@ import aioredis
 
 
 async def get_cover(md5: str):
+    md5 = normalize_md5(md5)
 
     try:
         # This environment key is for Heroku Redis.
@@ -28,15 +33,8 @@ async def get_cover(md5: str):
             await redis.close()
             return possible_cover, cached
 
-    # AIOMetadata has good error handling.
     try:
-        meta = AIOMetadata(timeout=20)
-    except MetadataError as err:
-        # There's little chance this error will actually be raised, since "sci-tech" is always valid.
-        raise HTTPException(400, str(err))
-
-    try:
-        cover = await meta.get_cover(md5)
+        cover = await scrape_librocks_cover(md5)
         if redis:
             # Expires in 14 days
             await redis.set(f"cover:{md5}", cover, ex=14 * 86400)
@@ -50,6 +48,7 @@ async def get_cover(md5: str):
 async def get_metadata(topic: str, md5: str):
     # The cache implementation works like this:
     # For 72 hours, a book will be cached in redis, after this, it will be removed.
+    md5 = normalize_md5(md5)
 
     try:
         # This environment key is for Heroku Redis.
@@ -101,7 +100,24 @@ async def get_metadata(topic: str, md5: str):
         raise HTTPException(500, "Error validating metadata.")
 
 
+async def _scrape_dlinks(md5: str, topic: str) -> dict | None:
+    """
+    Returns the links on library.lol's page, an empty dict if it has no page for this md5, or None if it failed.
+    """
+    try:
+        return await scrape_download_links(md5, topic)
+    except PageNotFoundError:
+        return {}
+    except MetadataError:
+        return None
+
+
 async def get_dlinks(md5: str, topic: str) -> [dict, str]:
+    md5 = normalize_md5(md5)
+    # Known missing md5s are answered before any cache or database lookup.
+    negative_cache = NegativeCache("dlinks")
+    await negative_cache.raise_if_cached(md5)
+
     try:
         # This environment key is for Heroku Redis.
         redis = aioredis.from_url(redis_provider, decode_responses=True)
@@ -125,13 +141,27 @@ async def get_dlinks(md5: str, topic: str) -> [dict, str]:
             except (ValidationError, TypeError):
                 pass
 
+    # IPFS links are built from our own database, so md5s with a CID are answered without reaching library.lol.
+    # GET, which needs a live key, is only scraped by make_temp_download, once these links have failed.
+    dlinks: dict = await get_local_download_links(md5, topic)
+    if not dlinks:
+        dlinks = await _scrape_dlinks(md5, topic)
+        if dlinks is None:
+            raise HTTPException(500, "Couldn't retrieve download links for this book")
+
     try:
-        meta = AIOMetadata(timeout=30)
-        dlinks: dict = await meta.get_download_links(md5, topic)
         f_dlinks = DownloadLinksResponse(**dlinks)
-    except (MetadataError, ValidationError):
-        raise HTTPException(500, "Couldn't retrieve download links for this book")
-    if redis and bool(f_dlinks.dict()):
+    except ValidationError:
+        f_dlinks = None
+
+    if f_dlinks is None or not any(f_dlinks.dict().values()):
+        # Libgen has no page, or no download links, for this md5.
+        not_found = HTTPException(400, "Couldn't find download links for this md5.")
+        await negative_cache.save(md5, not_found)
+        raise not_found
+
+    if redis:
+        # Expires in 5 days
         await redis.set(f"dlinks-{md5}", json.dumps(dlinks), ex=5 * 86400)
     cached = "false"
     return f_dlinks.dict(by_alias=True), cached
@@ -0,0 +1,132 @@
+import json
+import logging
+from urllib.parse import urlparse
+
+from aioredis import RedisError
+from pydantic import BaseModel, ValidationError
+
+from config.redis_connection import RedisConnection
+
+logger = logging.getLogger("biblioterra")
+
+
+class MirrorStats(BaseModel):
+    # All values are exponentially weighted moving averages (EWMA).
+    # latency is measured in seconds, throughput in bytes per second and error_rate goes from 0 to 1.
+    latency: float | None = None
+    throughput: float | None = None
+    error_rate: float = 0.0
+    samples: int = 0
+
+
+class MirrorScoreboard:
+    """
+    Keeps track of each download mirror's health, so we can try the fastest mirror first.
+    Stats are saved on Redis, so all workers share the same scoreboard.
+    Updates are read-modify-write and not atomic, losing a sample to a concurrent update is harmless for an EWMA.
+    """
+
+    # Weight given to the newest sample.
+    alpha = 0.3
+    # Used to estimate how long a typical book would take to download from a mirror.
+    reference_size = 5 * 1024 * 1024
+    # Mirrors we have never tried are given these values, so they still get a chance.
+    default_latency = 1.0
+    default_throughput = 512 * 1024
+
+    def __init__(self):
+        self.redis_key = "mirror-scoreboard"
+
+    @staticmethod
+    def host_of(link: str) -> str:
+        return urlparse(link).netloc.lower()
+
+    def _ewma(self, old: float | None, new: float) -> float:
+        if old is None:
+            return new
+        return self.alpha * new + (1 - self.alpha) * old
+
+    def apply_success(self, stats: MirrorStats, latency: float, throughput: float | None) -> MirrorStats:
+        stats.latency = self._ewma(stats.latency, latency)
+        if throughput is not None:
+            stats.throughput = self._ewma(stats.throughput, throughput)
+        stats.error_rate = self._ewma(stats.error_rate, 0.0)
+        stats.samples += 1
+        return stats
+
+    def apply_failure(self, stats: MirrorStats) -> MirrorStats:
+        stats.error_rate = self._ewma(stats.error_rate, 1.0)
+        stats.samples += 1
+        return stats
+
+    def score(self, stats: MirrorStats | None) -> float:
+        """
+        Estimated seconds needed to download a reference sized book from a mirror. Lower is better.
+        Mirrors that fail often are penalized by their chance of success.
+        """
+        if stats is None:
+            stats = MirrorStats()
+
+        latency = stats.latency if stats.latency is not None else self.default_latency
+        throughput = stats.throughput if stats.throughput else self.default_throughput
+        expected_time = latency + self.reference_size / throughput
+        success_rate = max(1 - stats.error_rate, 0.01)
+        return expected_time / success_rate
+
+    async def _get_all_stats(self) -> dict[str, MirrorStats]:
+        raw_stats: dict = {}
+        try:
+            async with RedisConnection() as redis:
+                raw_stats = await redis.hgetall(self.redis_key)
+        except (RedisError, ConnectionError) as e:
+            logger.warning(e)
+            return {}
+
+        all_stats = {}
+        for host, value in (raw_stats or {}).items():
+            if isinstance(host, bytes):
+                host = host.decode()
+            try:
+                all_stats[host] = MirrorStats(**json.loads(value))
+            except (ValidationError, TypeError, ValueError):
+                continue
+
+        return all_stats
+
+    async def _update_stats(self, link: str, success: bool, latency: float = None, throughput: float = None):
+        host = self.host_of(link)
+        try:
+            async with RedisConnection() as redis:
+                raw_stats = await redis.hget(self.redis_key, host)
+                try:
+                    stats = MirrorStats(**json.loads(raw_stats)) if raw_stats else MirrorStats()
+                except (ValidationError, TypeError, ValueError):
+                    stats = MirrorStats()
+
+                if success:
+                    stats = self.apply_success(stats, latency, throughput)
+                else:
+                    stats = self.apply_failure(stats)
+
+                await redis.hset(self.redis_key, host, stats.json())
+        except (RedisError, ConnectionError) as e:
+            logger.warning(e)
+
+    async def record_success(self, link: str, latency: float, total_time: float, size: int):
+        transfer_time = total_time - latency
+        throughput = size / transfer_time if transfer_time > 0 and size > 0 else None
+        await self._update_stats(link, True, latency, throughput)
+
+    async def record_failure(self, link: str):
+        await self._update_stats(link, False)
+
+    async def rank_links(self, d_links: dict) -> dict:
+        """
+        Returns a copy of d_links ordered from the best to the worst mirror.
+        Empty links are kept at the end.
+        """
+        all_stats = await self._get_all_stats()
+        valid_links = [(name, link) for name, link in d_links.items() if link]
+        empty_links = [(name, link) for name, link in d_links.items() if not link]
+        valid_links.sort(key=lambda item: self.score(all_stats.get(self.host_of(item[1]))))
+        return dict(valid_links + empty_links)
@@ -0,0 +1,136 @@
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+import aiofiles
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel
+
+# Only single byte ranges are supported, e.g. "bytes=0-499", "bytes=500-" or "bytes=-500".
+# Requests with multiple ranges are answered with the full file, which the RFC allows.
+range_reg = re.compile(r"^bytes=(\d*)-(\d*)$")
+range_chunk_size = 64 * 1024
+
+
+class ByteRange(BaseModel):
+    # Both start and end are inclusive, like in the Content-Range header.
+    start: int
+    end: int
+
+    @property
+    def length(self):
+        return self.end - self.start + 1
+
+
+def parse_range_header(range_header: str | None, file_size: int) -> ByteRange | None:
+    """
+    Returns the requested ByteRange, or None if the whole file should be sent.
+    Raises a 416 HTTPException if the range can't be satisfied.
+    """
+    if range_header is None:
+        return None
+
+    range_match = range_reg.match(range_header.strip())
+    if range_match is None:
+        # Malformed or multiple ranges are ignored.
+        return None
+
+    first, last = range_match.groups()
+    if first == "" and last == "":
+        return None
+
+    if first == "":
+        # Suffix range, the last N bytes of the file.
+        suffix_length = int(last)
+        if suffix_length == 0 or file_size == 0:
+            raise HTTPException(416, "Requested range not satisfiable.",
+                                headers={"Content-Range": f"bytes */{file_size}"})
+        start = max(file_size - suffix_length, 0)
+        end = file_size - 1
+    else:
+        start = int(first)
+        end = int(last) if last != "" else file_size - 1
+        if last != "" and end < start:
+            return None
+        if start >= file_size:
+            raise HTTPException(416, "Requested range not satisfiable.",
+                                headers={"Content-Range": f"bytes */{file_size}"})
+        end = min(end, file_size - 1)
+
+    return ByteRange(start=start, end=end)
+
+
+def is_if_range_valid(if_range: str | None, etag: str, last_modified: float) -> bool:
+    """
+    Checks the If-Range header. If it doesn't match the current file, the Range header must be ignored.
+    """
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Weak ETags can't be used with If-Range.
+        return if_range == etag
+
+    try:
+        if_range_date = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+
+    return int(last_modified) <= int(if_range_date.timestamp())
+
+
+def _weak_etag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_not_modified(if_none_match: str | None, etag: str) -> bool:
+    """
+    Checks the If-None-Match header, which can be "*" or a list of (possibly weak) ETags.
+    If-None-Match uses the weak comparison, so W/"a" matches "a".
+    """
+    if if_none_match is None:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+    return _weak_etag(etag) in {_weak_etag(tag) for tag in if_none_match.split(",")}
+
+
+async def _file_range_iterator(path: str, byte_range: ByteRange):
+    async with aiofiles.open(path, "rb") as fo:
+        await fo.seek(byte_range.start)
+        remaining = byte_range.length
+        while remaining > 0:
+            chunk = await fo.read(min(range_chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def make_range_response(request: Request, path: str, etag: str, media_type: str):
+    """
+    Returns a FileResponse, or a 206 partial response if the request has a valid Range header.
+    """
+    stat_result = os.stat(path)
+    file_size = stat_result.st_size
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+    }
+
+    byte_range = None
+    if is_if_range_valid(request.headers.get("if-range"), etag, stat_result.st_mtime):
+        byte_range = parse_range_header(request.headers.get("range"), file_size)
+
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+    headers["Content-Range"] = f"bytes {byte_range.start}-{byte_range.end}/{file_size}"
+    headers["Content-Length"] = str(byte_range.length)
+    return StreamingResponse(_file_range_iterator(path, byte_range), status_code=206,
+                             media_type=media_type, headers=headers)
@@ -13,6 +13,7 @@ from config.redis_connection import RedisConnection
 from models.body_models import SearchEntry
 from models.query_models import ValidTopics, SearchQuery, ValidCriteria
 from models.response_models import SearchPaginationInfo, SearchResponse
+from services.cache.negative_cache import NegativeCache
 
 
 class SQLData(BaseModel):
@@ -170,6 +171,7 @@ class SearchService:
         self.pagination_sql = sql_handler.pagination_sql
         self.placeholder_values = sql_handler.placeholder_values
         self.pagination_placeholder_values = sql_handler.pagination_placeholder_values
+        self.negative_cache = NegativeCache("search")
 
     @staticmethod
     def bytes_to_size(size_to_convert: int | str):
@@ -380,6 +382,9 @@ class SearchService:
             return results
 
     async def make_search(self) -> list[SearchEntry]:
+        negative_cache_key = f"{json.dumps(self.query.dict())}-{self.topic}"
+        await self.negative_cache.raise_if_cached(negative_cache_key)
+
         try:
             results = await self._find_on_database()
         except Error as e:
@@ -388,7 +393,9 @@ class SearchService:
 
         # Equivalent to "is None or len() == 0".
         if not bool(results):
-            raise HTTPException(400, "No entry found for the given query. Please check query parameters.")
+            no_results = HTTPException(400, "No entry found for the given query. Please check query parameters.")
+            await self.negative_cache.save(negative_cache_key, no_results)
+            raise no_results
 
         results_as_models = self._list_as_models(results)
 
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable
+
+import aioredis
+from aioredis import RedisError
+from fastapi import HTTPException
+
+from config.redis_connection import RedisConnection
+from keys import redis_provider
+from models.body_models import normalize_md5
+from services.metrics.metrics_functions import increment_counter
+
+# Live comment updates. Writes publish an event on the md5's Redis channel, and each worker has a single
+# pattern subscription that fans the events out to the md5's open connections (e.g. the SSE route).
+# Events are only hints: clients that miss some (reconnecting, lagging behind) should fetch the comments again.
+
+comment_events_channel_prefix = "comment-events:"
+
+
+async def publish_comment_event(md5: str, event_type: str, entry_id: str, parent_id: str | None = None, **data):
+    """
+    event_type is one of: comment_added, comment_updated, comment_removed, reply_added, reply_updated,
+    reply_removed, upvote_added or upvote_removed.
+    """
+    md5 = normalize_md5(md5)
+    event = {"type": event_type, "md5": md5, "id": entry_id, "parent_id": parent_id, **data}
+    try:
+        async with RedisConnection() as redis:
+            await redis.publish(f"{comment_events_channel_prefix}{md5}", json.dumps(event))
+    except RedisError as e:
+        logging.getLogger("biblioterra").warning(e)
+
+
+class CommentSubscription:
+    """
+    A single connection's events. Its queue is bounded: a connection that falls too far behind is closed,
+    instead of holding an ever-growing backlog.
+    """
+
+    def __init__(self, md5: str, max_queued: int):
+        self.md5 = md5
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(max_queued)
+        self.overflowed = False
+
+    def push(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def next_event(self, timeout: float) -> dict | None:
+        """
+        Returns the next event, or None if none arrives in "timeout" seconds.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class CommentEventHub:
+    def __init__(self, max_subscriptions: int = 1000, max_queued: int = 100, retry_interval: int = 5):
+        self.logger = logging.getLogger("biblioterra")
+        self.max_subscriptions = max_subscriptions
+        self.max_queued = max_queued
+        self.retry_interval = retry_interval
+        self.subscriptions: dict[str, set[CommentSubscription]] = {}
+
+    def __len__(self):
+        return sum(len(subscriptions) for subscriptions in self.subscriptions.values())
+
+    def raise_if_full(self):
+        """
+        Raises a 503 if this worker already has too many open subscriptions.
+        """
+        if len(self) >= self.max_subscriptions:
+            increment_counter("comment_events.rejected")
+            raise HTTPException(503, "Too many live connections right now, try again later.")
+
+    def subscribe(self, md5: str) -> CommentSubscription | None:
+        """
+        Returns None if this worker already has too many open subscriptions.
+        """
+        if len(self) >= self.max_subscriptions:
+            increment_counter("comment_events.rejected")
+            return None
+
+        md5 = normalize_md5(md5)
+        subscription = CommentSubscription(md5, self.max_queued)
+        self.subscriptions.setdefault(md5, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: CommentSubscription):
+        md5_subscriptions = self.subscriptions.get(subscription.md5)
+        if md5_subscriptions is None:
+            return
+        md5_subscriptions.discard(subscription)
+        if not md5_subscriptions:
+            del self.subscriptions[subscription.md5]
+
+    def dispatch(self, event: dict):
+        for subscription in self.subscriptions.get(event.get("md5"), ()):
+            if subscription.overflowed:
+                continue
+            subscription.push(event)
+            if subscription.overflowed:
+                increment_counter("comment_events.overflowed")
+
+    async def stream(self, md5: str, is_disconnected: Callable[[], Awaitable[bool]],
+                     keepalive_interval: float = 15) -> AsyncIterator[str]:
+        """
+        Yields the md5's events in the Server-Sent Events format, until the client disconnects.
+        A "resync" event, sent before closing, means the client fell behind and should fetch the comments again.
+        """
+        # Subscribed here, so a stream that's never started never holds a subscription.
+        subscription = self.subscribe(md5)
+        if subscription is None:
+            # Other connections took the last subscriptions after the route checked for them.
+            return
+
+        try:
+            yield "retry: 5000\n\n"
+            while not await is_disconnected():
+                if subscription.overflowed:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+
+                event = await subscription.next_event(keepalive_interval)
+                if event is None:
+                    # Keeps proxies from closing idle connections.
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def _handle_message(self, message: dict | None):
+        if message is None or message.get("type") != "pmessage":
+            return
+        try:
+            self.dispatch(json.loads(message["data"]))
+        except (ValueError, TypeError) as e:
+            self.logger.warning(e)
+
+    async def listen(self):
+        """
+        Receives every md5's events from Redis for as long as it runs, reconnecting when the connection is lost.
+        """
+        if redis_provider is None:
+            self.logger.warning("REDIS_URL is not set, live comment events are disabled.")
+            return
+
+        while True:
+            # A dedicated client, since RedisConnection would also swallow this task's cancellation.
+            redis = aioredis.from_url(redis_provider)
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.psubscribe(f"{comment_events_channel_prefix}*")
+                while True:
+                    self._handle_message(await pubsub.get_message(ignore_subscribe_messages=True, timeout=1))
+            except RedisError as e:
+                self.logger.warning(e)
+            finally:
+                await pubsub.close()
+                await redis.close()
+
+            await asyncio.sleep(self.retry_interval)
+
+
+comment_event_hub = CommentEventHub()
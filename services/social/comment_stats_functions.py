@@ -0,0 +1,94 @@
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from config.mongodb_connection import mongodb_comment_stats_connect, mongodb_comment_entries_connect
+from models.body_models import date_format
+from models.response_models import CommentStats
+
+# Each md5's comment and rating totals, kept up to date by CommentsService's writes, so books' ratings can be shown
+# without reading their comments. Documents are keyed by md5 ("_id"), so looking up many of them is one indexed query.
+# scripts/rebuild_comment_stats.py recomputes them from the comments themselves.
+
+
+async def update_comment_stats(md5: str, comments: int = 0, replies: int = 0, rating_sum: int = 0,
+                               rating_count: int = 0):
+    # Stats are secondary data, a failed update shouldn't fail the write that caused it.
+    try:
+        await mongodb_comment_stats_connect().update_one(
+            {"_id": md5},
+            {"$inc": {"comment_count": comments, "reply_count": replies, "rating_sum": rating_sum,
+                      "rating_count": rating_count},
+             "$max": {"last_activity": datetime.utcnow()}},
+            upsert=True)
+    except PyMongoError as e:
+        logging.getLogger("biblioterra").error(e)
+
+
+def document_as_stats(md5: str, document: dict | None) -> CommentStats:
+    if document is None:
+        return CommentStats(md5=md5)
+
+    rating_count = document.get("rating_count", 0)
+    last_activity = document.get("last_activity")
+    return CommentStats(
+        md5=md5,
+        comment_count=document.get("comment_count", 0),
+        reply_count=document.get("reply_count", 0),
+        rating_count=rating_count,
+        average_rating=round(document.get("rating_sum", 0) / rating_count, 2) if rating_count > 0 else None,
+        last_activity=last_activity.strftime(date_format) if isinstance(last_activity, datetime) else None,
+    )
+
+
+async def get_comment_stats(md5s: list[str]) -> list[CommentStats]:
+    """
+    Returns the stats of each given md5, in the same order. md5s without comments have empty stats.
+    """
+    documents = {}
+    async for document in mongodb_comment_stats_connect().find({"_id": {"$in": md5s}}):
+        documents[document["_id"]] = document
+
+    return [document_as_stats(md5, documents.get(md5)) for md5 in md5s]
+
+
+# Groups comment_entries by md5, with the same fields update_comment_stats() maintains.
+rebuild_pipeline = [
+    {"$group": {
+        "_id": "$md5",
+        "comment_count": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$parent_id", None]}, None]}, 1, 0]}},
+        "reply_count": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$parent_id", None]}, None]}, 0, 1]}},
+        "rating_sum": {"$sum": {"$ifNull": ["$rating", 0]}},
+        "rating_count": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$rating", None]}, None]}, 0, 1]}},
+        "last_activity": {"$max": "$modified_at"},
+    }},
+]
+
+
+async def rebuild_comment_stats() -> int:
+    """
+    Recomputes every md5's stats from its comments. Returns the number of md5s with comments.
+    Writes made while it runs may be counted twice or not at all, so it's meant to be run on quiet hours.
+    """
+    rebuild_start = datetime.utcnow()
+    stats_collection = mongodb_comment_stats_connect()
+    requests = []
+    async for stats in mongodb_comment_entries_connect().aggregate(rebuild_pipeline, allowDiskUse=True):
+        md5 = stats.pop("_id")
+        stats["rebuilt_at"] = rebuild_start
+        requests.append(UpdateOne({"_id": md5}, {"$set": stats}, upsert=True))
+        if len(requests) >= 1000:
+            await stats_collection.bulk_write(requests, ordered=False)
+            requests = []
+
+    if requests:
+        await stats_collection.bulk_write(requests, ordered=False)
+
+    # md5s that no longer have comments weren't in the aggregation, so their stats are left from a previous one.
+    await stats_collection.delete_many({"$or": [
+        {"rebuilt_at": {"$lt": rebuild_start}},
+        {"rebuilt_at": {"$exists": False}, "last_activity": {"$lt": rebuild_start}},
+    ]})
+    return await stats_collection.count_documents({"comment_count": {"$gt": 0}})
@@ -1,47 +1,63 @@
-from typing import Iterable
+import hashlib
+import json
 
 import logging
 from bson import ObjectId
+from bson.errors import InvalidId
 from fastapi import HTTPException, Query
 from pydantic import ValidationError
+from pymongo.errors import PyMongoError, OperationFailure, DuplicateKeyError
 
-from config.mongodb_connection import mongodb_comments_connect
+from config.mongodb_connection import mongodb_comment_entries_connect
 from models.body_models import IdentifiedComment, Comment, Reply, IdentifiedReply, ReplyUpdateRequest, \
     CommentUpdateRequest, date_format, md5_reg
 from datetime import datetime
 
 from models.query_models import CommentsQuery, CommentSort, SortMode
+from services.cache.comments_cache import CommentsCache
+from services.cursor_functions import encode_cursor, decode_cursor, cursor_filter, sort_documents, is_after_cursor
+from services.social.comment_events import publish_comment_event
+from services.social.comment_stats_functions import update_comment_stats
+
+
+# Entries with no date are given this one, which makes them appear last in the sorting.
+_fallback_date = datetime(2000, 1, 1)
 
 
 class CommentSortingService:
     """
-    Internal class used to provide methods for sorting comments and replies.
+    Internal class used to provide methods for sorting comments and replies in Python, once in the API's format.
+    Comments are sorted by the database, or by their documents' (sort_field, _id) order when it can't.
     """
 
     @staticmethod
-    def _str_to_datetime(created_at: str | None):
-        # Meant to be used as a map(), sort() or similar function.
-        # Entries with no date are given a temporary one, this makes them appear last in the sorting.
-        temp_date = datetime.strptime("2000-01-01T00:00:00Z", date_format)
+    def _str_to_datetime(created_at: str | datetime | None) -> datetime:
+        if isinstance(created_at, datetime):
+            return created_at
+        if not isinstance(created_at, str):
+            return _fallback_date
+
         try:
-            if created_at is None:
-                created_at = temp_date
-            elif isinstance(created_at, str):
-                created_at = datetime.strptime(created_at, date_format)
-        except BaseException as e:
-            pass
-        return created_at
+            # Much faster than strptime for our date_format, which is ISO 8601 with a "Z" suffix.
+            return datetime.fromisoformat(created_at.removesuffix("Z"))
+        except ValueError:
+            return _fallback_date
 
     def _datetime_as_key(self, item: dict):
-        return self._str_to_datetime(item["created_at"])
+        return self._str_to_datetime(item.get("created_at"))
 
     @staticmethod
     def _upvotes_as_key(item: dict):
-        return len(item["upvotes"])
+        upvote_count = item.get("upvote_count")
+        if upvote_count is None:
+            upvote_count = len(item.get("upvotes") or [])
+        return upvote_count
 
     @staticmethod
     def _rating_as_key(item: dict):
-        return item["rating"]
+        # Comments without rating appear last in descending order, like they do in the database.
+        rating = item.get("rating")
+        return -1 if rating is None else rating
 
     @staticmethod
     def _select_sort_mode(sort_mode: SortMode):
@@ -54,9 +70,10 @@ class CommentSortingService:
     def sort_comments(self, comments: list[dict], query: CommentsQuery):
         sort_mode = self._select_sort_mode(query.mode)
 
+        # list.sort() calls the key function once per item, so each date is only parsed once.
         if query.sort is None or query.sort == CommentSort.date:
             comments.sort(key=self._datetime_as_key, reverse=sort_mode)
-        if query.sort == CommentSort.upvotes:
+        elif query.sort == CommentSort.upvotes:
             comments.sort(key=self._upvotes_as_key, reverse=sort_mode)
         elif query.sort == CommentSort.rating:
             comments.sort(key=self._rating_as_key, reverse=sort_mode)
@@ -78,32 +95,103 @@ class CommentSortingService:
                 comment_replies.sort(key=self._upvotes_as_key, reverse=sort_mode)
 
 
+# Each comment and each reply is it's own document in the "comment_entries" collection.
+# Comments have a null parent_id, replies have their comment's id. So the same indexes serve both.
+comment_indexes = [
+    [("md5", 1), ("parent_id", 1), ("created_at", -1), ("_id", -1)],
+    [("md5", 1), ("parent_id", 1), ("upvote_count", -1), ("_id", -1)],
+    [("md5", 1), ("parent_id", 1), ("rating", -1), ("_id", -1)],
+]
+
+
+def entry_fingerprint(username: str, content: str, rating: int | None, parent_id: str | None) -> str:
+    """
+    Identifies a comment's or reply's content, two entries with the same fingerprint on a md5 are duplicates.
+    """
+    fields = json.dumps([username, content, rating, parent_id])
+    return hashlib.sha256(fields.encode()).hexdigest()
+
+
+async def create_comment_indexes():
+    # create_index does nothing if the index already exists.
+    connection = mongodb_comment_entries_connect()
+    for index_keys in comment_indexes:
+        await connection.create_index(index_keys)
+    # Rejects duplicated entries on insert. Entries without a fingerprint (duplicates from before it existed,
+    # or edited into another entry's content) are left out of it.
+    await connection.create_index([("md5", 1), ("fingerprint", 1)], unique=True,
+                                  partialFilterExpression={"fingerprint": {"$exists": True}})
+
+
+comment_sort_fields = {
+    CommentSort.date: "created_at",
+    CommentSort.upvotes: "upvote_count",
+    CommentSort.rating: "rating",
+}
+
+
 class CommentsService:
+    # Times an edit is retried when the entry changes between reading it and writing the update.
+    update_attempts = 3
 
     def __init__(self, md5: str = Query(..., regex=md5_reg)):
-        self.db_connection = mongodb_comments_connect()
+        self.db_connection = mongodb_comment_entries_connect()
         self.md5 = md5
         self.logger = logging.getLogger("biblioterra")
-        self.sorting_service = CommentSortingService()
+        self.cache = CommentsCache(md5)
 
     @staticmethod
-    def _append_dates(entry: IdentifiedComment | IdentifiedReply):
-        # This method is extremely important. All comments/replies should have proper dates attached for the
-        # sorting by date algorithm to work.
-
-        # Appends modified_at
-        if entry.modified_at is None and entry.created_at is not None:
-            if isinstance(entry.modified_at, datetime):
-                pass
-            else:
-                entry.modified_at = datetime.utcnow().strftime(date_format)
-
-        # Appends created_at
-        if entry.created_at is None:
-            if isinstance(entry.modified_at, datetime):
-                pass
-            else:
-                entry.created_at = datetime.utcnow().strftime(date_format)
+    def _as_object_id(entry_id: str) -> ObjectId:
+        try:
+            return ObjectId(entry_id)
+        except (InvalidId, TypeError):
+            raise HTTPException(400, "Invalid comment or reply id.")
+
+    @staticmethod
+    def _datetime_to_str(date: datetime | None):
+        if not isinstance(date, datetime):
+            return date
+        return date.strftime(date_format)
+
+    def _document_as_entry(self, document: dict) -> dict:
+        """
+        Converts a comment_entries document to the comment (or reply) format returned by the API.
+        """
+        entry = {
+            "id": str(document["_id"]),
+            "username": document.get("username"),
+            "content": document.get("content"),
+            "upvotes": document.get("upvotes", []),
+            "created_at": self._datetime_to_str(document.get("created_at")),
+            "modified_at": self._datetime_to_str(document.get("modified_at")),
+        }
+        if document.get("parent_id") is None:
+            entry["rating"] = document.get("rating")
+            entry["attached_responses"] = []
+        else:
+            entry["parent_id"] = document.get("parent_id")
+
+        return entry
+
+    def _entry_as_document(self, entry: IdentifiedComment | IdentifiedReply) -> dict:
+        now = datetime.utcnow()
+        document = {
+            "_id": ObjectId(entry.id),
+            "md5": self.md5,
+            "parent_id": entry.parent_id if isinstance(entry, IdentifiedReply) else None,
+            "username": entry.username,
+            "content": entry.content,
+            "upvotes": entry.upvotes,
+            "upvote_count": len(entry.upvotes),
+            "created_at": now,
+            "modified_at": now,
+        }
+        if isinstance(entry, IdentifiedComment):
+            document["rating"] = entry.rating
+        document["fingerprint"] = entry_fingerprint(entry.username, entry.content, document.get("rating"),
+                                                    document["parent_id"])
+
+        return document
 
     @staticmethod
     def _identify_comment(comment: Comment):
@@ -129,259 +217,275 @@ class CommentsService:
 
         return identified_comment
 
-    @staticmethod
-    def _is_entry_in_list(entry_list: list[dict], entry_id: str):
+    async def find_entry(self, entry_id: str, parent_id: str | None = None, projection: dict = None) -> dict | None:
         """
-        This method determines if the checked comment_id exists in the entry_list (which should be a list of values
-        from the database).
-        If it does, then it means that it can be updated, or removed.
+        Returns a comment's (or, if parent_id is given, a reply's) document.
         """
-
-        for db_comment in entry_list:
-            db_comment_model = IdentifiedComment(**db_comment)
-            if db_comment_model.id == entry_id:
-                return True
-
-        return False
+        return await self.db_connection.find_one(
+            {"_id": self._as_object_id(entry_id), "md5": self.md5, "parent_id": parent_id}, projection)
 
     @staticmethod
-    def _find_entry_position(entry_list: list[dict], entry_id: str) -> int | None:
-
-        # TODO: convert to enumerate
-        for index, db_comment in enumerate(entry_list):
-            if db_comment.get("id") == entry_id:
-                return index
-
-        return None
+    def _replies_sorting(query: CommentsQuery | None) -> list[tuple[str, int]]:
+        # Replies have no rating, when sorting by it they are kept from the oldest to the newest.
+        if query is None or query.sort == CommentSort.rating:
+            return [("created_at", 1), ("_id", 1)]
+
+        direction = -1 if query.mode is None or query.mode == SortMode.desc else 1
+        sort_field = comment_sort_fields[query.sort or CommentSort.date]
+        return [(sort_field, direction), ("_id", direction)]
+
+    async def _attach_replies(self, comments: list[dict], query: CommentsQuery | None = None,
+                              sort_in_database: bool = True):
+        # The replies of all given comments are retrieved, already sorted, with a single query.
+        comments_by_id = {comment["id"]: comment for comment in comments}
+        replies_sorting = self._replies_sorting(query)
+        replies_cursor = self.db_connection.find({"md5": self.md5, "parent_id": {"$in": list(comments_by_id)}})
+        if sort_in_database:
+            replies_cursor = replies_cursor.sort(replies_sorting)
+        documents = await replies_cursor.to_list(None)
+        if not sort_in_database:
+            (sort_field, direction), _ = replies_sorting
+            sort_documents(documents, sort_field, descending=direction == -1)
+
+        for document in documents:
+            parent_comment = comments_by_id.get(document.get("parent_id"))
+            if parent_comment is not None:
+                parent_comment["attached_responses"].append(self._document_as_entry(document))
 
-    @staticmethod
-    def _is_entry_duplicated(entry_list: list[dict], checked_entry: Comment | Reply):
+    async def get_possible_comments(self) -> list[dict]:
         """
-        This compares the checked_entry with all the values in entry_list. This method doesn't compare IDs or properties
-        only available on Identified versions of the Comment and Reply schemas, so it's used to determine
-        if a entry's content that is about to be added is the same as one that already exists.
-        (Avoiding spam and duplicates.)
-        Only use this when adding new entries.
+        Returns all of this md5's comments, with their replies, from the oldest to the newest.
+        Every entry is retrieved anyway, so they are sorted in Python, which doesn't depend on the indexes.
         """
-        checked_entry_dict = checked_entry.dict()
-
-        if len(entry_list) == 0:
-            return False
-
-        for list_value in entry_list:
-            is_duplicated = True
-            for key, value in list_value.items():
-                # Only compare values relevant to both Comment or Reply schemas.
-                if key not in ["username", "content", "rating", "comment_id"]:
-                    continue
-
-                # Trying to get the current key of the value in entry list from the checked entry dict.
-                # We call the variable "key" but it's actually it's value that's returned.
-                # .get doesn't raise an exception, it returns a None value instead.
-                checked_dict_key = checked_entry_dict.get(key)
-                if checked_dict_key is None:
-                    # If a key exists in list_value but not on checked_entry, it's safe to assume they are not the same.
-                    is_duplicated = False
-                    break
-
-                # Comparing if the value from the checked entry dict is
-                # the same as the one in the current list_value iteration.
-                # If the values don't correspond, that means they are not the equal objects.
-                if checked_dict_key != value:
-                    is_duplicated = False
-                    break
-
-            # If at the end of a iteration, a value is deemed to be duplicated.
-            if is_duplicated:
-                return is_duplicated
-
-        return False
-
-    def find_entry_in_list(self, entry_list: list[dict], entry_id: str) -> tuple[dict, int] | None:
-        # This function returns the actual comment or reply from a given list, and it's position.
-        entry_position = self._find_entry_position(entry_list, entry_id)
-        if isinstance(entry_position, int):
-            try:
-                entry_instance = entry_list[entry_position]
-                return entry_instance, entry_position
-            except ValueError:
-                return None
-        else:
-            return None
+        documents = await self.db_connection.find({"md5": self.md5, "parent_id": None}).to_list(None)
 
-    async def _pull_comment(self, comment_id: str):
-        connection = self.db_connection
-        try:
-            await connection.update_one({"md5": self.md5}, {"$pull": {"comments": {"id": comment_id}}})
-        except BaseException:
-            raise HTTPException(500, "Comment couldn't be removed. This is probably an internal issue.")
-
-    async def _push_comment(self, comment_to_add: IdentifiedComment, position: int = None):
-        connection = self.db_connection
-        self._append_dates(comment_to_add)
-
-        try:
-
-            if position:
-                await connection.update_one({"md5": self.md5},
-                                            {"$addToSet": {"comments": {"$each": [comment_to_add.dict()],
-                                                                        "$position": position}}})
-            else:
-                # Be mindful that addToSet creates an array if it doesn't exists, and then adds the specified values.
-                await connection.update_one({"md5": self.md5}, {"$addToSet": {"comments": comment_to_add.dict()}})
+        if not bool(documents):
+            raise HTTPException(400, "No comments match the given MD5.")
 
-        except BaseException:
-            raise HTTPException(500, "Comment could not be added. This is probably an internal issue.")
+        sort_documents(documents, "created_at", descending=False)
+        comments = [self._document_as_entry(document) for document in documents]
+        await self._attach_replies(comments, sort_in_database=False)
+        return comments
 
-    async def _pull_reply(self, comment_id: str, reply_id: str):
-        connection = self.db_connection
-        try:
-            # TODO: add update query description.
-            await connection.update_one({"md5": self.md5},
-                                        {"$pull": {"comments.$[elem].attached_responses": {"id": reply_id}}},
-                                        array_filters=[{"elem.id": comment_id}])
-        except BaseException:
-            raise HTTPException(500, "Reply couldn't be removed. This is probably an internal issue.")
+    @staticmethod
+    def _page_sorting(query: CommentsQuery) -> tuple[str, bool]:
+        sort_field = comment_sort_fields[query.sort or CommentSort.date]
+        descending = query.mode is None or query.mode == SortMode.desc
+        return sort_field, descending
+
+    async def _as_page(self, documents: list[dict], query: CommentsQuery,
+                       sort_in_database: bool = True) -> tuple[list[dict], str | None]:
+        # One more than the page's size is given, to know if there's a next page.
+        next_cursor = None
+        if len(documents) > query.limit:
+            documents = documents[:query.limit]
+            next_cursor = encode_cursor(documents[-1], self._page_sorting(query)[0])
+
+        comments = [self._document_as_entry(document) for document in documents]
+        await self._attach_replies(comments, query, sort_in_database)
+        return comments, next_cursor
+
+    async def _get_sorted_page(self, query: CommentsQuery) -> tuple[list[dict], str | None]:
+        sort_field, descending = self._page_sorting(query)
+        direction = -1 if descending else 1
+        filters = {"md5": self.md5, "parent_id": None}
+        if query.cursor is not None:
+            value, entry_id = decode_cursor(query.cursor, sort_field)
+            filters.update(cursor_filter(sort_field, value, entry_id, descending))
+
+        # Served by the (md5, parent_id, sort_field, _id) indexes.
+        documents = await self.db_connection.find(filters) \
+            .sort([(sort_field, direction), ("_id", direction)]) \
+            .limit(query.limit + 1).to_list(None)
+        return await self._as_page(documents, query)
+
+    async def _get_page_sorted_in_python(self, query: CommentsQuery) -> tuple[list[dict], str | None]:
+        """
+        Returns the same page as _get_sorted_page, for when MongoDB can't sort it.
+        """
+        sort_field, descending = self._page_sorting(query)
+        documents = await self.db_connection.find({"md5": self.md5, "parent_id": None}).to_list(None)
+        sort_documents(documents, sort_field, descending)
+        if query.cursor is not None:
+            value, entry_id = decode_cursor(query.cursor, sort_field)
+            documents = [document for document in documents
+                         if is_after_cursor(document, sort_field, value, entry_id, descending)]
+        return await self._as_page(documents[:query.limit + 1], query, sort_in_database=False)
+
+    async def get_comments_page(self, query: CommentsQuery) -> tuple[list[dict], str | None]:
+        """
+        Returns a page of comments, sorted by the database, and the cursor for the next page
+        (None if it's the last one).
+        Pages are cached until the next write to the md5's comments.
+        """
+        version, cached_page = await self.cache.get_page(query)
+        if cached_page is not None:
+            return cached_page["results"], cached_page["next_cursor"]
 
-    async def _push_reply(self, reply_to_add: IdentifiedReply, position: int = None):
-        connection = self.db_connection
-        self._append_dates(reply_to_add)
         try:
-            if isinstance(position, int):
-                await connection.update_one(
-                    {"md5": self.md5},
-                    {"$push": {"comments.$[elem].attached_responses": {"$each": [reply_to_add.dict()],
-                                                                       "$position": position}}},
-                    array_filters=[{"elem.id": reply_to_add.parent_id}], upsert=False)
-                return
-
-            await connection.update_one(
-                {"md5": self.md5}, {"$push": {"comments.$[elem].attached_responses": reply_to_add.dict()}},
-                array_filters=[{"elem.id": reply_to_add.parent_id}], upsert=False)
-
-        except BaseException:
-            raise HTTPException(500, "Couldn't add reply. This is probably an internal issue.")
+            comments, next_cursor = await self._get_sorted_page(query)
+        except OperationFailure as e:
+            # e.g. the indexes are still being built, and the sort exceeds MongoDB's memory limit.
+            self.logger.error(e)
+            comments, next_cursor = await self._get_page_sorted_in_python(query)
 
-    async def get_possible_comments(self) -> list[dict]:
-        connection = self.db_connection
-
-        # Retrieves a given md5's comments and projects the query to only return the "comments" array.
-        possible_comments: dict | None = await connection.find_one({"md5": self.md5}, {"comments": 1, "_id": 0})
-
-        if possible_comments is None or not bool(possible_comments.get("comments")):
+        if not bool(comments) and query.cursor is None:
             raise HTTPException(400, "No comments match the given MD5.")
-        comments_list = possible_comments.get("comments")
-        return comments_list
 
-    async def get_sorted_comments(self, query: CommentsQuery):
-        comments = await self.get_possible_comments()
-        self.sorting_service.sort_replies(comments, query)
-        self.sorting_service.sort_comments(comments, query)
+        await self.cache.save_page(version, query, {"results": comments, "next_cursor": next_cursor})
+        return comments, next_cursor
 
-        return comments
+    async def notify_write(self, event_type: str, entry_id: str, parent_id: str | None = None, **data):
+        """
+        Must be called after every successful write: drops the cached pages and tells live subscribers.
+        """
+        await self.cache.invalidate()
+        await publish_comment_event(self.md5, event_type, entry_id, parent_id, **data)
 
     async def remove_comment(self, comment_id: str):
-        book_comments = await self.get_possible_comments()
-        if self._is_entry_in_list(book_comments, comment_id):
-            await self._pull_comment(comment_id)
-        else:
-            raise HTTPException(400, "No comment corresponds to the given ID.")
-
-    async def add_comment(self, comment: Comment):
-        connection = self.db_connection
         try:
-            book_comments = await self.get_possible_comments()
-        except HTTPException:
-            book_comments = None
+            comment = await self.db_connection.find_one_and_delete(
+                {"_id": self._as_object_id(comment_id), "md5": self.md5, "parent_id": None}, {"rating": 1})
+            if comment is None:
+                raise HTTPException(400, "No comment corresponds to the given ID.")
+            removed_replies = await self.db_connection.delete_many({"md5": self.md5, "parent_id": comment_id})
+        except PyMongoError:
+            raise HTTPException(500, "Comment couldn't be removed. This is probably an internal issue.")
+
+        rating = comment.get("rating")
+        await update_comment_stats(self.md5, comments=-1, replies=-removed_replies.deleted_count,
+                                   rating_sum=-(rating or 0), rating_count=-1 if rating is not None else 0)
+        await self.notify_write("comment_removed", comment_id)
 
+    async def add_comment(self, comment: Comment):
         identified_comment = self._identify_comment(comment)
-        if isinstance(book_comments, list):
-            if self._is_entry_duplicated(book_comments, comment):
-                raise HTTPException(400, "Duplicated comment.")
+        document = self._entry_as_document(identified_comment)
+        try:
+            await self.db_connection.insert_one(document)
+        except DuplicateKeyError:
+            raise HTTPException(400, "Duplicated comment.")
+        except PyMongoError:
+            raise HTTPException(500, "Comment could not be added. This is probably an internal issue.")
 
-            await self._push_comment(identified_comment)
+        rating = identified_comment.rating
+        await update_comment_stats(self.md5, comments=1, rating_sum=rating or 0,
+                                   rating_count=1 if rating is not None else 0)
+        await self.notify_write("comment_added", identified_comment.id, entry=self._document_as_entry(document))
 
-        else:
-            self._append_dates(identified_comment)
-            book_comments = {
-                "md5": self.md5,
-                "comments": [identified_comment.dict()]
-            }
+    async def _update_entry(self, entry_id: str, parent_id: str | None, username: str,
+                            updated_fields: dict) -> dict | None:
+        """
+        Sets the given fields on one of username's comments (or replies, if parent_id is given), along with the
+        fingerprint of it's updated content. Returns the entry's rating from before the update, as a document,
+        or None if no entry matches.
+        Replies, and comments updating both their content and rating, are a single write.
+        """
+        entry_filter = {"_id": self._as_object_id(entry_id), "md5": self.md5, "parent_id": parent_id,
+                        "username": username}
+        fingerprint_fields = ["content"] if parent_id is not None else ["content", "rating"]
+        missing_fields = [field for field in fingerprint_fields if field not in updated_fields]
+        for _ in range(self.update_attempts):
+            stored_fields = {}
+            if missing_fields:
+                # MongoDB can't hash the stored fields, so the ones not being updated are read first. The write only
+                # applies if they are still the same, otherwise a concurrent edit could leave a stale fingerprint.
+                stored_entry = await self.db_connection.find_one(entry_filter, {field: 1 for field in missing_fields})
+                if stored_entry is None:
+                    return None
+                stored_fields = {field: stored_entry.get(field) for field in missing_fields}
+
+            updated_entry = {**stored_fields, **updated_fields}
+            fingerprint = entry_fingerprint(username, updated_entry.get("content"), updated_entry.get("rating"),
+                                            parent_id)
+            unchanged_filter = {**entry_filter, **stored_fields}
+            changes = {**updated_fields, "modified_at": datetime.utcnow()}
             try:
-                if identified_comment.created_at is None:
-                    e = AttributeError("Comment has no created_at attribute.")
-                    self.logger.error(e)
-                    raise e
+                previous_entry = await self.db_connection.find_one_and_update(
+                    unchanged_filter, {"$set": {**changes, "fingerprint": fingerprint}}, projection={"rating": 1})
+            except DuplicateKeyError:
+                # Edits were never rejected as duplicates. The identical entry already holds the fingerprint,
+                # so new duplicates of it are still rejected.
+                previous_entry = await self.db_connection.find_one_and_update(
+                    unchanged_filter, {"$set": changes, "$unset": {"fingerprint": ""}}, projection={"rating": 1})
+            if previous_entry is not None:
+                return previous_entry
+            if not missing_fields:
+                return None
 
-                await connection.insert_one(book_comments)
-            except BaseException:
-                raise HTTPException(500, "Comment could not be added. This is probably an internal issue.")
+        raise HTTPException(409, "This entry is being edited by another request. Please try again.")
 
     async def update_comment(self, update_request: CommentUpdateRequest):
         if update_request.updated_content is None and update_request.updated_rating is None:
             raise HTTPException(400, "Updating is not possible. No changes being made.")
-        book_comments = await self.get_possible_comments()
-        # Checks if target comment really exists
-        entry_in_list = self.find_entry_in_list(book_comments, update_request.id)
-        if entry_in_list:
-            target_comment_instance = entry_in_list[0]
-            target_comment_position = entry_in_list[1]
-            updated_comment = IdentifiedComment(**target_comment_instance)
-            if update_request.updated_content is not None:
-                updated_comment.content = update_request.updated_content
-            if update_request.updated_rating is not None:
-                updated_comment.rating = update_request.updated_rating
-
-            await self._pull_comment(updated_comment.id)
-            await self._push_comment(updated_comment, target_comment_position)
 
+        updated_fields = {}
+        if update_request.updated_content is not None:
+            updated_fields["content"] = update_request.updated_content
+        if update_request.updated_rating is not None:
+            updated_fields["rating"] = update_request.updated_rating
 
-        else:
+        try:
+            previous_comment = await self._update_entry(update_request.id, None, update_request.username,
+                                                        updated_fields)
+        except PyMongoError:
+            raise HTTPException(500, "Comment could not be updated. This is probably an internal issue.")
+        if previous_comment is None:
             raise HTTPException(400, "Target comment doesn't exist on md5's comments' list.")
 
-    async def remove_reply(self, parent_id: str, reply_id: str):
-        book_comments = await self.get_possible_comments()
-        parent_comment_info = self.find_entry_in_list(book_comments, parent_id)
-        if self._is_entry_in_list(book_comments, parent_id) and parent_comment_info is not None:
-            parent_comment = parent_comment_info[0]
-            parent_comment_replies: list[dict] = parent_comment.get("attached_responses")
-            reply_position = self._find_entry_position(parent_comment_replies, reply_id)
-            if reply_position is None:
-                raise HTTPException(400, "No reply found with the given id.")
-            await self._pull_reply(parent_id, reply_id)
+        previous_rating = previous_comment.get("rating")
+        if update_request.updated_rating is not None:
+            await update_comment_stats(self.md5, rating_sum=update_request.updated_rating - (previous_rating or 0),
+                                       rating_count=1 if previous_rating is None else 0)
         else:
-            raise HTTPException(400, "No comments match the reply's comment id.")
+            await update_comment_stats(self.md5)
+        await self.notify_write("comment_updated", update_request.id,
+                                content=update_request.updated_content, rating=update_request.updated_rating)
 
-    async def add_reply(self, reply_to_add: Reply):
-        book_comments = await self.get_possible_comments()
-        parent_comment_info = self.find_entry_in_list(book_comments, reply_to_add.parent_id)
-        if parent_comment_info is not None:
-            parent_comment = parent_comment_info[0]
-            parent_comment_replies: list[dict] = parent_comment.get("attached_responses")
-            if self._is_entry_duplicated(parent_comment_replies, reply_to_add):
-                raise HTTPException(400, "Duplicated reply.")
-            identified_reply = self._identify_reply(reply_to_add)
-            await self._push_reply(identified_reply)
+    async def remove_reply(self, parent_id: str, reply_id: str):
+        try:
+            result = await self.db_connection.delete_one(
+                {"_id": self._as_object_id(reply_id), "md5": self.md5, "parent_id": parent_id})
+        except PyMongoError:
+            raise HTTPException(500, "Reply couldn't be removed. This is probably an internal issue.")
 
-        else:
+        if result.deleted_count == 0:
+            if await self.find_entry(parent_id, projection={"_id": 1}) is None:
+                raise HTTPException(400, "No comments match the reply's comment id.")
+            raise HTTPException(400, "No reply found with the given id.")
+
+        await update_comment_stats(self.md5, replies=-1)
+        await self.notify_write("reply_removed", reply_id, parent_id)
+
+    async def add_reply(self, reply_to_add: Reply):
+        if await self.find_entry(reply_to_add.parent_id, projection={"_id": 1}) is None:
             raise HTTPException(400, "No comments match the reply's comment id.")
 
-    async def update_reply(self, reply_update: ReplyUpdateRequest):
-        book_comments = await self.get_possible_comments()
-        parent_comment_info = self.find_entry_in_list(book_comments, reply_update.parent_id)
-        if parent_comment_info is not None:
-            parent_comment = parent_comment_info[0]
-            parent_comment_replies: list[dict] = parent_comment.get("attached_responses")
-            target_reply_info = self.find_entry_in_list(parent_comment_replies, reply_update.id)
-            if target_reply_info is None:
-                raise HTTPException(400, "No response found for the given target id.")
-            target_reply_instance = target_reply_info[0]
-            target_reply_position = target_reply_info[1]
-            updated_reply = IdentifiedReply(**target_reply_instance)
-            updated_reply.content = reply_update.updated_content
-
-            await self._pull_reply(updated_reply.parent_id, updated_reply.id)
-            await self._push_reply(updated_reply, target_reply_position)
+        identified_reply = self._identify_reply(reply_to_add)
+        document = self._entry_as_document(identified_reply)
+        try:
+            await self.db_connection.insert_one(document)
+        except DuplicateKeyError:
+            raise HTTPException(400, "Duplicated reply.")
+        except PyMongoError:
+            raise HTTPException(500, "Couldn't add reply. This is probably an internal issue.")
 
-        else:
-            raise HTTPException(400, "No comments match the given target id.")
+        await update_comment_stats(self.md5, replies=1)
+        await self.notify_write("reply_added", identified_reply.id, identified_reply.parent_id,
+                                entry=self._document_as_entry(document))
+
+    async def update_reply(self, reply_update: ReplyUpdateRequest):
+        try:
+            previous_reply = await self._update_entry(reply_update.id, reply_update.parent_id, reply_update.username,
+                                                      {"content": reply_update.updated_content})
+        except PyMongoError:
+            raise HTTPException(500, "Reply could not be updated. This is probably an internal issue.")
+
+        if previous_reply is None:
+            # Only failed updates pay for a second query, to tell which entry is missing.
+            if await self.find_entry(reply_update.parent_id, projection={"_id": 1}) is None:
+                raise HTTPException(400, "No comments match the given target id.")
+            raise HTTPException(400, "No response found for the given target id.")
+
+        await update_comment_stats(self.md5)
+        await self.notify_write("reply_updated", reply_update.id, reply_update.parent_id,
+                                content=reply_update.updated_content)
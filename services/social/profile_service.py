@@ -1,11 +1,11 @@
 import json
 
 from fastapi import HTTPException
-from requests import Response
-from requests_html import AsyncHTMLSession
+from httpx import Response
 
 from models.body_models import User
 from models.response_models import UserProfile
+from config.http_client import get_http_client
 from config.mongodb_connection import mongodb_connect
 from services.security.hashing_functions import email_to_md5
 
@@ -13,7 +13,7 @@ from services.security.hashing_functions import email_to_md5
 class ProfileService:
     def __init__(self):
         self._db_connection = mongodb_connect()
-        self._session = AsyncHTMLSession()
+        self._session = get_http_client()
         self._gravatar_url = "https://www.gravatar.com"
         self._gravatar_hash = None
 
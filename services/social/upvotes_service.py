@@ -1,103 +1,71 @@
-from fastapi import HTTPException, Depends, Query
-from fastapi.logger import logger as fastlog
-from pydantic import ValidationError
+from fastapi import HTTPException, Query
+from pymongo.errors import PyMongoError
 
-from config.mongodb_connection import mongodb_comments_connect
-from models.body_models import IdentifiedComment, CommentUpvoteRequest, ReplyUpvoteRequest, IdentifiedReply, md5_reg
+from models.body_models import CommentUpvoteRequest, ReplyUpvoteRequest, md5_reg
 from services.social.comments_service import CommentsService
 
 
 class UpvotesService:
+    """
+    Each upvote change is a single conditional write, which also keeps "upvote_count" in sync for sorting.
+    The entry is only read when the write doesn't match, to tell why.
+    """
+
     def __init__(self, md5: str = Query(..., regex=md5_reg)):
-        self._db_connection = mongodb_comments_connect()
-        self._comments_service = CommentsService()
+        self._comments_service = CommentsService(md5)
+        self._db_connection = self._comments_service.db_connection
         self.md5 = md5
 
-    @staticmethod
-    def _user_has_upvoted(upvotes_list: list[str], username: str) -> bool:
+    async def _update_upvotes(self, entry_id: str, parent_id: str | None, username: str, add: bool) -> bool:
+        """
+        Adds or removes the user's upvote. Returns False if the entry doesn't exist, or if the user
+        had already upvoted it (when adding) or hadn't (when removing).
+        """
+        filters = {"_id": self._comments_service._as_object_id(entry_id), "md5": self.md5, "parent_id": parent_id}
+        if add:
+            filters["upvotes"] = {"$ne": username}
+            update = {"$addToSet": {"upvotes": username}, "$inc": {"upvote_count": 1}}
+        else:
+            filters["upvotes"] = username
+            update = {"$pull": {"upvotes": username}, "$inc": {"upvote_count": -1}}
+
         try:
-            upvotes_list.index(username)
-            return True
-        except ValueError:
-            return False
+            result = await self._db_connection.update_one(filters, update)
+        except PyMongoError:
+            raise HTTPException(500, "Error while trying to update the upvotes.")
 
-    async def _get_comment_upvotes(self, request: CommentUpvoteRequest) -> list[str]:
-        possible_comments = await self._comments_service.get_possible_comments()
-        comment_info = self._comments_service.find_entry_in_list(possible_comments, request.id)
-        if comment_info:
-            comment_instance = comment_info[0]
-            comment = IdentifiedComment(**comment_instance)
-            return comment.upvotes
+        if result.matched_count == 0:
+            return False
+        await self._comments_service.notify_write("upvote_added" if add else "upvote_removed", entry_id, parent_id,
+                                                  username=username)
+        return True
 
-        else:
+    async def _check_comment_exists(self, request: CommentUpvoteRequest):
+        if await self._comments_service.find_entry(request.id, projection={"_id": 1}) is None:
             raise HTTPException(400, "Comment doesn't exist on this specific MD5.")
 
-    async def _get_reply_upvotes(self, request: ReplyUpvoteRequest) -> list[str]:
-        possible_comments = await self._comments_service.get_possible_comments()
-        parent_info = self._comments_service.find_entry_in_list(possible_comments, request.parent_id)
-        if parent_info is not None:
-            parent_instance = IdentifiedComment(**parent_info[0])
-            parent_replies = parent_instance.attached_responses
-            reply_instance = self._comments_service.find_entry_in_list(parent_replies, request.id)
-            if reply_instance is None:
-                raise HTTPException(400, "Couldn't find a reply with this specific ID in the comment's responses.")
-            reply_model = IdentifiedReply(**reply_instance[0])
-            return reply_model.upvotes
-
-        else:
+    async def _check_reply_exists(self, request: ReplyUpvoteRequest):
+        if await self._comments_service.find_entry(request.parent_id, projection={"_id": 1}) is None:
             raise HTTPException(400, "Parent comment ID doesn't match any comment in this MD5.")
+        if await self._comments_service.find_entry(request.id, request.parent_id, projection={"_id": 1}) is None:
+            raise HTTPException(400, "Couldn't find a reply with this specific ID in the comment's responses.")
 
     async def add_comment_upvote(self, request: CommentUpvoteRequest):
-        connection = self._db_connection
-        upvotes = await self._get_comment_upvotes(request)
-        if self._user_has_upvoted(upvotes, request.username):
+        if not await self._update_upvotes(request.id, None, request.username, add=True):
+            await self._check_comment_exists(request)
             raise HTTPException(400, "User has already upvoted this comment.")
-        try:
-            await connection.update_one(
-                {"md5": self.md5}, {"$push": {"comments.$[elem].upvotes": request.username}},
-                array_filters=[{"elem.id": request.id}], upsert=False)
-        except BaseException as e:
-            raise e
 
     async def remove_comment_upvote(self, request: CommentUpvoteRequest):
-        connection = self._db_connection
-        upvotes = await self._get_comment_upvotes(request)
-        if not self._user_has_upvoted(upvotes, request.username):
+        if not await self._update_upvotes(request.id, None, request.username, add=False):
+            await self._check_comment_exists(request)
             raise HTTPException(400, "User has not upvoted this comment.")
 
-        try:
-            await connection.update_one(
-                {"md5": self.md5}, {"$pull": {"comments.$[elem].upvotes": request.username}},
-                array_filters=[{"elem.id": request.id}], upsert=False)
-        except BaseException as e:
-            raise e
-
     async def add_reply_upvote(self, request: ReplyUpvoteRequest):
-        connection = self._db_connection
-        upvotes = await self._get_reply_upvotes(request)
-        if self._user_has_upvoted(upvotes, request.username):
+        if not await self._update_upvotes(request.id, request.parent_id, request.username, add=True):
+            await self._check_reply_exists(request)
             raise HTTPException(400, "User has already upvoted this reply.")
-        try:
-            await connection.update_one(
-                {"md5": self.md5},
-                {"$push": {"comments.$[comment].attached_responses.$[reply].upvotes": request.username}},
-                array_filters=[{"comment.id": request.parent_id}, {"reply.id": request.id}], upsert=False)
-
-        except BaseException as e:
-            print(e)
-            HTTPException(500, "Error while trying to update the reply upvotes. ")
 
     async def remove_reply_upvote(self, request: ReplyUpvoteRequest):
-        connection = self._db_connection
-        upvotes = await self._get_reply_upvotes(request)
-        if not self._user_has_upvoted(upvotes, request.username):
+        if not await self._update_upvotes(request.id, request.parent_id, request.username, add=False):
+            await self._check_reply_exists(request)
             raise HTTPException(400, "User has not upvoted this reply.")
-
-        try:
-            await connection.update_one(
-                {"md5": self.md5},
-                {"$pull": {"comments.$[comment].attached_responses.$[reply].upvotes": request.username}},
-                array_filters=[{"comment.id": request.parent_id}, {"reply.id": request.id}], upsert=False)
-
-        except BaseException as e:
-            raise e
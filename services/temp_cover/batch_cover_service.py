@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator
+
+from aioredis import RedisError
+from fastapi import HTTPException
+from pymysql.err import Error
+
+from config.mysql_connection import MySQLConnect
+from config.redis_connection import RedisConnection
+from models.body_models import CoverRequest, normalize_md5
+from models.query_models import ValidTopics
+from models.response_models import CoverResult
+from services.search.search_service import SearchService
+from services.temp_cover.cover_service import TempCoverService
+
+
+class BatchCoverService:
+    """
+    Resolves covers for many books at once.
+    Covers are looked up in the database's Coverurl column, then in Redis, and only the remaining ones are scraped,
+    with a bounded number of scrapes running at the same time.
+    """
+
+    max_batch_size = 100
+    max_concurrent_scrapes = 8
+
+    def __init__(self, cover_requests: list[CoverRequest]):
+        if len(cover_requests) == 0:
+            raise HTTPException(400, "No covers being requested.")
+        if len(cover_requests) > self.max_batch_size:
+            raise HTTPException(400, f"Only {self.max_batch_size} covers can be requested at once.")
+
+        self.logger = logging.getLogger("biblioterra")
+        # Duplicated requests are only resolved once.
+        self.cover_requests: dict[tuple[ValidTopics, str], CoverRequest] = {
+            (request.topic, normalize_md5(request.md5)): request for request in cover_requests
+        }
+
+    @staticmethod
+    def _cache_key(request: CoverRequest):
+        # Same key used by TempCoverService.
+        return f"{normalize_md5(request.md5)}-{request.topic}-temp_cover"
+
+    def _sql_query_builder(self, pending: list[CoverRequest]) -> tuple[str, list]:
+        selects = []
+        placeholder_values = []
+        for topic, table in ((ValidTopics.fiction, "fiction"), (ValidTopics.scitech, "updated")):
+            topic_md5s = [normalize_md5(request.md5) for request in pending if request.topic == topic]
+            if not topic_md5s:
+                continue
+            placeholders = ", ".join(["%s"] * len(topic_md5s))
+            selects.append(f"SELECT MD5, Coverurl, '{topic.value}' as topic FROM {table} "
+                           f"WHERE MD5 IN ({placeholders}) AND Coverurl != ''")
+            placeholder_values.extend(topic_md5s)
+
+        return " UNION ALL ".join(selects), placeholder_values
+
+    async def _resolve_from_database(self, pending: list[CoverRequest]) -> dict[CoverRequest, str]:
+        resolved = {}
+        sql, placeholder_values = self._sql_query_builder(pending)
+        try:
+            async with MySQLConnect() as cursor:
+                await cursor.execute(sql, args=placeholder_values)
+                results = await cursor.fetchall()
+        except Error as e:
+            self.logger.error(e)
+            return resolved
+
+        for result in results:
+            request = self.cover_requests.get((ValidTopics(result.get("topic")), result.get("MD5").upper()))
+            cover_url = SearchService.resolve_cover_url(request.topic, result.get("Coverurl")) if request else None
+            if cover_url:
+                resolved[request] = cover_url
+
+        return resolved
+
+    async def _resolve_from_cache(self, pending: list[CoverRequest]) -> dict[CoverRequest, str]:
+        resolved = {}
+        cached_covers = []
+        try:
+            async with RedisConnection() as redis:
+                cached_covers = await redis.mget([self._cache_key(request) for request in pending])
+        except RedisError as e:
+            self.logger.warning(e)
+
+        for request, cached_cover in zip(pending, cached_covers or []):
+            if cached_cover:
+                resolved[request] = cached_cover.decode() if isinstance(cached_cover, bytes) else cached_cover
+
+        return resolved
+
+    async def _resolve_from_scraping(self, request: CoverRequest, semaphore: asyncio.Semaphore) -> CoverResult:
+        async with semaphore:
+            cover_service = TempCoverService(request.md5, request.topic)
+            try:
+                cover_url = await cover_service.get_cover()
+            except HTTPException:
+                cover_url = None
+            except Exception as e:
+                # A single failed scrape (e.g. a connection or parsing error) can't fail the whole batch.
+                self.logger.warning(f"Couldn't scrape the cover of {request.md5}: {e!r}")
+                cover_url = None
+
+        if cover_url:
+            await cover_service.save_on_cache(cover_url)
+            return self._as_result(request, cover_url, "scraping")
+        return self._as_result(request, None, None)
+
+    @staticmethod
+    def _as_result(request: CoverRequest, cover_url: str | None, source: str | None) -> CoverResult:
+        return CoverResult(topic=request.topic, md5=request.md5, cover_url=cover_url, source=source)
+
+    async def resolve_covers(self) -> AsyncIterator[CoverResult]:
+        """
+        Yields each cover as soon as it's resolved. Database and cache hits come first.
+        """
+        pending = list(self.cover_requests.values())
+
+        for source, resolver in (("database", self._resolve_from_database), ("cache", self._resolve_from_cache)):
+            if not pending:
+                return
+            resolved = await resolver(pending)
+            for request, cover_url in resolved.items():
+                yield self._as_result(request, cover_url, source)
+            pending = [request for request in pending if request not in resolved]
+
+        semaphore = asyncio.Semaphore(self.max_concurrent_scrapes)
+        scrapes = [self._resolve_from_scraping(request, semaphore) for request in pending]
+        for scrape in asyncio.as_completed(scrapes):
+            yield await scrape
+
+    async def get_all_covers(self) -> list[CoverResult]:
+        return [result async for result in self.resolve_covers()]
+
+    async def stream_covers(self) -> AsyncIterator[str]:
+        # Newline delimited JSON, one CoverResult per line.
+        async for result in self.resolve_covers():
+            yield json.dumps(result.dict()) + "\n"
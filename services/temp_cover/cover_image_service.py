@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import aiofiles
+import httpx
+from fastapi import HTTPException
+from fastapi.params import Path, Query
+from PIL import Image
+
+from config.http_client import get_http_client
+from models.body_models import normalize_md5
+from models.query_models import ValidTopics, CoverSize, CoverFormat
+from services.temp_cover.cover_service import TempCoverService
+
+covers_folder = "covers"
+# Covers bigger than this are not proxied.
+max_cover_bytes = 10 * 1024 * 1024
+# Thumbnails are resized to these widths, keeping the aspect ratio. None keeps the original size.
+cover_widths = {
+    CoverSize.small: 120,
+    CoverSize.medium: 300,
+    CoverSize.large: 600,
+    CoverSize.original: None,
+}
+cover_media_types = {
+    CoverFormat.webp: "image/webp",
+    CoverFormat.jpeg: "image/jpeg",
+}
+
+_thumbnail_executor: ProcessPoolExecutor | None = None
+
+
+def _get_thumbnail_executor() -> ProcessPoolExecutor:
+    # Image resizing is CPU bound, so it runs in a small process pool instead of the event loop.
+    global _thumbnail_executor
+    if _thumbnail_executor is None:
+        _thumbnail_executor = ProcessPoolExecutor(max_workers=2)
+    return _thumbnail_executor
+
+
+def make_thumbnail(original_path: str, thumbnail_path: str, width: int | None, cover_format: str):
+    """
+    Resizes the original cover and saves it in the given format.
+    Runs inside the thumbnail process pool, so it must stay a top level function.
+    """
+    with Image.open(original_path) as image:
+        image = image.convert("RGB")
+        if width is not None and image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+        partial_path = f"{thumbnail_path}.{uuid.uuid4().hex}.part"
+        image.save(partial_path, format=cover_format.upper(), quality=80)
+
+    os.replace(partial_path, thumbnail_path)
+
+
+class CoverImageService:
+    """
+    Proxies libgen covers, so clients don't need to hotlink full sized images.
+    Originals are saved in a content addressed disk cache (named after their sha256),
+    and thumbnails are generated once per size and format.
+    """
+
+    def __init__(self, md5: str = Path(...), topic: ValidTopics = Path(...),
+                 size: CoverSize = Query(CoverSize.medium), format: CoverFormat = Query(CoverFormat.webp)):
+        self.logger = logging.getLogger("biblioterra")
+        self.md5 = normalize_md5(md5)
+        self.topic = topic
+        self.size = size
+        self.format = format
+        self.cover_service = TempCoverService(md5, topic)
+
+    @staticmethod
+    def _original_path(cover_hash: str):
+        return os.path.join(covers_folder, "originals", cover_hash)
+
+    @staticmethod
+    def _thumbnail_path(cover_hash: str, size: CoverSize, cover_format: CoverFormat):
+        return os.path.join(covers_folder, "thumbnails", cover_hash, f"{size.value}.{cover_format.value}")
+
+    def _index_path(self):
+        # Maps a md5 to the hash of it's cover.
+        return os.path.join(covers_folder, "index", f"{self.md5}-{self.topic.value}")
+
+    @staticmethod
+    async def _write_atomically(path: str, content: bytes | str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        mode = "wb" if isinstance(content, bytes) else "w"
+        async with aiofiles.open(partial_path, mode) as fo:
+            await fo.write(content)
+        os.replace(partial_path, path)
+
+    async def _get_indexed_hash(self) -> str | None:
+        index_path = self._index_path()
+        if not os.path.exists(index_path):
+            return None
+        async with aiofiles.open(index_path, "r") as fo:
+            cover_hash = (await fo.read()).strip()
+        if os.path.exists(self._original_path(cover_hash)):
+            return cover_hash
+        return None
+
+    async def _get_cover_url(self) -> str:
+        cover_url = await self.cover_service.retrieve_from_cache()
+        if cover_url:
+            return cover_url.decode() if isinstance(cover_url, bytes) else cover_url
+
+        cover_url = await self.cover_service.get_cover()
+        await self.cover_service.save_on_cache(cover_url)
+        return cover_url
+
+    async def _fetch_cover(self, cover_url: str) -> bytes:
+        http_client = get_http_client()
+        try:
+            req = await http_client.get(cover_url, timeout=self.cover_service.timeout)
+            req.raise_for_status()
+        except httpx.HTTPError as e:
+            self.logger.warning(e)
+            raise HTTPException(500, "Couldn't retrieve this book's cover.")
+
+        if len(req.content) > max_cover_bytes:
+            raise HTTPException(500, "This book's cover is too big.")
+        return req.content
+
+    async def get_cover_hash(self) -> str:
+        cover_hash = await self._get_indexed_hash()
+        if cover_hash is not None:
+            return cover_hash
+
+        cover_url = await self._get_cover_url()
+        cover_content = await self._fetch_cover(cover_url)
+        cover_hash = hashlib.sha256(cover_content).hexdigest()
+
+        if not os.path.exists(self._original_path(cover_hash)):
+            await self._write_atomically(self._original_path(cover_hash), cover_content)
+        await self._write_atomically(self._index_path(), cover_hash)
+        return cover_hash
+
+    def etag(self, cover_hash: str) -> str:
+        return f'"{cover_hash}-{self.size.value}-{self.format.value}"'
+
+    @property
+    def media_type(self):
+        return cover_media_types[self.format]
+
+    async def get_cover_image(self, cover_hash: str) -> str:
+        """
+        Returns the path of this cover's thumbnail, generating it if needed.
+        """
+        thumbnail_path = self._thumbnail_path(cover_hash, self.size, self.format)
+        if os.path.exists(thumbnail_path):
+            return thumbnail_path
+
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(_get_thumbnail_executor(), make_thumbnail, self._original_path(cover_hash),
+                                       thumbnail_path, cover_widths[self.size], self.format.value)
+        except (OSError, ValueError) as e:
+            # Pillow raises OSError subclasses for files it can't read.
+            self.logger.error(e)
+            raise HTTPException(500, "Couldn't process this book's cover.")
+
+        return thumbnail_path
@@ -1,17 +1,23 @@
 import logging
 
+import httpx
 from aioredis import RedisError
 from fastapi import HTTPException
 from fastapi.params import Query, Path
-from grab_fork_from_libgen import AIOMetadata
 from grab_fork_from_libgen.exceptions import MetadataError
-from grab_fork_from_libgen.search_config import get_request_headers
-from bs4 import BeautifulSoup
-from requests_html import AsyncHTMLSession, HTMLResponse, Element
-from requests import exceptions
+from pymysql.err import Error
 
+from config.http_client import get_http_client
+from config.mysql_connection import MySQLConnect
 from config.redis_connection import RedisConnection
+from models.body_models import normalize_md5
 from models.query_models import ValidTopics
+from services.cache.local_cache import LocalCache
+from services.cache.negative_cache import NegativeCache
+from services.metrics.metrics_functions import increment_counter
+from services.search.book_card_store import book_cards_holder
+from services.search.extraction_functions import run_extraction, extract_cover_page
+from services.search.libgen_functions import scrape_librocks_cover
 from services.search.search_service import SearchService
 
 
@@ -21,42 +27,38 @@ class TempCoverService:
     A temporary solution for temp_cover scraping since Z-Library is now offline.
     Only works if you are allowed to hotlink covers by the libgen team.
     Adds a new step before using grab-fork-from-libgen temp_cover scraping.
+
+    resolve_cover() only scrapes when every cheaper source (in-process cache, Redis, the book cards store
+    and the database's Coverurl column) has failed.
     """
 
+    # Shared by all instances of the same worker.
+    local_cache: LocalCache[str] = LocalCache(ttl=600)
+
     def __init__(self, md5: str = Path(...), topic: ValidTopics = Path(...)):
         self.logger = logging.getLogger("biblioterra")
-        self.md5 = md5
+        self.md5 = normalize_md5(md5)
         self.topic = topic
         self.timeout = 30
-        self.metadata = AIOMetadata(self.timeout)
+        self.http_client = get_http_client()
         self.libgen_base = "https://libgen.is"
+        self.negative_cache = NegativeCache("temp_cover")
+        self.negative_cache_key = f"{self.md5}-{topic}"
+        self.cache_key = f"{self.md5}-{topic}-temp_cover"
 
     async def _get_cover_with_library(self):
         try:
-            cover_url = await self.metadata.get_cover(self.md5)
+            cover_url = await scrape_librocks_cover(self.md5, self.timeout)
             return cover_url
         except MetadataError as e:
-            raise HTTPException(400, e)
-
-    @staticmethod
-    async def _is_md5_invalid(response: HTMLResponse):
-        try:
-            html = response.html
-            html_ele: Element = html.find("html")[0]
-            html_text = html_ele.full_text
-            if html_text.find("No record with such MD5 hash has been found") != -1:
-                return True
-            return False
-        except (KeyError, TypeError, AttributeError, ValueError) as e:
-            print(e)
-            return True
+            raise HTTPException(400, str(e))
 
     async def save_on_cache(self, result: str):
         expires = SearchService.expires_in(168)
 
         try:
             async with RedisConnection() as redis:
-                await redis.set(f"{self.md5}-{self.topic}-temp_cover", result, ex=expires)
+                await redis.set(self.cache_key, result, ex=expires)
 
         except RedisError as e:
             print(e)
@@ -64,15 +66,15 @@ class TempCoverService:
     async def retrieve_from_cache(self) -> str | None:
         try:
             async with RedisConnection() as redis:
-                possible_cache = await redis.get(f"{self.md5}-{self.topic}-temp_cover")
+                possible_cache = await redis.get(self.cache_key)
                 return possible_cache
 
         except RedisError:
             return None
 
-    async def get_cover(self):
-
-        session = AsyncHTMLSession()
+    async def get_cover(self, negative_cache_checked: bool = False):
+        if not negative_cache_checked:
+            await self.negative_cache.raise_if_cached(self.negative_cache_key)
 
         if self.topic == ValidTopics.scitech:
             topic_url = "/book/index.php?md5="
@@ -81,31 +83,86 @@ class TempCoverService:
 
         req_url = self.libgen_base + topic_url + self.md5
 
-        error_on_main = False
-        page: HTMLResponse | None = None
+        page: httpx.Response | None = None
 
         try:
-            page: HTMLResponse = await session.get(req_url, headers=get_request_headers(),
-                                                   timeout=self.timeout)
-
-        except (exceptions.Timeout, exceptions.ConnectionError, exceptions.HTTPError):
-            error_on_main = True
-        if page is None:
-            error_on_main = True
-        if await self._is_md5_invalid(page):
-            raise HTTPException(400, "No record with such MD5 hash has been found.")
-
-        if not error_on_main:
-            soup = BeautifulSoup(page.html.raw_html, "html.parser")
-            img_select = soup.select_one("img")
-            if img_select is None:
-                pass
-            else:
-                try:
-                    img_src = img_select["src"]
-                    cover_url = self.libgen_base + img_src
-                    return cover_url
-                except KeyError as e:
-                    pass
+            page = await self.http_client.get(req_url, timeout=self.timeout)
+        except httpx.HTTPError as e:
+            self.logger.warning(e)
+            page = None
+
+        if page is not None:
+            # The page is parsed only once, outside the event loop.
+            page_data = await run_extraction(extract_cover_page, page.text)
+            if page_data.md5_not_found:
+                not_found = HTTPException(400, "No record with such MD5 hash has been found.")
+                await self.negative_cache.save(self.negative_cache_key, not_found)
+                raise not_found
+
+            if page_data.cover_src is not None:
+                cover_url = self.libgen_base + page_data.cover_src
+                return cover_url
 
         return await self._get_cover_with_library()
+
+    def _find_on_book_cards(self) -> str | None:
+        book_cards = book_cards_holder.current
+        if book_cards is None:
+            return None
+
+        record = book_cards.get_record(self.md5)
+        if record is None or record.topic != self.topic:
+            return None
+        return SearchService.resolve_cover_url(self.topic, record.coverurl)
+
+    async def _find_on_database(self) -> str | None:
+        table = "fiction" if self.topic == ValidTopics.fiction else "updated"
+        try:
+            async with MySQLConnect() as cursor:
+                await cursor.execute(f"SELECT Coverurl FROM {table} WHERE MD5 = %s LIMIT 1", args=(self.md5,))
+                result = await cursor.fetchone()
+        except Error as e:
+            self.logger.error(e)
+            return None
+
+        if not result or not result.get("Coverurl"):
+            return None
+        return SearchService.resolve_cover_url(self.topic, result.get("Coverurl"))
+
+    async def _find_on_cache(self) -> str | None:
+        possible_cache = await self.retrieve_from_cache()
+        if isinstance(possible_cache, bytes):
+            possible_cache = possible_cache.decode()
+        return possible_cache
+
+    async def resolve_cover(self) -> tuple[str, str]:
+        """
+        Returns the cover's url and the source it was found on.
+        Each source is counted, so it's possible to see how often scraping is still needed.
+        """
+        cover_url = self.local_cache.get(self.cache_key)
+        source = "local"
+
+        if cover_url is None:
+            # Known missing md5s are answered before any of the other sources is tried.
+            try:
+                await self.negative_cache.raise_if_cached(self.negative_cache_key)
+            except HTTPException:
+                increment_counter("cover_chain.not_found")
+                raise
+            cover_url, source = await self._find_on_cache(), "cache"
+        if cover_url is None:
+            cover_url, source = self._find_on_book_cards(), "book_cards"
+        if cover_url is None:
+            cover_url, source = await self._find_on_database(), "database"
+        if cover_url is None:
+            source = "scraping"
+            try:
+                cover_url = await self.get_cover(negative_cache_checked=True)
+            except HTTPException:
+                increment_counter("cover_chain.not_found")
+                raise
+
+        increment_counter(f"cover_chain.{source}")
+        self.local_cache.set(self.cache_key, cover_url)
+        return cover_url, source
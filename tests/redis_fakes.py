@@ -0,0 +1,91 @@
+from aioredis import RedisError
+
+# Stand-ins for RedisConnection, patched in by the tests of the services that use Redis.
+
+
+class MemoryPipeline:
+    def __init__(self, redis: "MemoryRedis"):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name: str):
+        def queue(*args):
+            self.commands.append((getattr(self.redis, name), args))
+        return queue
+
+    async def execute(self):
+        return [await command(*args) for command, args in self.commands]
+
+
+class MemoryRedis:
+    """
+    Just enough of Redis for the services' tests, shared by every connection.
+    Tests must call MemoryRedis.clear() on setUp.
+    """
+
+    values: dict[str, str] = {}
+    hashes: dict[str, dict[str, str]] = {}
+    sets: dict[str, set[str]] = {}
+
+    @classmethod
+    def clear(cls):
+        cls.values.clear()
+        cls.hashes.clear()
+        cls.sets.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return True
+
+    def pipeline(self, transaction: bool = True):
+        return MemoryPipeline(self)
+
+    async def get(self, key: str):
+        value = self.values.get(key)
+        return value.encode() if isinstance(value, str) else value
+
+    async def set(self, key: str, value, ex: int = None):
+        self.values[key] = value
+
+    async def incr(self, key: str):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1)
+        return int(self.values[key])
+
+    async def expire(self, key: str, seconds: int):
+        return key in self.values or key in self.hashes or key in self.sets
+
+    async def hset(self, key: str, field: str, value: str):
+        self.hashes.setdefault(key, {})[field] = value
+
+    async def hdel(self, key: str, *fields: str):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    async def hgetall(self, key: str):
+        return {field.encode(): value.encode() for field, value in self.hashes.get(key, {}).items()}
+
+    async def sadd(self, key: str, *members: str):
+        self.sets.setdefault(key, set()).update(members)
+
+    async def sscan_iter(self, key: str, count: int = None):
+        for member in list(self.sets.get(key, set())):
+            yield member.encode()
+
+    async def eval(self, script: str, numkeys: int, progress_key: str, users_key: str, username: str, *flushed: str):
+        # What progress_functions' _remove_flushed_script does, the only script used so far.
+        progress = self.hashes.get(progress_key, {})
+        for md5, book_progress in zip(flushed[::2], flushed[1::2]):
+            if progress.get(md5) == book_progress:
+                del progress[md5]
+        if not progress:
+            self.sets.get(users_key, set()).discard(username)
+
+
+class UnavailableRedis:
+    async def __aenter__(self):
+        raise RedisError("Could not connect to Redis.")
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return True
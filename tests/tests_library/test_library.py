@@ -0,0 +1,233 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch, AsyncMock
+
+from bson import ObjectId
+from pymongo import UpdateOne, DeleteOne
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from models.body_models import LibraryEntry, ValidCategories, LibraryOperation
+from scripts.migrate_library import user_as_documents
+from services.library import library_functions, library_sync_functions
+from services.library.library_functions import entry_as_document, document_as_entry, operation_as_request
+from services.library.library_sync_functions import summarize_changes, library_changes_limit
+
+
+def make_book(md5: str, **fields) -> dict:
+    return {"authors": "Jane Austen", "title": "Pride and Prejudice", "topic": "fiction", "md5": md5,
+            "extension": "epub", **fields}
+
+
+class TestLibrary(TestCase):
+    def test_document_round_trip(self):
+        book = LibraryEntry(**make_book("C5ECB88AB0AF46661684A1D0F18A8B71", category=ValidCategories.reading))
+        document = entry_as_document("tester", book, datetime(2022, 11, 2))
+        self.assertEqual(document["username"], "tester")
+        self.assertEqual(document_as_entry("tester", {**document, "_id": "id"}), book)
+
+    def test_invalid_document(self):
+        with self.assertRaises(HTTPException):
+            document_as_entry("tester", {"md5": "not a md5"})
+
+    def test_migration(self):
+        user = {
+            "username": "tester",
+            "reading": [make_book("C5ECB88AB0AF46661684A1D0F18A8B71"), make_book("A" * 32)],
+            "to-read": [make_book("B" * 32, category="reading")],
+            # Already in "reading".
+            "backlog": [make_book("A" * 32)],
+        }
+        documents = user_as_documents(user, datetime(2022, 11, 2, 10, 30, 15, 123456))
+        self.assertEqual([document["md5"] for document in documents],
+                         ["C5ECB88AB0AF46661684A1D0F18A8B71", "A" * 32, "B" * 32])
+        # The array a book was in is it's category, and the arrays' order is kept.
+        self.assertEqual(documents[2]["category"], "to-read")
+        self.assertLess(documents[0]["updated_at"], documents[1]["updated_at"])
+        # Still in order once stored, since BSON dates only keep milliseconds.
+        self.assertTrue(all(document["updated_at"].microsecond % 1000 == 0 for document in documents))
+        self.assertEqual(len({document["updated_at"] for document in documents}), len(documents))
+
+    def test_operations(self):
+        book = LibraryEntry(**make_book("A" * 32))
+        now = datetime(2022, 11, 2)
+        entry_filter = {"username": "tester", "md5": "A" * 32}
+        add = operation_as_request("tester", LibraryOperation(action="add", md5="A" * 32, category="backlog",
+                                                              book=book), now)
+        backlog_book = book.copy(update={"category": ValidCategories.backlog})
+        self.assertEqual(add, UpdateOne(entry_filter, {"$set": entry_as_document("tester", backlog_book, now),
+                                                       "$setOnInsert": {"created_at": now}}, upsert=True))
+
+        move = operation_as_request("tester", LibraryOperation(action="move", md5="A" * 32, category="reading"), now)
+        self.assertEqual(move, UpdateOne(entry_filter, {"$set": {"category": "reading", "updated_at": now}}))
+
+        remove = operation_as_request("tester", LibraryOperation(action="remove", md5="A" * 32), now)
+        self.assertEqual(remove, DeleteOne(entry_filter))
+
+    def test_invalid_operations(self):
+        book = make_book("A" * 32)
+        for operation in ({"action": "add", "md5": "A" * 32, "category": "reading"},
+                          {"action": "add", "md5": "B" * 32, "category": "reading", "book": book},
+                          {"action": "add", "md5": "A" * 32, "book": book},
+                          {"action": "move", "md5": "A" * 32}):
+            with self.assertRaises(ValidationError):
+                LibraryOperation(**operation)
+
+    def test_sync_summary(self):
+        document = {"version": 3, "changes": [
+            {"md5": "A" * 32, "removed": False, "version": 1},
+            {"md5": "B" * 32, "removed": False, "version": 2},
+            {"md5": "A" * 32, "removed": True, "version": 3},
+            {"md5": "C" * 32, "removed": False, "version": 3},
+        ]}
+        self.assertEqual(summarize_changes(document, 1), (3, ["B" * 32, "C" * 32], ["A" * 32]))
+        self.assertEqual(summarize_changes(document, 3), (3, [], []))
+        # Newer than the server's version.
+        self.assertIsNone(summarize_changes(document, 4))
+
+    def test_first_sync_is_full(self):
+        # Books may have been added before the library had a version, so they aren't in the log.
+        self.assertIsNone(summarize_changes(None, 0))
+        self.assertIsNone(summarize_changes({"version": 1, "changes": [
+            {"md5": "A" * 32, "removed": False, "version": 1}]}, 0))
+
+    def test_sync_summary_before_the_log_started(self):
+        document = {"version": 5, "changes": [{"md5": "A" * 32, "removed": False, "version": 5}]}
+        self.assertIsNone(summarize_changes(document, 3))
+        self.assertEqual(summarize_changes(document, 4), (5, ["A" * 32], []))
+        # Nothing was logged since the version was bumped.
+        self.assertIsNone(summarize_changes({"version": 2, "changes": []}, 1))
+        self.assertEqual(summarize_changes({"version": 2, "changes": []}, 2), (2, [], []))
+
+    def test_sync_summary_after_dropped_changes(self):
+        changes = [{"md5": "A" * 32, "removed": False, "version": 10 + i // 2} for i in range(library_changes_limit)]
+        document = {"version": changes[-1]["version"], "changes": changes}
+        self.assertIsNone(summarize_changes(document, 9))
+        self.assertEqual(summarize_changes(document, 10)[1], ["A" * 32])
+
+
+def matches(document: dict, filters: dict) -> bool:
+    # Just enough of MongoDB's query language for the cursor filters. Values of different types never match.
+    for field, condition in filters.items():
+        if field == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+            continue
+
+        value = document.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for operator, operand in condition.items():
+            comparable = type(value) is type(operand)
+            if operator == "$lt" and not (comparable and value < operand):
+                return False
+            if operator == "$gt" and not (comparable and value > operand):
+                return False
+            if operator == "$ne" and value == operand:
+                return False
+    return True
+
+
+class MemoryCursor:
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    def sort(self, keys: list[tuple[str, int]]):
+        for field, direction in reversed(keys):
+            self.documents.sort(key=lambda document: document[field], reverse=direction == -1)
+        return self
+
+    def limit(self, amount: int):
+        self.documents = self.documents[:amount]
+        return self
+
+    async def to_list(self, length):
+        return self.documents
+
+    async def __aiter__(self):
+        for document in self.documents:
+            yield document
+
+
+class MemoryLibrary:
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    def find(self, filters: dict, projection=None):
+        return MemoryCursor([document for document in self.documents if matches(document, filters)])
+
+
+@patch.object(library_functions, "get_pending_progress", new_callable=AsyncMock, return_value={})
+class TestCategoryPages(IsolatedAsyncioTestCase):
+    async def test_every_page_is_served(self, get_pending_progress: AsyncMock):
+        start = datetime(2022, 11, 2)
+        documents = [{**make_book(f"{index:032X}", category="reading"), "_id": ObjectId(), "username": "tester",
+                      "created_at": start, "updated_at": start + timedelta(minutes=index)} for index in range(5)]
+        library = MemoryLibrary(documents)
+
+        pages = []
+        cursor = None
+        with patch.object(library_functions, "mongodb_library_connect", return_value=library):
+            while True:
+                books, cursor = await library_functions.get_category_page("tester", ValidCategories.reading,
+                                                                          cursor, 2)
+                pages.append([book.md5 for book in books])
+                if cursor is None:
+                    break
+
+        # From the most recently updated.
+        self.assertEqual(pages, [[f"{4:032X}", f"{3:032X}"], [f"{2:032X}", f"{1:032X}"], [f"{0:032X}"]])
+
+
+class VersionsCollection:
+    def __init__(self, document: dict | None):
+        self.document = document
+
+    async def find_one(self, filters: dict, projection=None):
+        return self.document
+
+
+@patch.object(library_functions, "get_pending_progress", new_callable=AsyncMock, return_value={})
+class TestSync(IsolatedAsyncioTestCase):
+    async def test_first_sync_of_an_existing_library(self, get_pending_progress: AsyncMock):
+        start = datetime(2022, 11, 2)
+        documents = [{**make_book(f"{index:032X}", category="reading"), "_id": ObjectId(), "username": "tester",
+                      "created_at": start, "updated_at": start + timedelta(minutes=index)} for index in range(3)]
+        # Only the last book was added after the library had a version.
+        versions = VersionsCollection({"_id": "tester", "version": 1, "changes": [
+            {"md5": f"{2:032X}", "removed": False, "version": 1}]})
+        with patch.object(library_sync_functions, "mongodb_library_versions_connect", return_value=versions), \
+                patch.object(library_functions, "mongodb_library_connect", return_value=MemoryLibrary(documents)):
+            sync = await library_functions.sync_library("tester", 0)
+
+        self.assertTrue(sync["full"])
+        self.assertEqual(sync["version"], 1)
+        self.assertEqual([book["md5"] for book in sync["library"]["reading"]], [f"{i:032X}" for i in range(3)])
+
+
+class RecordingLibrary:
+    def __init__(self):
+        self.requests = []
+
+    async def bulk_write(self, requests: list, ordered: bool):
+        self.requests += requests
+        return SimpleNamespace(upserted_count=0, modified_count=len(requests), deleted_count=0)
+
+
+@patch.object(library_functions, "record_library_changes", new_callable=AsyncMock)
+@patch.object(library_functions, "discard_pending_progress", new_callable=AsyncMock)
+class TestOperations(IsolatedAsyncioTestCase):
+    async def test_moves_keep_pending_progress(self, discard_pending_progress: AsyncMock,
+                                               record_library_changes: AsyncMock):
+        book = LibraryEntry(**make_book("A" * 32))
+        operations = [LibraryOperation(action="move", md5="B" * 32, category="reading"),
+                      LibraryOperation(action="add", md5="A" * 32, category="backlog", book=book),
+                      LibraryOperation(action="remove", md5="C" * 32)]
+        with patch.object(library_functions, "mongodb_library_connect", return_value=RecordingLibrary()):
+            await library_functions.apply_operations("tester", operations)
+
+        discard_pending_progress.assert_awaited_once_with("tester", ["A" * 32, "C" * 32])
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch, AsyncMock
+
+from pymongo.errors import PyMongoError
+
+from services.library import progress_functions, library_functions
+from services.library.progress_functions import save_progress, get_pending_progress, flush_progress, \
+    apply_pending_progress, progress_users_key
+from tests.redis_fakes import MemoryRedis
+
+
+class MemoryLibrary:
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    def find(self, filters: dict, projection=None):
+        documents = [document for document in self.documents if document["md5"] in filters["md5"]["$in"]]
+        return SimpleNamespace(to_list=AsyncMock(return_value=documents))
+
+
+@patch("services.library.progress_functions.RedisConnection", MemoryRedis)
+class TestProgress(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        MemoryRedis.clear()
+
+    async def test_updates_are_coalesced_and_readable(self):
+        await save_progress("tester", "A" * 32, "epubcfi(/6/2)")
+        await save_progress("tester", "A" * 32, "epubcfi(/6/4)")
+        await save_progress("tester", "B" * 32, "epubcfi(/6/8)")
+        pending = await get_pending_progress("tester")
+        self.assertEqual(pending, {"A" * 32: "epubcfi(/6/4)", "B" * 32: "epubcfi(/6/8)"})
+
+        books = [{"md5": "A" * 32, "progress": "epubcfi(/6/2)"}, {"md5": "C" * 32, "progress": None}]
+        apply_pending_progress(books, pending)
+        self.assertEqual([book["progress"] for book in books], ["epubcfi(/6/4)", None])
+
+    async def test_flush_writes_the_latest_progress(self):
+        await save_progress("tester", "A" * 32, "epubcfi(/6/2)")
+        await save_progress("tester", "A" * 32, "epubcfi(/6/4)")
+        with patch.object(progress_functions, "write_progress", new_callable=AsyncMock) as write_progress:
+            await flush_progress()
+
+        write_progress.assert_awaited_once_with("tester", {"A" * 32: "epubcfi(/6/4)"})
+        self.assertEqual(await get_pending_progress("tester"), {})
+        self.assertEqual(MemoryRedis.sets[progress_users_key], set())
+
+    async def test_failed_flush_keeps_the_progress(self):
+        await save_progress("tester", "A" * 32, "epubcfi(/6/2)")
+        await save_progress("other", "A" * 32, "epubcfi(/6/2)")
+        with patch.object(progress_functions, "write_progress", new_callable=AsyncMock,
+                          side_effect=PyMongoError("MongoDB is down.")):
+            await flush_progress()
+
+        self.assertEqual(await get_pending_progress("tester"), {"A" * 32: "epubcfi(/6/2)"})
+        self.assertEqual(MemoryRedis.sets[progress_users_key], {"tester", "other"})
+
+    async def test_progress_saved_while_flushing_is_kept(self):
+        await save_progress("tester", "A" * 32, "epubcfi(/6/2)")
+        await save_progress("tester", "B" * 32, "epubcfi(/6/8)")
+
+        async def write_progress(username: str, progress: dict[str, str]):
+            await save_progress("tester", "A" * 32, "epubcfi(/6/4)")
+
+        with patch.object(progress_functions, "write_progress", side_effect=write_progress):
+            await flush_progress()
+
+        self.assertEqual(await get_pending_progress("tester"), {"A" * 32: "epubcfi(/6/4)"})
+        self.assertEqual(MemoryRedis.sets[progress_users_key], {"tester"})
+
+    async def test_cancelled_flush_keeps_the_progress(self):
+        await save_progress("tester", "A" * 32, "epubcfi(/6/2)")
+        with patch.object(progress_functions, "write_progress", new_callable=AsyncMock,
+                          side_effect=asyncio.CancelledError()):
+            try:
+                await flush_progress()
+            except asyncio.CancelledError:
+                pass
+
+        self.assertEqual(await get_pending_progress("tester"), {"A" * 32: "epubcfi(/6/2)"})
+        self.assertEqual(MemoryRedis.sets[progress_users_key], {"tester"})
+
+    @patch.object(library_functions, "get_library_version", new_callable=AsyncMock, return_value=3)
+    async def test_pending_progress_changes_the_etag(self, get_library_version: AsyncMock):
+        etag = await library_functions.get_library_etag("tester")
+        self.assertEqual(etag, '"3"')
+
+        await save_progress("tester", "A" * 32, "epubcfi(/6/2)")
+        progress_etag = await library_functions.get_library_etag("tester")
+        self.assertNotEqual(progress_etag, etag)
+
+        await save_progress("tester", "A" * 32, "epubcfi(/6/4)")
+        self.assertNotIn(await library_functions.get_library_etag("tester"), (etag, progress_etag))
+
+    @patch.object(library_functions, "get_library_changes", new_callable=AsyncMock, return_value=(3, [], []))
+    async def test_sync_sends_pending_progress(self, get_library_changes: AsyncMock):
+        self.assertIsNone(await library_functions.sync_library("tester", 3))
+
+        await save_progress("tester", "A" * 32, "epubcfi(/6/4)")
+        library = MemoryLibrary([{"md5": "A" * 32, "category": "reading", "progress": "epubcfi(/6/2)"}])
+        with patch.object(library_functions, "mongodb_library_connect", return_value=library):
+            changes = await library_functions.sync_library("tester", 3)
+
+        self.assertEqual(changes["version"], 3)
+        self.assertEqual([book["progress"] for book in changes["changed"]], ["epubcfi(/6/4)"])
+        self.assertEqual(changes["removed"], [])
@@ -0,0 +1,80 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from fastapi import HTTPException
+
+from models.body_models import CoverRequest
+
+from models.query_models import ValidTopics
+from services.metrics import metrics_functions
+from services.temp_cover.batch_cover_service import BatchCoverService
+from services.temp_cover.cover_service import TempCoverService
+
+
+class TestCoverChain(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        TempCoverService.local_cache.clear()
+        metrics_functions._pending_counters.clear()
+        self.service = TempCoverService("C5ECB88AB0AF46661684A1D0F18A8B71", ValidTopics.fiction)
+        self.service._find_on_cache = AsyncMock(return_value=None)
+        self.service._find_on_book_cards = lambda: None
+        self.service._find_on_database = AsyncMock(return_value=None)
+        self.service.get_cover = AsyncMock(return_value="https://libgen.is/scraped.jpg")
+        self.service.negative_cache = AsyncMock()
+
+    async def test_database_before_scraping(self):
+        self.service._find_on_database.return_value = "https://libgen.is/fictioncovers/1/c5.jpg"
+        cover_url, source = await self.service.resolve_cover()
+        self.assertEqual((cover_url, source), ("https://libgen.is/fictioncovers/1/c5.jpg", "database"))
+        self.service.get_cover.assert_not_awaited()
+        self.assertEqual(metrics_functions._pending_counters["cover_chain.database"], 1)
+
+    async def test_cache_before_database(self):
+        self.service._find_on_cache.return_value = "https://libgen.is/cached.jpg"
+        self.assertEqual(await self.service.resolve_cover(), ("https://libgen.is/cached.jpg", "cache"))
+        self.service._find_on_database.assert_not_awaited()
+
+    async def test_scraping_is_last(self):
+        self.assertEqual(await self.service.resolve_cover(), ("https://libgen.is/scraped.jpg", "scraping"))
+        self.service._find_on_cache.assert_awaited_once()
+        self.service._find_on_database.assert_awaited_once()
+
+    async def test_local_cache(self):
+        await self.service.resolve_cover()
+        self.assertEqual(await self.service.resolve_cover(), ("https://libgen.is/scraped.jpg", "local"))
+        self.service.get_cover.assert_awaited_once()
+
+    async def test_not_found(self):
+        self.service.get_cover.side_effect = HTTPException(400, "No record with such MD5 hash has been found.")
+        with self.assertRaises(HTTPException):
+            await self.service.resolve_cover()
+        self.assertEqual(metrics_functions._pending_counters["cover_chain.not_found"], 1)
+
+    async def test_known_missing_md5s_skip_every_source(self):
+        self.service.negative_cache.raise_if_cached.side_effect = HTTPException(400, "No record with such MD5.")
+        with self.assertRaises(HTTPException):
+            await self.service.resolve_cover()
+        self.service._find_on_cache.assert_not_awaited()
+        self.service._find_on_database.assert_not_awaited()
+        self.service.get_cover.assert_not_awaited()
+        self.assertEqual(metrics_functions._pending_counters["cover_chain.not_found"], 1)
+
+
+class TestBatchCovers(IsolatedAsyncioTestCase):
+    async def test_failed_scrape_only_fails_its_cover(self):
+        async def get_cover(cover_service: TempCoverService):
+            if cover_service.md5 == "A" * 32:
+                raise httpx.ConnectError("Connection refused.")
+            return "https://libgen.is/scraped.jpg"
+
+        handler = BatchCoverService([CoverRequest(topic="fiction", md5="A" * 32),
+                                     CoverRequest(topic="fiction", md5="B" * 32)])
+        handler._resolve_from_database = AsyncMock(return_value={})
+        handler._resolve_from_cache = AsyncMock(return_value={})
+        with patch.object(TempCoverService, "get_cover", autospec=True, side_effect=get_cover), \
+                patch.object(TempCoverService, "save_on_cache", new_callable=AsyncMock):
+            results = {result.md5: result for result in await handler.get_all_covers()}
+
+        self.assertEqual((results["A" * 32].cover_url, results["A" * 32].source), (None, None))
+        self.assertEqual(results["B" * 32].source, "scraping")
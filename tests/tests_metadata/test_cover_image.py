@@ -0,0 +1,31 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from PIL import Image
+
+from services.temp_cover.cover_image_service import make_thumbnail
+
+
+class TestCoverImage(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.original_path = os.path.join(self.folder.name, "original")
+        Image.new("RGB", (800, 1200), color=(120, 30, 30)).save(self.original_path, format="PNG")
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def test_thumbnail_is_resized(self):
+        thumbnail_path = os.path.join(self.folder.name, "small.webp")
+        make_thumbnail(self.original_path, thumbnail_path, 120, "webp")
+        with Image.open(thumbnail_path) as thumbnail:
+            self.assertEqual(thumbnail.format, "WEBP")
+            self.assertEqual(thumbnail.size, (120, 180))
+
+    def test_original_size_is_kept(self):
+        thumbnail_path = os.path.join(self.folder.name, "original.jpeg")
+        make_thumbnail(self.original_path, thumbnail_path, None, "jpeg")
+        with Image.open(thumbnail_path) as thumbnail:
+            self.assertEqual(thumbnail.format, "JPEG")
+            self.assertEqual(thumbnail.size, (800, 1200))
@@ -0,0 +1,88 @@
+import os
+import secrets
+import tempfile
+from unittest import TestCase
+
+from models.query_models import ValidTopics
+from services.search.book_card_store import BookCardRecord, BookCardStore, BookCardWriter, merge_records
+
+
+def make_record(md5: str, title: str = "A Book", topic: ValidTopics = ValidTopics.fiction) -> BookCardRecord:
+    return BookCardRecord(md5=md5, topic=topic, title=title, author="Some Author", extension="epub",
+                          language="English", filesize=2048, coverurl="123/abc.jpg")
+
+
+def random_records(amount: int) -> list[BookCardRecord]:
+    return [make_record(md5) for md5 in sorted(secrets.token_hex(16).upper() for _ in range(amount))]
+
+
+class TestBookCardStore(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "book_cards.bin")
+        self.records = random_records(500)
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def write(self, records: list[BookCardRecord], last_modified: int = 0) -> BookCardStore:
+        writer = BookCardWriter(self.path)
+        for record in records:
+            writer.add(record)
+        writer.save(last_modified)
+        return BookCardStore.load(self.path)
+
+    def test_get_record(self):
+        store = self.write(self.records, last_modified=1667000000)
+        self.assertEqual(len(store), len(self.records))
+        self.assertEqual(store.last_modified, 1667000000)
+        for record in self.records:
+            self.assertEqual(store.get_record(record.md5), record)
+            self.assertEqual(store.get_record(record.md5.lower()), record)
+
+        self.assertIsNone(store.get_record(secrets.token_hex(16)))
+        self.assertIsNone(store.get_record("not-a-md5"))
+
+    def test_get_as_search_entry(self):
+        record = BookCardRecord(md5=self.records[0].md5, topic=ValidTopics.scitech, title="Título 📚",
+                                author="Autor", extension="pdf", language=None, filesize=0, coverurl=None)
+        store = self.write([record])
+        card = store.get(record.md5)
+        self.assertEqual(card.title, "Título 📚")
+        self.assertEqual(card.topic, ValidTopics.scitech)
+        self.assertIsNone(card.language)
+        self.assertIsNone(card.cover_url)
+        self.assertEqual(card.size, "0 B")
+
+    def test_get_many(self):
+        store = self.write(self.records)
+        unknown_md5 = secrets.token_hex(16)
+        md5s = [self.records[10].md5, unknown_md5, self.records[3].md5.lower()]
+        cards = store.get_many(md5s)
+        self.assertEqual(list(cards.keys()), [self.records[10].md5, self.records[3].md5.lower()])
+
+    def test_unsorted_records(self):
+        writer = BookCardWriter(self.path)
+        writer.add(self.records[1])
+        with self.assertRaises(ValueError):
+            writer.add(self.records[0])
+
+    def test_duplicated_records(self):
+        store = self.write([self.records[0], make_record(self.records[0].md5, "Duplicate"), self.records[1]])
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get_record(self.records[0].md5).title, "A Book")
+
+    def test_merge_records(self):
+        changed = [make_record(self.records[5].md5, "Updated title"), make_record("F" * 32, "New book")]
+        merged = list(merge_records(self.records, changed))
+        self.assertEqual(len(merged), len(self.records) + 1)
+        store = self.write(merged)
+        self.assertEqual(store.get_record(self.records[5].md5).title, "Updated title")
+        self.assertEqual(store.get_record("F" * 32).title, "New book")
+        self.assertEqual([record.md5 for record in store.iter_records()], sorted(record.md5 for record in merged))
+
+    def test_load_invalid_file(self):
+        with open(self.path, "wb") as fo:
+            fo.write(b"BTCARDS1" + b"\x00" * 4)
+        with self.assertRaises(ValueError):
+            BookCardStore.load(self.path)
@@ -0,0 +1,46 @@
+import asyncio
+import time
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock
+
+from models.query_models import ValidTopics
+from services.cache import popularity_functions
+from services.cache.cache_warmer import CacheWarmer, RateLimiter, WarmingReport
+from services.temp_cover.cover_service import TempCoverService
+
+
+class TestCacheWarmer(IsolatedAsyncioTestCase):
+    async def test_rate_limiter(self):
+        rate_limiter = RateLimiter(rate=50)
+        start = time.monotonic()
+        await asyncio.gather(*(rate_limiter.wait() for _ in range(6)))
+        # The first call is immediate, the other five are spaced by 1/50 seconds.
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50 - 0.01)
+
+    def test_report_coverage(self):
+        report = WarmingReport(keys=10, already_cached=4, warmed=4, failed=2)
+        self.assertAlmostEqual(report.coverage, 0.8)
+        self.assertEqual(WarmingReport().coverage, 1)
+
+    async def test_only_missing_keys_are_warmed(self):
+        md5 = "C5ECB88AB0AF46661684A1D0F18A8B71"
+        warmer = CacheWarmer(requests_per_second=1000)
+        warmer._find_cached = AsyncMock(return_value={f"metadata:{md5}"})
+        warmer._warm_cover = AsyncMock()
+        warmer._warm_key = AsyncMock(wraps=warmer._warm_key)
+
+        report = await warmer.warm([], [(md5, ValidTopics.fiction)])
+        self.assertEqual(report.keys, 3)
+        self.assertEqual(report.already_cached, 1)
+        self.assertEqual(warmer._warm_key.await_count, 2)
+        self.assertEqual(report.warmed + report.failed, 2)
+
+    def test_keys_match_lowercase_requests(self):
+        popularity_functions._pending_books.clear()
+        popularity_functions.record_book_access("c5ecb88ab0af46661684a1d0f18a8b71", ValidTopics.fiction)
+        popularity_functions.record_book_access("C5ECB88AB0AF46661684A1D0F18A8B71", ValidTopics.fiction)
+        self.assertEqual(dict(popularity_functions._pending_books), {"fiction:C5ECB88AB0AF46661684A1D0F18A8B71": 2})
+
+        warmed_keys = CacheWarmer._book_cache_keys("C5ECB88AB0AF46661684A1D0F18A8B71", ValidTopics.fiction)
+        cover_service = TempCoverService("c5ecb88ab0af46661684a1d0f18a8b71", ValidTopics.fiction)
+        self.assertEqual(warmed_keys["cover"], cover_service.cache_key)
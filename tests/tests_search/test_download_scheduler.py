@@ -0,0 +1,84 @@
+import asyncio
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from fastapi import HTTPException
+
+from config.http_client import HostLimitedAsyncClient
+from services.search import download_functions
+from services.search.download_scheduler import DownloadScheduler
+
+
+class TestDownloadScheduler(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.scheduler = DownloadScheduler(max_concurrent=2, max_queued=1)
+        self.test_md5 = "C5ECB88AB0AF46661684A1D0F18A8B71"
+        self.calls = 0
+
+    async def fake_download(self):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return f"temp/{self.test_md5}.epub"
+
+    async def test_same_md5_is_coalesced(self):
+        results = await asyncio.gather(*[self.scheduler.schedule(self.test_md5, self.fake_download)
+                                         for _ in range(5)])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(self.scheduler.pending, 0)
+
+    async def test_errors_reach_every_waiter(self):
+        async def failing_download():
+            await asyncio.sleep(0.01)
+            raise HTTPException(500, "Couldn't download this book in any of the mirrors.")
+
+        results = await asyncio.gather(*[self.scheduler.schedule(self.test_md5, failing_download)
+                                         for _ in range(3)], return_exceptions=True)
+        for result in results:
+            self.assertIsInstance(result, HTTPException)
+
+    async def test_excess_is_shed(self):
+        md5_list = [f"{index:032x}" for index in range(4)]
+        results = await asyncio.gather(*[self.scheduler.schedule(md5, self.fake_download) for md5 in md5_list],
+                                       return_exceptions=True)
+        shed = [result for result in results if isinstance(result, HTTPException)]
+        self.assertEqual(len(shed), 1)
+        self.assertEqual(shed[0].status_code, 503)
+        self.assertIn("Retry-After", shed[0].headers)
+
+    async def test_bytes_in_flight_are_released(self):
+        with self.scheduler.track_bytes() as track_bytes:
+            track_bytes(1024)
+            track_bytes(1024)
+            self.assertEqual(self.scheduler.bytes_in_flight, 2048)
+        self.assertEqual(self.scheduler.bytes_in_flight, 0)
+
+    async def test_in_progress_download_over_the_cap_is_shed(self):
+        scheduler = DownloadScheduler(max_bytes_in_flight=4096)
+        received = []
+
+        async def chunked_body():
+            for _ in range(10):
+                received.append(1024)
+                yield b"0" * 1024
+
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=chunked_body()))
+        http_client = HostLimitedAsyncClient(transport=transport)
+        scoreboard = AsyncMock()
+        with tempfile.TemporaryDirectory() as folder, \
+                patch.object(download_functions, "download_scheduler", scheduler), \
+                patch.object(download_functions, "get_http_client", return_value=http_client), \
+                patch.object(download_functions, "temp_download_folder", folder):
+            with self.assertRaises(HTTPException) as raised:
+                await download_functions._try_links(["https://mirror.test/book.epub"], self.test_md5, scoreboard)
+            self.assertEqual(os.listdir(folder), [])
+
+        await http_client.aclose()
+        self.assertEqual(raised.exception.status_code, 503)
+        # Stopped as soon as the cap was reached, without downloading the rest.
+        self.assertEqual(len(received), 5)
+        self.assertEqual(scheduler.bytes_in_flight, 0)
+        scoreboard.record_success.assert_not_awaited()
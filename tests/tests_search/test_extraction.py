@@ -0,0 +1,52 @@
+import os
+from unittest import TestCase
+
+from bs4 import BeautifulSoup
+from grab_fork_from_libgen.search_config import get_mirror_sources
+
+from services.search.extraction_functions import extract_cover_page, extract_download_links, \
+    extract_librocks_cover
+
+fixtures_folder = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixtures_folder, name), encoding="utf-8") as fo:
+        return fo.read()
+
+
+class TestExtraction(TestCase):
+    def test_fiction_cover_page(self):
+        page = read_fixture("libgen_fiction_page.html")
+        page_data = extract_cover_page(page)
+        self.assertFalse(page_data.md5_not_found)
+        # Must match what the previous BeautifulSoup implementation found.
+        self.assertEqual(page_data.cover_src, BeautifulSoup(page, "html.parser").select_one("img")["src"])
+
+    def test_scitech_cover_page(self):
+        page_data = extract_cover_page(read_fixture("libgen_scitech_page.html"))
+        self.assertEqual(page_data.cover_src, "/covers/1077000/7700d78d8bcaba3af0eadeb4b75148c2-g.jpg")
+
+    def test_no_record_page(self):
+        page_data = extract_cover_page(read_fixture("libgen_no_record_page.html"))
+        self.assertTrue(page_data.md5_not_found)
+        self.assertIsNone(page_data.cover_src)
+
+    def test_download_links(self):
+        page = read_fixture("librarylol_page.html")
+        soup_links = BeautifulSoup(page, "html.parser").find_all("a", string=get_mirror_sources())
+        expected = {link.string: link["href"] for link in soup_links}
+        download_links = extract_download_links(page)
+        self.assertEqual(download_links, expected)
+        self.assertIn("GET", download_links)
+        self.assertIn("Cloudflare", download_links)
+
+    def test_librocks_cover(self):
+        page = read_fixture("librocks_page.html")
+        expected = BeautifulSoup(page, "html.parser").select("img:last-of-type")[1]["src"]
+        self.assertEqual(extract_librocks_cover(page), expected)
+
+    def test_empty_page(self):
+        self.assertEqual(extract_download_links(""), {})
+        self.assertIsNone(extract_librocks_cover(""))
+        self.assertIsNone(extract_cover_page("").cover_src)
@@ -0,0 +1,32 @@
+from unittest import IsolatedAsyncioTestCase
+
+import httpx
+
+from config.http_client import HostLimitedAsyncClient
+
+
+async def chunked_body():
+    for _ in range(3):
+        yield b"0" * 1024
+
+
+class TestHostLimitedAsyncClient(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=chunked_body()))
+        self.client = HostLimitedAsyncClient(transport=transport, max_requests_per_host=1)
+
+    async def asyncTearDown(self) -> None:
+        await self.client.aclose()
+
+    async def test_streams_hold_the_host_slot_until_closed(self):
+        async with self.client.stream("GET", "https://mirror.test/book.epub") as response:
+            self.assertTrue(self.client._host_semaphore("mirror.test").locked())
+            body = b"".join([chunk async for chunk in response.aiter_bytes()])
+        self.assertEqual(len(body), 3 * 1024)
+        self.assertFalse(self.client._host_semaphore("mirror.test").locked())
+
+    async def test_other_hosts_are_not_limited(self):
+        async with self.client.stream("GET", "https://mirror.test/book.epub"):
+            response = await self.client.get("https://other-mirror.test/book.epub")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.client._host_semaphore("mirror.test").locked())
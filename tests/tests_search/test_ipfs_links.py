@@ -0,0 +1,73 @@
+import os
+from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch, AsyncMock
+
+from aioredis import RedisError
+from fastapi import HTTPException
+from grab_fork_from_libgen.exceptions import MetadataError
+
+from models.response_models import DownloadLinksResponse
+from services.search import metadata_functions
+from services.search.extraction_functions import extract_download_links
+from services.search.ipfs_functions import make_filename, make_ipfs_links
+from tests.redis_fakes import UnavailableRedis
+
+fixtures_folder = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class TestIPFSLinks(TestCase):
+    def setUp(self) -> None:
+        with open(os.path.join(fixtures_folder, "librarylol_page.html"), encoding="utf-8") as fo:
+            self.scraped_links = extract_download_links(fo.read())
+        self.ipfs_cid = "bafykbzacedg3lf7pkvwmbbqwpvywxdwqw6m5zhz2zeyx7xw5ja6khw4nl2xmu"
+
+    def test_filename(self):
+        self.assertEqual(make_filename("Austen, Jane", "Pride and Prejudice", "EPUB"),
+                         "Austen, Jane - Pride and Prejudice.epub")
+        self.assertEqual(make_filename(None, "AC/DC", "pdf"), "AC_DC.pdf")
+        self.assertEqual(make_filename("", "", None), "book")
+
+    def test_links_match_scraped_ones(self):
+        filename = make_filename("Austen, Jane", "Pride and Prejudice", "epub")
+        local_links = make_ipfs_links(self.ipfs_cid, filename)
+        scraped_ipfs_links = {name: link for name, link in self.scraped_links.items() if name != "GET"}
+        self.assertEqual(local_links, scraped_ipfs_links)
+
+    def test_links_without_get(self):
+        local_links = make_ipfs_links(self.ipfs_cid, "book.epub")
+        response = DownloadLinksResponse(**local_links)
+        self.assertIsNone(response.get)
+        self.assertEqual(response.dict(by_alias=True)["IPFS.io"], local_links["IPFS.io"])
+
+
+@patch("services.cache.negative_cache.RedisConnection", UnavailableRedis)
+@patch("services.search.metadata_functions.aioredis.from_url", side_effect=RedisError("Could not connect to Redis."))
+class TestGetDlinks(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        with open(os.path.join(fixtures_folder, "librarylol_page.html"), encoding="utf-8") as fo:
+            self.scraped_links = extract_download_links(fo.read())
+        self.local_links = make_ipfs_links("bafykbzacedg3lf7pkvwmbbqwpvywxdwqw6m5zhz2zeyx7xw5ja6khw4nl2xmu",
+                                           "Austen, Jane - Pride and Prejudice.epub")
+        self.test_md5 = "C5ECB88AB0AF46661684A1D0F18A8B71"
+
+    async def get_dlinks(self, scrape: AsyncMock, local_links: dict):
+        with patch.object(metadata_functions, "scrape_download_links", scrape), \
+                patch.object(metadata_functions, "get_local_download_links", AsyncMock(return_value=local_links)):
+            return await metadata_functions.get_dlinks(self.test_md5, "fiction")
+
+    async def test_local_links_skip_scraping(self, from_url):
+        scrape = AsyncMock(return_value=self.scraped_links)
+        dlinks, cached = await self.get_dlinks(scrape, self.local_links)
+        scrape.assert_not_awaited()
+        self.assertIsNone(dlinks["GET"])
+        self.assertEqual(dlinks["IPFS.io"], self.local_links["IPFS.io"])
+
+    async def test_scraping_without_local_links(self, from_url):
+        dlinks, cached = await self.get_dlinks(AsyncMock(return_value=self.scraped_links), {})
+        self.assertEqual(dlinks["GET"], self.scraped_links["GET"])
+
+    async def test_scraping_errors_without_local_links(self, from_url):
+        scrape = AsyncMock(side_effect=MetadataError("Error while connecting to Libgen."))
+        with self.assertRaises(HTTPException) as context:
+            await self.get_dlinks(scrape, {})
+        self.assertEqual(context.exception.status_code, 500)
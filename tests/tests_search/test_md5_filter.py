@@ -0,0 +1,66 @@
+import os
+import secrets
+import tempfile
+from unittest import TestCase
+
+from services.search.md5_filter import MD5Filter, MD5FilterHolder
+
+
+def random_md5s(amount: int) -> list[str]:
+    return [secrets.token_hex(16).upper() for _ in range(amount)]
+
+
+class TestMD5Filter(TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "md5_filter.bin")
+        self.md5s = random_md5s(5000)
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def test_no_false_negatives(self):
+        md5_filter = MD5Filter.build(self.md5s, len(self.md5s))
+        for md5 in self.md5s:
+            self.assertIn(md5, md5_filter)
+            self.assertIn(md5.lower(), md5_filter)
+
+    def test_false_positive_rate(self):
+        md5_filter = MD5Filter.build(self.md5s, len(self.md5s), false_positive_rate=0.01)
+        false_positives = sum(md5 in md5_filter for md5 in random_md5s(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+
+    def test_invalid_md5s(self):
+        md5_filter = MD5Filter.build(self.md5s, len(self.md5s))
+        self.assertNotIn("not-a-md5", md5_filter)
+        self.assertNotIn("ABCD", md5_filter)
+
+    def test_save_and_load(self):
+        MD5Filter.build(self.md5s, len(self.md5s)).save(self.path)
+        md5_filter = MD5Filter.load(self.path)
+        self.assertEqual(md5_filter.num_items, len(self.md5s))
+        for md5 in self.md5s:
+            self.assertIn(md5, md5_filter)
+
+    def test_load_invalid_file(self):
+        with open(self.path, "wb") as fo:
+            fo.write(b"not a filter" * 10)
+        with self.assertRaises(ValueError):
+            MD5Filter.load(self.path)
+
+    def test_holder(self):
+        holder = MD5FilterHolder(self.path)
+        holder.refresh()
+        # Without a filter, every md5 passes.
+        self.assertTrue(holder.might_exist(self.md5s[0]))
+
+        MD5Filter.build(self.md5s[:10], 10).save(self.path)
+        holder.refresh()
+        self.assertTrue(holder.might_exist(self.md5s[0]))
+
+        MD5Filter.build(self.md5s[10:20], 10).save(self.path)
+        # Makes sure the new file's mtime is different.
+        os.utime(self.path, (holder.mtime + 10, holder.mtime + 10))
+        holder.refresh()
+        self.assertTrue(holder.might_exist(self.md5s[10]))
+        self.assertEqual(holder.md5_filter.num_items, 10)
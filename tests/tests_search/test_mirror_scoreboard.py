@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+from services.search.mirror_scoreboard import MirrorScoreboard, MirrorStats
+
+
+class TestMirrorScoreboard(TestCase):
+    def setUp(self) -> None:
+        self.scoreboard = MirrorScoreboard()
+
+    def test_host_of(self):
+        host = self.scoreboard.host_of("https://Cloudflare-IPFS.com/ipfs/abc?filename=book.epub")
+        self.assertEqual(host, "cloudflare-ipfs.com")
+
+    def test_ewma_success(self):
+        stats = MirrorStats()
+        self.scoreboard.apply_success(stats, 2.0, 1000.0)
+        self.assertEqual(stats.latency, 2.0)
+        self.assertEqual(stats.throughput, 1000.0)
+        self.scoreboard.apply_success(stats, 1.0, 2000.0)
+        self.assertAlmostEqual(stats.latency, 1.7)
+        self.assertAlmostEqual(stats.throughput, 1300.0)
+        self.assertEqual(stats.samples, 2)
+
+    def test_failures_lower_score(self):
+        healthy = self.scoreboard.apply_success(MirrorStats(), 0.5, 1024 * 1024)
+        failing = self.scoreboard.apply_success(MirrorStats(), 0.5, 1024 * 1024)
+        for _ in range(3):
+            self.scoreboard.apply_failure(failing)
+
+        self.assertLess(self.scoreboard.score(healthy), self.scoreboard.score(failing))
+
+    def test_faster_mirror_scores_better(self):
+        fast = self.scoreboard.apply_success(MirrorStats(), 0.2, 4 * 1024 * 1024)
+        slow = self.scoreboard.apply_success(MirrorStats(), 3.0, 100 * 1024)
+        self.assertLess(self.scoreboard.score(fast), self.scoreboard.score(slow))
+        # Unknown mirrors still rank above clearly slow ones.
+        self.assertLess(self.scoreboard.score(None), self.scoreboard.score(slow))
@@ -0,0 +1,39 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+from services.cache.negative_cache import NegativeCache
+from services.metrics import metrics_functions
+from tests.redis_fakes import UnavailableRedis
+
+
+@patch("services.cache.negative_cache.RedisConnection", UnavailableRedis)
+class TestNegativeCache(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        NegativeCache._local_entries.clear()
+        metrics_functions._pending_counters.clear()
+        self.negative_cache = NegativeCache("metadata")
+
+    async def test_miss(self):
+        self.assertIsNone(await self.negative_cache.get("unknown-md5"))
+        await self.negative_cache.raise_if_cached("unknown-md5")
+        self.assertEqual(metrics_functions._pending_counters["negative_cache.metadata.misses"], 2)
+
+    async def test_hit_raises_saved_exception(self):
+        await self.negative_cache.save("bad-md5", HTTPException(400, "Couldn't find any file with the given MD5"))
+
+        with self.assertRaises(HTTPException) as context:
+            await self.negative_cache.raise_if_cached("bad-md5")
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertEqual(context.exception.detail, "Couldn't find any file with the given MD5")
+        self.assertEqual(metrics_functions._pending_counters["negative_cache.metadata.hits"], 1)
+
+    async def test_namespaces_are_separate(self):
+        await self.negative_cache.save("bad-md5", HTTPException(400, "Not found"))
+        self.assertIsNone(await NegativeCache("dlinks").get("bad-md5"))
+
+    async def test_entries_expire(self):
+        with patch.object(NegativeCache, "ttl", -1):
+            await self.negative_cache.save("bad-md5", HTTPException(400, "Not found"))
+        self.assertIsNone(await self.negative_cache.get("bad-md5"))
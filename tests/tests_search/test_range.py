@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from fastapi import HTTPException
+
+from services.search.range_functions import parse_range_header, is_if_range_valid, is_not_modified
+
+
+class TestRange(TestCase):
+    def setUp(self) -> None:
+        self.file_size = 1000
+        self.etag = '"c5ecb88ab0af46661684a1d0f18a8b71"'
+
+    def test_no_range(self):
+        self.assertIsNone(parse_range_header(None, self.file_size))
+
+    def test_closed_range(self):
+        byte_range = parse_range_header("bytes=0-499", self.file_size)
+        self.assertEqual((byte_range.start, byte_range.end, byte_range.length), (0, 499, 500))
+
+    def test_open_range(self):
+        byte_range = parse_range_header("bytes=500-", self.file_size)
+        self.assertEqual((byte_range.start, byte_range.end), (500, 999))
+
+    def test_suffix_range(self):
+        byte_range = parse_range_header("bytes=-100", self.file_size)
+        self.assertEqual((byte_range.start, byte_range.end), (900, 999))
+
+    def test_end_is_clamped(self):
+        byte_range = parse_range_header("bytes=900-5000", self.file_size)
+        self.assertEqual(byte_range.end, 999)
+
+    def test_ignored_ranges(self):
+        self.assertIsNone(parse_range_header("bytes=0-10,20-30", self.file_size))
+        self.assertIsNone(parse_range_header("items=0-10", self.file_size))
+        self.assertIsNone(parse_range_header("bytes=50-10", self.file_size))
+
+    def test_unsatisfiable_range(self):
+        with self.assertRaises(HTTPException) as ctx:
+            parse_range_header("bytes=1000-", self.file_size)
+        self.assertEqual(ctx.exception.status_code, 416)
+
+    def test_if_range(self):
+        self.assertTrue(is_if_range_valid(None, self.etag, 0))
+        self.assertTrue(is_if_range_valid(self.etag, self.etag, 0))
+        self.assertFalse(is_if_range_valid('"another"', self.etag, 0))
+        self.assertTrue(is_if_range_valid("Thu, 01 Jan 1970 00:16:40 GMT", self.etag, 1000))
+        self.assertFalse(is_if_range_valid("Thu, 01 Jan 1970 00:16:40 GMT", self.etag, 2000))
+
+    def test_if_none_match(self):
+        self.assertFalse(is_not_modified(None, self.etag))
+        self.assertTrue(is_not_modified(self.etag, self.etag))
+        self.assertTrue(is_not_modified(f'"another", {self.etag}', self.etag))
+        self.assertTrue(is_not_modified(f"W/{self.etag}", self.etag))
+        self.assertTrue(is_not_modified(" * ", self.etag))
+        self.assertFalse(is_not_modified('"another", W/"other"', self.etag))
@@ -0,0 +1,361 @@
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch, AsyncMock
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from models.body_models import Comment, Reply, CommentUpdateRequest, ReplyUpdateRequest, CommentUpvoteRequest
+from scripts.migrate_comments import book_as_documents
+from models.query_models import CommentsQuery, CommentSort, SortMode
+from services.cursor_functions import encode_cursor, decode_cursor, cursor_filter, sort_documents, \
+    is_after_cursor
+from services.social.comments_service import CommentsService, CommentSortingService, entry_fingerprint
+from services.social.upvotes_service import UpvotesService
+from services.social.comment_stats_functions import document_as_stats
+
+
+class TestCommentEntries(TestCase):
+    def setUp(self) -> None:
+        self.service = CommentsService("TEST3030303030303030303030303030")
+
+    def test_cursor(self):
+        document = {"_id": ObjectId(), "created_at": datetime(2022, 11, 2, 10, 30, 15, 123000), "upvote_count": 3}
+        date_cursor = encode_cursor(document, "created_at")
+        self.assertEqual(decode_cursor(date_cursor, "created_at"), (document["created_at"], document["_id"]))
+        upvotes_cursor = encode_cursor(document, "upvote_count")
+        self.assertEqual(decode_cursor(upvotes_cursor, "upvote_count"), (3, document["_id"]))
+        self.assertEqual(decode_cursor(encode_cursor(document, "rating"), "rating"), (None, document["_id"]))
+
+        # A cursor can't be used with another sorting.
+        with self.assertRaises(HTTPException):
+            decode_cursor(date_cursor, "upvote_count")
+
+    def test_invalid_cursor(self):
+        for cursor in ("not a cursor", "WyJhIl0=", ""):
+            with self.assertRaises(HTTPException):
+                decode_cursor(cursor, "created_at")
+
+    def test_cursor_filter(self):
+        entry_id = ObjectId()
+        self.assertEqual(cursor_filter("upvote_count", 3, entry_id, descending=True),
+                         {"$or": [{"upvote_count": {"$lt": 3}}, {"upvote_count": 3, "_id": {"$lt": entry_id}},
+                                  {"upvote_count": None}]})
+        self.assertEqual(cursor_filter("rating", 3, entry_id, descending=False),
+                         {"$or": [{"rating": {"$gt": 3}}, {"rating": 3, "_id": {"$gt": entry_id}}]})
+        # Nulls come last when descending, and first when ascending.
+        self.assertEqual(cursor_filter("rating", None, entry_id, descending=True),
+                         {"rating": None, "_id": {"$lt": entry_id}})
+        self.assertEqual(cursor_filter("rating", None, entry_id, descending=False),
+                         {"$or": [{"rating": None, "_id": {"$gt": entry_id}}, {"rating": {"$ne": None}}]})
+
+    def test_sort_documents(self):
+        documents = [{"_id": ObjectId(), "rating": rating} for rating in (3, None, 5, 3)]
+        sort_documents(documents, "rating", descending=True)
+        self.assertEqual([document["rating"] for document in documents], [5, 3, 3, None])
+        self.assertGreater(documents[1]["_id"], documents[2]["_id"])
+
+        # Same entries as cursor_filter, in the same order.
+        cursor_document = documents[1]
+        after_cursor = [document for document in documents
+                        if is_after_cursor(document, "rating", 3, cursor_document["_id"], descending=True)]
+        self.assertEqual(after_cursor, documents[2:])
+
+    def test_python_sorting_fallback(self):
+        comments = [
+            {"id": "1", "created_at": "2022-11-02T10:30:15Z", "rating": None, "upvotes": ["a"]},
+            {"id": "2", "created_at": None, "rating": 3, "upvotes": []},
+            {"id": "3", "created_at": "2022-12-01T00:00:00Z", "rating": 5, "upvotes": ["a", "b"]},
+        ]
+        sorting_service = CommentSortingService()
+        sorting_service.sort_comments(comments, CommentsQuery(sort=CommentSort.date, mode=SortMode.desc))
+        self.assertEqual([comment["id"] for comment in comments], ["3", "1", "2"])
+        sorting_service.sort_comments(comments, CommentsQuery(sort=CommentSort.rating, mode=SortMode.desc))
+        self.assertEqual([comment["id"] for comment in comments], ["3", "2", "1"])
+        sorting_service.sort_comments(comments, CommentsQuery(sort=CommentSort.upvotes, mode=SortMode.asc))
+        self.assertEqual([comment["id"] for comment in comments], ["2", "1", "3"])
+
+    def test_document_round_trip(self):
+        comment = self.service._identify_comment(Comment(username="tester", rating=4, content="Great book"))
+        document = self.service._entry_as_document(comment)
+        self.assertIsNone(document["parent_id"])
+        self.assertEqual(document["upvote_count"], 0)
+
+        entry = self.service._document_as_entry(document)
+        self.assertEqual(entry["id"], comment.id)
+        self.assertEqual(entry["rating"], 4)
+        self.assertEqual(entry["attached_responses"], [])
+        self.assertIsInstance(entry["created_at"], str)
+
+        reply = self.service._identify_reply(Reply(username="tester", content="Agreed", parent_id=comment.id))
+        reply_entry = self.service._document_as_entry(self.service._entry_as_document(reply))
+        self.assertEqual(reply_entry["parent_id"], comment.id)
+        self.assertNotIn("attached_responses", reply_entry)
+
+    def test_migration(self):
+        comment_id = str(ObjectId())
+        book = {
+            "md5": "TEST3030303030303030303030303030",
+            "comments": [{
+                "id": comment_id, "username": "tester", "rating": 5, "content": "teste",
+                "upvotes": ["a", "b"], "created_at": "2022-11-02T10:30:15Z", "modified_at": None,
+                "attached_responses": [{"id": str(ObjectId()), "username": "b", "content": "reply",
+                                        "parent_id": comment_id, "upvotes": [], "created_at": None}],
+            }],
+        }
+        comment_document, reply_document = book_as_documents(book)
+        self.assertEqual(str(comment_document["_id"]), comment_id)
+        self.assertEqual(comment_document["upvote_count"], 2)
+        self.assertEqual(comment_document["created_at"], datetime(2022, 11, 2, 10, 30, 15))
+        self.assertEqual(reply_document["parent_id"], comment_id)
+        self.assertEqual(reply_document["created_at"], datetime(2000, 1, 1))
+
+    def test_stats(self):
+        stats = document_as_stats(self.service.md5, {"_id": self.service.md5, "comment_count": 3, "reply_count": 1,
+                                                     "rating_sum": 11, "rating_count": 3,
+                                                     "last_activity": datetime(2022, 11, 2, 10, 30, 15, 123000)})
+        self.assertEqual(stats.average_rating, 3.67)
+        self.assertEqual(stats.last_activity, "2022-11-02T10:30:15Z")
+
+        empty_stats = document_as_stats(self.service.md5, None)
+        self.assertEqual((empty_stats.comment_count, empty_stats.average_rating), (0, None))
+
+    def test_fingerprint(self):
+        comment = self.service._identify_comment(Comment(username="tester", rating=4, content="Great book"))
+        same_comment = self.service._identify_comment(Comment(username="tester", rating=4, content="Great book"))
+        other_rating = self.service._identify_comment(Comment(username="tester", rating=5, content="Great book"))
+        fingerprint = self.service._entry_as_document(comment)["fingerprint"]
+        self.assertEqual(fingerprint, self.service._entry_as_document(same_comment)["fingerprint"])
+        self.assertNotEqual(fingerprint, self.service._entry_as_document(other_rating)["fingerprint"])
+
+        reply = self.service._identify_reply(Reply(username="tester", content="Great book", parent_id=comment.id))
+        self.assertNotEqual(fingerprint, self.service._entry_as_document(reply)["fingerprint"])
+
+    def test_migration_keeps_duplicates_without_fingerprint(self):
+        comment = {"username": "tester", "rating": 5, "content": "teste", "upvotes": []}
+        book = {"md5": "TEST3030303030303030303030303030",
+                "comments": [dict(comment, id=str(ObjectId())), dict(comment, id=str(ObjectId()))]}
+        first_document, second_document = book_as_documents(book)
+        self.assertIn("fingerprint", first_document)
+        self.assertNotIn("fingerprint", second_document)
+
+    def test_migration_ids_are_stable(self):
+        comment = {"username": "tester", "rating": 5, "content": "teste", "created_at": "2022-11-02T10:30:15Z",
+                   "attached_responses": [{"id": None, "username": "b", "content": "reply"}]}
+        book = {"md5": "TEST3030303030303030303030303030", "comments": [dict(comment, id="invalid"), comment]}
+        documents = book_as_documents(book)
+        # Running the migration again replaces these entries, instead of copying them again.
+        self.assertEqual([document["_id"] for document in book_as_documents(book)],
+                         [document["_id"] for document in documents])
+        self.assertEqual(len({document["_id"] for document in documents}), 4)
+
+
+class RecordingCollection:
+    """
+    Records the writes made to it, and answers them as if "matched" entries existed.
+    The first "conflicts" conditional updates miss, as if the entry had been edited concurrently.
+    """
+
+    def __init__(self, matched: int = 1, previous_rating: int | None = None, duplicated: bool = False,
+                 conflicts: int = 0):
+        self.matched = matched
+        self.previous_rating = previous_rating
+        self.duplicated = duplicated
+        self.conflicts = conflicts
+        self.calls = []
+
+    async def update_one(self, filters: dict, update: dict):
+        self.calls.append(("update_one", filters, update))
+        return SimpleNamespace(matched_count=self.matched, modified_count=self.matched)
+
+    async def find_one_and_update(self, filters: dict, update: dict, projection=None):
+        self.calls.append(("find_one_and_update", filters, update))
+        if self.duplicated and "fingerprint" in update.get("$set", {}):
+            raise DuplicateKeyError("E11000 duplicate key error")
+        if not self.matched:
+            return None
+        if self.conflicts:
+            self.conflicts -= 1
+            return None
+        return {"_id": filters["_id"], "rating": self.previous_rating}
+
+    async def find_one(self, filters: dict, projection=None):
+        self.calls.append(("find_one", filters, projection))
+        if not self.matched:
+            return None
+        return {"_id": filters["_id"], "content": "Original", "rating": self.previous_rating}
+
+    @property
+    def reads(self) -> list[tuple]:
+        return [call for call in self.calls if call[0] == "find_one"]
+
+    @property
+    def writes(self) -> list[tuple]:
+        return [call for call in self.calls if call[0] != "find_one"]
+
+
+@patch.object(CommentsService, "notify_write", new_callable=AsyncMock)
+@patch("services.social.comments_service.update_comment_stats", new_callable=AsyncMock)
+class TestCommentUpdates(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.service = CommentsService("TEST3030303030303030303030303030")
+        self.comment_id = str(ObjectId())
+
+    async def test_update_comment_is_a_single_write(self, update_stats: AsyncMock, notify_write: AsyncMock):
+        self.service.db_connection = RecordingCollection(previous_rating=4)
+        await self.service.update_comment(CommentUpdateRequest(username="tester", id=self.comment_id,
+                                                               updated_content="Edited", updated_rating=5))
+
+        self.assertEqual(self.service.db_connection.reads, [])
+        (call, filters, update), = self.service.db_connection.writes
+        self.assertEqual(call, "find_one_and_update")
+        self.assertEqual(filters, {"_id": ObjectId(self.comment_id), "md5": self.service.md5, "parent_id": None,
+                                   "username": "tester"})
+        self.assertEqual(set(update["$set"]), {"content", "rating", "modified_at", "fingerprint"})
+        # The fingerprint matches a new comment with the same content, so duplicates of it are still rejected.
+        self.assertEqual(update["$set"]["fingerprint"], entry_fingerprint("tester", "Edited", 5, None))
+        update_stats.assert_awaited_once_with(self.service.md5, rating_sum=1, rating_count=0)
+        notify_write.assert_awaited_once()
+
+    async def test_partial_updates_read_the_missing_field(self, update_stats: AsyncMock, notify_write: AsyncMock):
+        self.service.db_connection = RecordingCollection(previous_rating=4)
+        await self.service.update_comment(CommentUpdateRequest(username="tester", id=self.comment_id,
+                                                               updated_content="Edited"))
+
+        (_, _, projection), = self.service.db_connection.reads
+        self.assertEqual(projection, {"rating": 1})
+        (call, filters, update), = self.service.db_connection.writes
+        # The write only applies if the rating wasn't changed since it was read.
+        self.assertEqual(filters["rating"], 4)
+        self.assertEqual(update["$set"]["fingerprint"], entry_fingerprint("tester", "Edited", 4, None))
+
+    async def test_concurrent_edits_are_retried(self, update_stats: AsyncMock, notify_write: AsyncMock):
+        self.service.db_connection = RecordingCollection(previous_rating=4, conflicts=1)
+        await self.service.update_comment(CommentUpdateRequest(username="tester", id=self.comment_id,
+                                                               updated_rating=5))
+        self.assertEqual(len(self.service.db_connection.reads), 2)
+        self.assertEqual(len(self.service.db_connection.writes), 2)
+        notify_write.assert_awaited_once()
+
+        notify_write.reset_mock()
+        self.service.db_connection = RecordingCollection(conflicts=CommentsService.update_attempts)
+        with self.assertRaises(HTTPException) as context:
+            await self.service.update_comment(CommentUpdateRequest(username="tester", id=self.comment_id,
+                                                                   updated_rating=5))
+        self.assertEqual(context.exception.status_code, 409)
+        self.assertEqual(len(self.service.db_connection.writes), CommentsService.update_attempts)
+        notify_write.assert_not_awaited()
+
+    async def test_edits_into_duplicates_are_kept(self, update_stats: AsyncMock, notify_write: AsyncMock):
+        self.service.db_connection = RecordingCollection(duplicated=True)
+        await self.service.update_reply(ReplyUpdateRequest(username="tester", id=str(ObjectId()),
+                                                           parent_id=self.comment_id, updated_content="Edited"))
+
+        self.assertEqual(self.service.db_connection.reads, [])
+        duplicated_write, kept_write = self.service.db_connection.writes
+        self.assertIn("fingerprint", duplicated_write[2]["$set"])
+        self.assertEqual(kept_write[2]["$unset"], {"fingerprint": ""})
+        notify_write.assert_awaited_once()
+
+    async def test_update_missing_entries(self, update_stats: AsyncMock, notify_write: AsyncMock):
+        self.service.db_connection = RecordingCollection(matched=0)
+        with self.assertRaises(HTTPException):
+            await self.service.update_comment(CommentUpdateRequest(username="tester", id=self.comment_id,
+                                                                   updated_rating=3))
+
+        with self.assertRaises(HTTPException) as context:
+            await self.service.update_reply(ReplyUpdateRequest(username="tester", id=str(ObjectId()),
+                                                               parent_id=self.comment_id, updated_content="Edited"))
+        self.assertEqual(context.exception.detail, "No comments match the given target id.")
+        notify_write.assert_not_awaited()
+        update_stats.assert_not_awaited()
+
+    async def test_rating_changes_update_stats(self, update_stats: AsyncMock, notify_write: AsyncMock):
+        self.service.db_connection = RecordingCollection(previous_rating=2)
+        await self.service.update_comment(CommentUpdateRequest(username="tester", id=self.comment_id,
+                                                               updated_rating=5))
+        update_stats.assert_awaited_once_with(self.service.md5, rating_sum=3, rating_count=0)
+
+        # Comments without rating start being counted.
+        update_stats.reset_mock()
+        self.service.db_connection = RecordingCollection(previous_rating=None)
+        await self.service.update_comment(CommentUpdateRequest(username="tester", id=self.comment_id,
+                                                               updated_rating=4))
+        update_stats.assert_awaited_once_with(self.service.md5, rating_sum=4, rating_count=1)
+
+    async def test_upvote_is_a_single_conditional_write(self, update_stats: AsyncMock, notify_write: AsyncMock):
+        upvotes_service = UpvotesService(self.service.md5)
+        upvotes_service._db_connection = RecordingCollection()
+        await upvotes_service.add_comment_upvote(CommentUpvoteRequest(username="tester", id=self.comment_id))
+
+        (call, filters, update), = upvotes_service._db_connection.calls
+        self.assertEqual(filters["upvotes"], {"$ne": "tester"})
+        self.assertEqual(update, {"$addToSet": {"upvotes": "tester"}, "$inc": {"upvote_count": 1}})
+        notify_write.assert_awaited_once_with("upvote_added", self.comment_id, None, username="tester")
+
+    async def test_upvote_of_missing_comment(self, update_stats: AsyncMock, notify_write: AsyncMock):
+        upvotes_service = UpvotesService(self.service.md5)
+        upvotes_service._db_connection = upvotes_service._comments_service.db_connection = RecordingCollection(0)
+        with self.assertRaises(HTTPException) as context:
+            await upvotes_service.remove_comment_upvote(CommentUpvoteRequest(username="tester", id=self.comment_id))
+        self.assertEqual(context.exception.detail, "Comment doesn't exist on this specific MD5.")
+
+
+class UnsortableCursor:
+    """
+    Fails to sort, like MongoDB does when a sort exceeds it's memory limit.
+    """
+
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    def sort(self, *args):
+        raise OperationFailure("Sort exceeded memory limit.")
+
+    async def to_list(self, length):
+        return list(self.documents)
+
+
+class UnsortableCollection:
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    def find(self, filters: dict):
+        parent_ids = filters["parent_id"]["$in"] if filters["parent_id"] is not None else [None]
+        return UnsortableCursor([document for document in self.documents if document["parent_id"] in parent_ids])
+
+
+class TestSortingFallback(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.service = CommentsService("TEST3030303030303030303030303030")
+        self.service.cache = AsyncMock()
+        self.service.cache.get_page.return_value = (0, None)
+        comments = [self.document(rating=rating) for rating in (5, None, 3)]
+        replies = [self.document(parent_id=str(comments[0]["_id"])) for _ in range(2)]
+        self.service.db_connection = UnsortableCollection(comments + replies)
+
+    @staticmethod
+    def document(rating: int | None = None, parent_id: str | None = None) -> dict:
+        return {"_id": ObjectId(), "md5": "TEST3030303030303030303030303030", "parent_id": parent_id,
+                "username": "tester", "content": "teste", "rating": rating, "upvotes": [],
+                "created_at": datetime(2022, 11, 2), "modified_at": None}
+
+    async def test_pages_are_kept(self):
+        query = CommentsQuery(sort=CommentSort.rating, mode=SortMode.desc, limit=2)
+        comments, next_cursor = await self.service.get_comments_page(query)
+        self.assertEqual([comment["rating"] for comment in comments], [5, 3])
+        self.assertEqual(len(comments[0]["attached_responses"]), 2)
+        self.assertIsNotNone(next_cursor)
+
+        query.cursor = next_cursor
+        comments, next_cursor = await self.service.get_comments_page(query)
+        self.assertEqual([comment["rating"] for comment in comments], [None])
+        self.assertIsNone(next_cursor)
+
+    async def test_possible_comments_are_sorted_in_python(self):
+        comments = await self.service.get_possible_comments()
+        self.assertEqual(len(comments), 3)
+        replies = comments[0]["attached_responses"]
+        self.assertEqual([reply["id"] for reply in replies], sorted(reply["id"] for reply in replies))
@@ -0,0 +1,78 @@
+import json
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+from services.social.comment_events import CommentEventHub, publish_comment_event
+
+test_md5 = "TEST3030303030303030303030303030"
+
+
+class TestCommentEvents(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.hub = CommentEventHub(max_subscriptions=2, max_queued=2)
+        self.connected = True
+
+    async def is_disconnected(self) -> bool:
+        return not self.connected
+
+    def event(self, event_type: str, md5: str = test_md5) -> dict:
+        return {"type": event_type, "md5": md5, "id": "1", "parent_id": None}
+
+    async def test_events_reach_the_md5_subscriptions(self):
+        subscription = self.hub.subscribe(test_md5)
+        other_subscription = self.hub.subscribe("OTHER030303030303030303030303030")
+        self.hub._handle_message({"type": "pmessage", "data": json.dumps(self.event("comment_added"))})
+
+        self.assertEqual(await subscription.next_event(1), self.event("comment_added"))
+        self.assertIsNone(await other_subscription.next_event(0.01))
+
+    async def test_subscriptions_are_limited(self):
+        self.assertIsNotNone(self.hub.subscribe(test_md5))
+        subscription = self.hub.subscribe(test_md5)
+        self.assertIsNone(self.hub.subscribe(test_md5))
+
+        with self.assertRaises(HTTPException) as context:
+            self.hub.raise_if_full()
+        self.assertEqual(context.exception.status_code, 503)
+
+        self.hub.unsubscribe(subscription)
+        self.assertIsNotNone(self.hub.subscribe(test_md5))
+
+    async def test_md5s_are_normalized(self):
+        subscription = self.hub.subscribe(test_md5.lower())
+        with patch("services.social.comment_events.RedisConnection") as redis_connection:
+            publish = redis_connection.return_value.__aenter__.return_value.publish
+            await publish_comment_event(f" {test_md5.lower()}", "comment_added", "1")
+        channel, message = publish.await_args.args
+        self.assertEqual(channel, f"comment-events:{test_md5}")
+
+        self.hub._handle_message({"type": "pmessage", "data": message})
+        self.assertEqual(await subscription.next_event(1), self.event("comment_added"))
+
+    async def test_stream(self):
+        stream = self.hub.stream(test_md5, self.is_disconnected, keepalive_interval=0.01)
+        # Streams only subscribe once they are started.
+        self.assertEqual(len(self.hub), 0)
+        self.assertEqual(await anext(stream), "retry: 5000\n\n")
+        self.assertEqual(len(self.hub), 1)
+
+        self.hub.dispatch(self.event("reply_added"))
+        self.assertEqual(await anext(stream), f"event: reply_added\ndata: {json.dumps(self.event('reply_added'))}\n\n")
+        self.assertEqual(await anext(stream), ": keepalive\n\n")
+
+        self.connected = False
+        self.assertEqual([chunk async for chunk in stream], [])
+        self.assertEqual(len(self.hub), 0)
+
+    async def test_lagging_subscription_is_asked_to_resync(self):
+        stream = self.hub.stream(test_md5, self.is_disconnected)
+        await anext(stream)
+        subscription, = self.hub.subscriptions[test_md5]
+
+        for _ in range(3):
+            self.hub.dispatch(self.event("upvote_added"))
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual([chunk async for chunk in stream], ["event: resync\ndata: {}\n\n"])
+        self.assertEqual(len(self.hub), 0)
@@ -0,0 +1,39 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from models.query_models import CommentsQuery, CommentSort, SortMode
+from services.cache.comments_cache import CommentsCache
+from tests.redis_fakes import MemoryRedis
+
+
+@patch("services.cache.comments_cache.RedisConnection", MemoryRedis)
+class TestCommentsCache(IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        MemoryRedis.clear()
+        CommentsCache._local_pages.clear()
+        self.cache = CommentsCache("TEST3030303030303030303030303030")
+        self.query = CommentsQuery(sort=CommentSort.upvotes, mode=SortMode.desc, cursor=None, limit=20)
+        self.page = {"results": [{"id": "1", "content": "teste"}], "next_cursor": None}
+
+    async def test_saved_page_is_returned(self):
+        version, cached_page = await self.cache.get_page(self.query)
+        self.assertEqual((version, cached_page), (0, None))
+
+        await self.cache.save_page(version, self.query, self.page)
+        self.assertEqual(await self.cache.get_page(self.query), (0, self.page))
+
+        # Other sortings and pages are cached separately.
+        other_query = CommentsQuery(sort=CommentSort.date, mode=SortMode.desc, cursor=None, limit=20)
+        self.assertIsNone((await self.cache.get_page(other_query))[1])
+
+    async def test_writes_invalidate_every_worker(self):
+        version, _ = await self.cache.get_page(self.query)
+        await self.cache.save_page(version, self.query, self.page)
+
+        # Another worker's write.
+        await CommentsCache(self.cache.md5).invalidate()
+        self.assertEqual(await self.cache.get_page(self.query), (1, None))
+
+    async def test_unknown_version_is_not_saved(self):
+        await self.cache.save_page(None, self.query, self.page)
+        self.assertEqual(MemoryRedis.values, {})